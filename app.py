@@ -1,24 +1,152 @@
 from __future__ import annotations
-from typing import List, Optional
+import json, os, random, threading
+from contextlib import nullcontext
+from typing import List, Literal, Optional
 from fastapi import FastAPI, HTTPException, Query
-from dotenv import load_dotenv, find_dotenv
-load_dotenv(find_dotenv(usecwd=True))
+from fastapi.routing import APIRoute
+from mqth_q.startup import load_env, preload
+load_env()   # before mqth_q.config reads the environment; dotenv only imported if .env exists
 from mqth_q import config
-from mqth_q.db import init_db
+from mqth_q.db import init_db, catalog_version, user_version, reading_snapshot, clear_routes
+from mqth_q.httpcache import ResponseCache, VersionProbe, make_etag, etag_matches, is_any_etag
+from mqth_q import fastjson, profiling, tracing
+from mqth_q.invalidation import INVALIDATION
+from mqth_q.snapshot import SNAPSHOTS, snapshot_info
+from mqth_q.thresholds import reload_thresholds
 from mqth_q.service import (
-    next_questions_for, get_question_card, submit_answer,
-    get_user_summary, get_recent_attempts, list_topics, pick_random_by_topic
+    next_questions_for, get_question_card, submit_answer, submit_answer_stream, submit_answers,
+    get_user_summary, get_recent_attempts, list_topics, pick_random_by_topic,
+    search_questions, recommend_ids, question_cards, exercise_stats, list_exercise_stats
     )
 from pydantic import BaseModel, Field
 
 app = FastAPI(title="Math Trainer API", version="0.2.0")
 
+# ---- Perfilado bajo demanda (mqth_q.profiling); sin PROFILE_TOKEN ni PROFILE_SAMPLE_RATE no se instala ----
+class ProfiledRoute(APIRoute):
+    """Registers the thread that runs the endpoint with the request's sampler."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dependant.call = profiling.wrap_endpoint(self.dependant.call)
+
+if profiling.enabled():
+    app.router.route_class = ProfiledRoute     # must be set before the routes below are declared
+
 # ------------------------------------------ MONITOREO --------------------------------------------
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import (
+    Counter, Gauge, Histogram, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST,
+)
 from starlette.requests import Request
-from starlette.responses import Response
-REQS = Counter("http_requests_total", "HTTP requests", ["method","path","status"])
-LAT  = Histogram("http_request_latency_seconds", "Latency seconds", ["path"])
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from mqth_q.breaker import STATES as BREAKER_STATES
+from mqth_q.grading import LLM_BREAKER
+from mqth_q.router import LLM_ROUTER
+from mqth_q import prompt as llm_prompt
+from mqth_q.warmup import MODEL_WARMER
+from mqth_q.admission import ADMISSION, RateLimited
+from mqth_q.near_dup import NEAR_DUPS
+
+# colectores creados por este módulo; importlib.reload(app) reutiliza el namespace del módulo,
+# así que el dict (y los colectores ya registrados en REGISTRY) sobreviven a la recarga
+_COLLECTORS = globals().get("_COLLECTORS", {})
+
+def _metric(cls, name, doc, labels=(), **kw):
+    """Create a collector once per process (the app module may be re-imported, e.g. in tests)."""
+    existing = _COLLECTORS.get(name)
+    if existing is not None:
+        return existing
+    if cls is not Gauge:
+        kw.pop("multiprocess_mode", None)
+    _COLLECTORS[name] = cls(name, doc, list(labels), **kw)
+    return _COLLECTORS[name]
+
+# several workers (python -m mqth_q.serve): every process writes its samples to
+# PROMETHEUS_MULTIPROC_DIR and /metrics aggregates them; gauges say how to combine
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+REQS = _metric(Counter, "http_requests_total", "HTTP requests", ["method","path","status"])
+LAT  = _metric(Histogram, "http_request_latency_seconds", "Latency seconds", ["path"])
+
+# LLM circuit breaker (refreshed on every scrape from LLM_BREAKER.snapshot())
+BRK_STATE   = _metric(Gauge, "llm_breaker_state", "1 for the current breaker state", ["state"],
+                      multiprocess_mode="liveall")
+BRK_TIMEOUT = _metric(Gauge, "llm_breaker_timeout_seconds", "Adaptive LLM timeout", multiprocess_mode="liveall")
+BRK_P95     = _metric(Gauge, "llm_breaker_latency_p95_seconds", "LLM latency p95 over the window",
+                      multiprocess_mode="liveall")
+BRK_ERRORS  = _metric(Gauge, "llm_breaker_error_rate", "LLM error rate over the window", multiprocess_mode="liveall")
+BRK_REJECT  = _metric(Gauge, "llm_breaker_rejected", "Calls short-circuited to baseline", multiprocess_mode="livesum")
+BRK_TRANS   = _metric(Gauge, "llm_breaker_transitions", "State transitions since start", ["transition"],
+                      multiprocess_mode="livesum")
+
+# Ollama pool: latency per backend (observer) + inflight/health gauges (on scrape)
+BE_LAT      = _metric(Histogram, "llm_backend_latency_seconds", "LLM latency per backend", ["backend", "outcome"])
+BE_INFLIGHT = _metric(Gauge, "llm_backend_inflight", "Outstanding requests per backend", ["backend"],
+                      multiprocess_mode="livesum")
+BE_HEALTHY  = _metric(Gauge, "llm_backend_healthy", "1 if the backend is admitted", ["backend"],
+                      multiprocess_mode="livemin")
+
+def _observe_backend(url: str, latency: float, ok: bool):
+    BE_LAT.labels(backend=url, outcome="ok" if ok else "error").observe(latency)
+
+LLM_ROUTER.add_observer(_observe_backend)
+
+# Prompt size (estimated tokens) and how often solutions/answers had to be compacted
+PROMPT_TOKENS    = _metric(Histogram, "llm_prompt_tokens", "Estimated prompt tokens per LLM call",
+                           buckets=(64, 128, 256, 384, 512, 768, 1024, 1536, 2048, 4096))
+PROMPT_COMPACTED = _metric(Counter, "llm_prompt_compacted_total", "Prompts trimmed to fit num_ctx")
+
+def _observe_prompt(tokens: int, compacted: bool):
+    PROMPT_TOKENS.observe(tokens)
+    if compacted:
+        PROMPT_COMPACTED.inc()
+
+llm_prompt.add_observer(_observe_prompt)
+
+# Admission control: decisions (admitted / shed / rate limited), queue wait, queue depth
+ADM_EVENTS   = _metric(Counter, "admission_events_total", "LLM admission decisions", ["event"])
+ADM_WAIT     = _metric(Histogram, "admission_wait_seconds", "Time queued for an LLM slot",
+                       buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30))
+ADM_INFLIGHT = _metric(Gauge, "admission_inflight", "LLM slots in use", multiprocess_mode="livesum")
+ADM_QUEUED   = _metric(Gauge, "admission_queued", "Requests waiting for an LLM slot", multiprocess_mode="livesum")
+ADM_USERS    = _metric(Gauge, "admission_users_waiting", "Distinct users in the wait queue",
+                       multiprocess_mode="livesum")
+
+def _observe_admission(event: str, username: str, waited: float):
+    ADM_EVENTS.labels(event=event).inc()
+    if waited:
+        ADM_WAIT.observe(waited)
+
+ADMISSION.add_observer(_observe_admission)
+
+# Near-duplicate answers: lookups by outcome (exact / near = LLM verdict reused, miss = graded)
+NEAR_DUP_LOOKUPS = _metric(Counter, "near_dup_lookups_total", "Near-duplicate answer lookups", ["outcome"])
+
+def _observe_near_dup(outcome: str):
+    NEAR_DUP_LOOKUPS.labels(outcome=outcome).inc()
+
+NEAR_DUPS.add_observer(_observe_near_dup)
+
+def _export_admission():
+    snap = ADMISSION.snapshot()
+    ADM_INFLIGHT.set(snap["inflight"])
+    ADM_QUEUED.set(snap["queued"])
+    ADM_USERS.set(snap["users_waiting"])
+
+def _export_backends():
+    for b in LLM_ROUTER.snapshot():
+        BE_INFLIGHT.labels(backend=b["url"]).set(b["inflight"])
+        BE_HEALTHY.labels(backend=b["url"]).set(1 if b["healthy"] and b["breaker"] != "open" else 0)
+
+def _export_breaker():
+    snap = LLM_BREAKER.snapshot()
+    for st in BREAKER_STATES:
+        BRK_STATE.labels(state=st).set(1 if snap["state"] == st else 0)
+    BRK_TIMEOUT.set(snap["timeout"])
+    BRK_P95.set(snap["p95"] or 0.0)
+    BRK_ERRORS.set(snap["error_rate"])
+    BRK_REJECT.set(snap["rejected"])
+    for tr, n in snap["transitions"].items():
+        BRK_TRANS.labels(transition=tr).set(n)
 
 @app.middleware("http")
 async def metrics_middleware(request: Request, call_next):
@@ -29,10 +157,87 @@ async def metrics_middleware(request: Request, call_next):
     REQS.labels(method=request.method, path=request.url.path, status=response.status_code).inc()
     return response
 
+async def _until_sent(body, done):
+    """Pass a response body through and call done(exc_type, exc) once it has been sent."""
+    try:
+        async for chunk in body:
+            yield chunk
+    except GeneratorExit:       # client went away mid-stream
+        done(None, None)
+        raise
+    except BaseException as e:
+        done(type(e), e)
+        raise
+    done(None, None)
+
+if tracing.ENABLED:
+    @app.middleware("http")
+    async def trace_middleware(request: Request, call_next):
+        # root span; service/db/grading spans in the endpoint's thread attach to it. It ends when
+        # the body has been sent: a StreamingResponse (/attempts/stream) grades inside its body
+        t = tracing.trace(f"{request.method} {request.url.path}", **{"http.method": request.method,
+                          "http.target": request.url.path})
+        root = t.__enter__()
+        try:
+            response = await call_next(request)
+        except BaseException as e:
+            t.__exit__(type(e), e, e.__traceback__)
+            raise
+        t.detach()
+        root.set(**{"http.status_code": response.status_code})
+        response.headers["X-Trace-Id"] = root.trace_id
+        response.body_iterator = _until_sent(response.body_iterator, t.finish)
+        return response
+
+if profiling.enabled():
+    @app.middleware("http")
+    async def profile_middleware(request: Request, call_next):
+        if not profiling.wanted(request.headers.get("x-profile"), random.random()):
+            return await call_next(request)
+        from starlette.concurrency import run_in_threadpool
+        sampler = profiling.Sampler(f"{request.method} {request.url.path}").start()
+        token = profiling.CURRENT.set(sampler)      # copied into the endpoint's task / thread
+        try:
+            response = await call_next(request)
+        except BaseException:
+            sampler.stop()
+            raise
+        finally:
+            profiling.CURRENT.reset(token)
+        response.headers["X-Profile"] = sampler.stem
+
+        async def _body(body):
+            # stop once the body is sent: streamed bodies (SSE grading) are part of the profile
+            async for chunk in _until_sent(body, lambda *exc: sampler.stop()):
+                yield chunk
+            await run_in_threadpool(sampler.write)
+        response.body_iterator = _body(response.body_iterator)
+        return response
+
 @app.get("/metrics")
 def metrics():
+    _export_breaker()
+    _export_backends()
+    _export_admission()
+    if MULTIPROCESS:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
     return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
+_METRICS_STOP = threading.Event()
+
+def _export_loop():
+    # multiprocess: a scrape reaches one worker, so each worker refreshes its own gauges
+    while not _METRICS_STOP.wait(config.METRICS_REFRESH):
+        try:
+            _export_breaker()
+            _export_backends()
+            _export_admission()
+        except Exception:
+            pass
+
 #from metrics import instrument_app, record_attempt, track_llm_latency, track_baseline_latency
 #instrument_app(app)
 # --------------------------------------------------------------------------------------------------
@@ -45,6 +250,31 @@ class QuestionCard(BaseModel):
     date: Optional[str] = None
     exam_type: Optional[str] = None
 
+class SearchHit(BaseModel):
+    exercise_id: str
+    topic: Optional[str] = None
+    date: Optional[str] = None
+    exam_type: Optional[str] = None
+    snippet: str = ""
+    rank: float
+
+class ExerciseStats(BaseModel):
+    exercise_id: str
+    topic: Optional[str] = None
+    attempts: int
+    users: int
+    first_try_correct_rate: Optional[float] = None
+    mean_score: Optional[float] = None
+    score_var: Optional[float] = None
+    discrimination: Optional[float] = None
+
+class SearchOut(BaseModel):
+    query: str
+    total: int
+    limit: int
+    offset: int
+    items: List[SearchHit]
+
 class AttemptsIn(BaseModel):
     username: str = Field(..., min_length=1)
     exercise_id: str = Field(..., min_length=1)
@@ -59,62 +289,287 @@ class AttemptsOut(BaseModel):
     reasons: str = ""
     hint: str = ""
 
+class BatchItem(BaseModel):
+    exercise_id: str = Field(..., min_length=1)
+    answer: str = Field(..., min_length=1)
+
+class AttemptsBatchIn(BaseModel):
+    username: str = Field(..., min_length=1)
+    items: List[BatchItem] = Field(..., min_length=1, max_length=config.BATCH_MAX_ITEMS)
+
+class AttemptsBatchOut(BaseModel):
+    items: List[AttemptsOut]
+    n_correct: int
+    avg_score: float
+
 # ---- Lifecycle ----
+_STATE = {"db_ready": False}
+
 @app.on_event("startup")
 def _startup():
     init_db()
+    reload_thresholds()    # calibrated baseline thresholds (global + per topic) into memory
+    _STATE["db_ready"] = True
+    LLM_ROUTER.start_health_checks()
+    MODEL_WARMER.start()   # background: load OLLAMA_MODEL + periodic keep-warm
+    INVALIDATION.start()   # polls SQLite data_version; keeps per-worker caches coherent
+    SNAPSHOTS.start()      # analytics replica refresh (only if SNAPSHOT_INTERVAL > 0)
+    if MULTIPROCESS:
+        threading.Thread(target=_export_loop, name="metrics-export", daemon=True).start()
+    if config.PRELOAD_HEAVY:
+        # numpy/sklearn are imported lazily; load them off the request path
+        threading.Thread(target=preload, name="preload", daemon=True).start()
     print("CONFIG:", config.explain())
 
+@app.on_event("shutdown")
+def _shutdown():
+    MODEL_WARMER.stop()
+    LLM_ROUTER.stop_health_checks()
+    INVALIDATION.stop()
+    SNAPSHOTS.stop()
+    _METRICS_STOP.set()
+    if MULTIPROCESS:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(os.getpid())   # drop this worker's live gauges
+
 # ---- Health ----
+# /health and /health/live = liveness (process up); /health/ready = safe to route traffic
+def _readiness():
+    warm = MODEL_WARMER.snapshot()
+    return {"ready": _STATE["db_ready"] and warm["ready"], "db": _STATE["db_ready"], "model": warm}
+
 @app.get("/health")
 def health():
-    return {"ok": True, "model": config.OLLAMA_MODEL, "db": config.DB_PATH}
+    return {"ok": True, "model": config.OLLAMA_MODEL, "db": config.DB_PATH,
+            "ready": _readiness()["ready"],
+            "llm_breaker": LLM_BREAKER.snapshot(), "llm_backends": LLM_ROUTER.snapshot(),
+            "http_cache": RESPONSE_CACHE.snapshot(), "card_cache": CARD_CACHE.snapshot(),
+            "invalidation": INVALIDATION.snapshot(), "admission": ADMISSION.snapshot(),
+            "snapshot": SNAPSHOTS.snapshot(), "pid": os.getpid()}
+
+@app.get("/health/live")
+def health_live():
+    return {"ok": True}
+
+@app.get("/health/ready")
+def health_ready():
+    r = _readiness()
+    return JSONResponse(r, status_code=200 if r["ready"] else 503)
+
+# ---- HTTP caching (ETag / 304) for catalog + per-user summary ----
+RESPONSE_CACHE = ResponseCache()
+CATALOG_VERSION = VersionProbe(catalog_version)   # re-read from SQLite at most every few seconds
+CATALOG_CACHE_CONTROL = f"public, max-age={config.HTTP_CACHE_MAX_AGE}"
+USER_CACHE_CONTROL = "private, no-cache"           # always revalidate; 304 while no new attempts
+
+def _encode(data) -> bytes:
+    return fastjson.dumps(data)
+
+# ---- FAST_JSON: trusted service output goes straight to orjson (no response_model pass) ----
+CARD_CACHE = fastjson.CardCache()
+
+# other processes (API workers, ingest/topics/grade_eval CLIs) changed the DB -> drop local state
+def _on_catalog_change(gen: int):
+    CATALOG_VERSION.invalidate()   # NEAR_DUPS rebuilds an exercise itself when its solution changes
+
+def _on_thresholds_change(gen: int):
+    reload_thresholds()
+
+def _on_shards_change(gen: int):
+    clear_routes()      # a user was moved to another shard (python -m mqth_q.shards)
+    NEAR_DUPS.clear()   # its attempts got new ids on the destination shard
+
+INVALIDATION.subscribe("catalog", _on_catalog_change)
+INVALIDATION.subscribe("thresholds", _on_thresholds_change)
+INVALIDATION.subscribe("shards", _on_shards_change)
+
+def _fast(data) -> Response:
+    # what ORJSONResponse does, without depending on it (deprecated in newer FastAPI)
+    return Response(fastjson.dumps(data), media_type="application/json")
+
+def _cached(request: Request, key: str, version, build, cache_control: str) -> Response:
+    """
+    Serve `build()` as JSON with a strong ETag for (key, version). Matching If-None-Match -> 304;
+    otherwise encoded bytes are reused while the version is unchanged. `*` -> 304 only once the
+    body exists (build() raising, e.g. an unknown id, keeps its error).
+    """
+    if version is None:    # no version table (schema not initialized): plain response
+        return Response(_encode(build()), media_type="application/json")
+    etag = make_etag(key, version)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if_none_match = request.headers.get("if-none-match")
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    body = RESPONSE_CACHE.get(key, etag)
+    if body is None:
+        body = _encode(build())
+        RESPONSE_CACHE.put(key, etag, body)
+    if is_any_etag(if_none_match):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 # ---- Existing practice endpoints ----
 @app.get("/questions/next", response_model=List[QuestionCard])
 def api_next_questions(username: str, k: int = config.RECS_K):
     try:
+        if config.FAST_JSON:
+            body = CARD_CACHE.get_many(recommend_ids(username, k=k), CATALOG_VERSION(), question_cards)
+            return Response(body, media_type="application/json")
         return next_questions_for(username, k=k)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# declared before /questions/{exercise_id} so "search" is not taken as an id
+@app.get("/questions/search", response_model=SearchOut)
+def api_search_questions(q: str = Query(..., min_length=1), topic: Optional[str] = None,
+                         unseen_for: Optional[str] = None,
+                         limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0)):
+    """Full-text search (BM25) over question, solution and topic; `unseen_for` = username."""
+    try:
+        res = search_questions(q, topic=topic, unseen_for=unseen_for, limit=limit, offset=offset)
+        return _fast(res) if config.FAST_JSON else res
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/questions/{exercise_id}", response_model=QuestionCard)
-def api_get_question(exercise_id: str):
+def api_get_question(exercise_id: str, request: Request):
+    try:
+        return _cached(request, f"question:{exercise_id}", CATALOG_VERSION(),
+                       lambda: QuestionCard(**get_question_card(exercise_id)).model_dump(),
+                       CATALOG_CACHE_CONTROL)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ---- Reporting consistency: live DB or the read-only analytics snapshot ----
+Consistency = Literal["live", "snapshot"]
+
+def _reading(consistency: str):
+    """(context manager, snapshot info or None); 503 when a snapshot is asked for but none exists."""
+    if consistency != "snapshot":
+        return nullcontext(), None
+    info = snapshot_info()
+    if info is None:
+        raise HTTPException(status_code=503, detail="No analytics snapshot yet.", headers={"Retry-After": "60"})
+    return reading_snapshot(info["path"]), info
+
+# cohort difficulty (exercise_stats is maintained on every saved attempt)
+@app.get("/exercises/stats", response_model=List[ExerciseStats])
+def api_exercises_stats(topic: Optional[str] = None, min_attempts: int = Query(0, ge=0),
+                        consistency: Consistency = "live"):
+    reading, _ = _reading(consistency)
+    try:
+        with reading:
+            rows = list_exercise_stats(topic=topic, min_attempts=min_attempts)
+        return _fast(rows) if config.FAST_JSON else rows
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/exercises/{exercise_id}/stats", response_model=ExerciseStats)
+def api_exercise_stats(exercise_id: str, consistency: Consistency = "live"):
+    reading, _ = _reading(consistency)
     try:
-        return get_question_card(exercise_id)
+        with reading:
+            return exercise_stats(exercise_id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _too_many(e: RateLimited) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e),
+                         headers={"Retry-After": str(max(1, int(e.retry_after + 0.999)))})
+
 @app.post("/attempts", response_model=AttemptsOut)
 def api_submit_attempt(body: AttemptsIn):
     try:
-        return submit_answer(body.username, body.exercise_id, body.answer)
+        out = submit_answer(body.username, body.exercise_id, body.answer)
+        return _fast(out) if config.FAST_JSON else out
+    except RateLimited as e:
+        raise _too_many(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/attempts/batch", response_model=AttemptsBatchOut)
+def api_submit_attempts_batch(body: AttemptsBatchIn):
+    """A whole exam sheet: items graded concurrently, saved in one transaction, results in order."""
+    try:
+        out = submit_answers(body.username, [(it.exercise_id, it.answer) for it in body.items])
+        return _fast(out) if config.FAST_JSON else out
+    except RateLimited as e:
+        raise _too_many(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/attempts/stream")
+def api_submit_attempt_stream(body: AttemptsIn):
+    """
+    Server-Sent Events: `token` events with partial LLM output, then one `result` event
+    (same shape as POST /attempts) once the attempt is saved.
+    """
+    try:
+        events = submit_answer_stream(body.username, body.exercise_id, body.answer)
+    except RateLimited as e:
+        raise _too_many(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    def _gen():
+        try:
+            for kind, payload in events:
+                yield _sse(kind, payload)
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(profiling.sampled(_gen()), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # ---- NEW: Dashboard endpoints ----
 @app.get("/users/{username}/summary")
-def api_user_summary(username: str):
+def api_user_summary(username: str, request: Request, consistency: Consistency = "live"):
+    _, snap = _reading(consistency)
     try:
-        return get_user_summary(username)
+        if snap is not None:    # a snapshot never changes: its timestamp is the version
+            def build():
+                with reading_snapshot(snap["path"]):
+                    return get_user_summary(username)
+            return _cached(request, f"summary:{username}:snapshot", f"snapshot:{snap['taken_ts']}",
+                           build, USER_CACHE_CONTROL)
+        # topics come from the catalog, so both versions feed the ETag
+        version = CATALOG_VERSION()
+        if version is not None:
+            version = f"{version}:{user_version(username)}"
+        return _cached(request, f"summary:{username}", version,
+                       lambda: get_user_summary(username), USER_CACHE_CONTROL)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/users/{username}/attempts")
-def api_user_attempts(username: str, limit: int = Query(20, ge=1, le=1000)):
+def api_user_attempts(username: str, limit: int = Query(20, ge=1, le=1000), details: bool = False,
+                      consistency: Consistency = "live"):
+    """details=true adds student_answer/reasons/hint, reading archived attempts transparently."""
+    reading, _ = _reading(consistency)
     try:
-        return get_recent_attempts(username, limit=limit)
+        with reading:
+            rows = get_recent_attempts(username, limit=limit, details=details)
+        return _fast(rows) if config.FAST_JSON else rows
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/topics")
-def api_topics():
+def api_topics(request: Request):
     try:
-        return list_topics()
+        return _cached(request, "topics", CATALOG_VERSION(), list_topics, CATALOG_CACHE_CONTROL)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -0,0 +1,210 @@
+# control de admisión para la calificación con LLM
+#   - token bucket por username: ráfagas cortas sí, spam no (-> RateLimited / HTTP 429)
+#   - tope global de llamadas LLM concurrentes por proceso
+#   - cola de espera justa: round-robin entre usuarios (un usuario con 10 envíos no pasa
+#     delante de otro con 1), con espera máxima
+#   - load shedding: cola llena o espera vencida -> se califica con baseline_grade
+#   - observers reciben (evento, username, espera) para métricas; snapshot() para gauges
+
+from __future__ import annotations
+
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Iterator, List
+
+from .config import (
+    ADMISSION_BURST,
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_MAX_WAIT,
+    ADMISSION_RATE,
+)
+
+Observer = Callable[[str, str, float], None]
+
+ADMITTED = "admitted"
+SHED_QUEUE_FULL = "shed_queue_full"
+SHED_TIMEOUT = "shed_timeout"
+RATE_LIMITED = "rate_limited"
+EVENTS = (ADMITTED, SHED_QUEUE_FULL, SHED_TIMEOUT, RATE_LIMITED)
+
+
+class RateLimited(RuntimeError):
+    """The user exceeded their submission rate; retry_after is in seconds."""
+
+    def __init__(self, username: str, retry_after: float):
+        super().__init__(f"Too many submissions from {username}; retry in {retry_after:.0f}s.")
+        self.username = username
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def take(self, now: float, cost: float = 1.0) -> float:
+        """
+        Consume `cost` tokens; returns 0 on success or the seconds until one is available.
+        Any request is allowed once a whole token is there, so a cost above the burst (a big
+        batch) goes through and leaves the bucket in debt: the next one waits for the refill.
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= cost
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Waiter:
+    __slots__ = ("username", "event", "granted")
+
+    def __init__(self, username: str):
+        self.username = username
+        self.event = threading.Event()
+        self.granted = False
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency: int = ADMISSION_MAX_CONCURRENCY,
+                 max_queue: int = ADMISSION_MAX_QUEUE, max_wait: float = ADMISSION_MAX_WAIT,
+                 rate: float = ADMISSION_RATE, burst: float = ADMISSION_BURST,
+                 max_users: int = 10_000, clock: Callable[[], float] = time.monotonic):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_queue = max(0, int(max_queue))
+        self.max_wait = float(max_wait)
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.max_users = max_users
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()   # rotation order = key order
+        self._inflight = 0
+        self._queued = 0
+        self._counts: Dict[str, int] = {e: 0 for e in EVENTS}
+        self._observers: List[Observer] = []
+
+    # ---------------- rate limit ----------------
+    def check_rate(self, username: str, cost: float = 1.0) -> None:
+        """Spend `cost` submission tokens (one per graded answer) for `username` or raise RateLimited."""
+        if self.rate <= 0:
+            return
+        now = self.clock()
+        with self._lock:
+            b = self._buckets.get(username)
+            if b is None:
+                b = self._buckets[username] = TokenBucket(self.rate, self.burst, now)
+                while len(self._buckets) > self.max_users:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(username)
+            wait = b.take(now, cost)
+        if wait:
+            self._emit(RATE_LIMITED, username, 0.0)
+            raise RateLimited(username, wait)
+
+    # ---------------- concurrency + fair queue ----------------
+    def _grant_next(self) -> None:
+        # caller holds the lock; hand the free slot to the next user in rotation
+        while self._queues and self._inflight < self.max_concurrency:
+            user, q = next(iter(self._queues.items()))
+            w = q.popleft()
+            self._queued -= 1
+            if q:
+                self._queues.move_to_end(user)     # user goes to the back of the rotation
+            else:
+                del self._queues[user]
+            w.granted = True
+            self._inflight += 1
+            w.event.set()
+
+    def acquire(self, username: str) -> bool:
+        """
+        Take an LLM slot, waiting fairly up to max_wait. Returns False when the request
+        should be shed to the baseline grader (queue full or wait expired).
+        """
+        t0 = self.clock()
+        with self._lock:
+            if self._inflight < self.max_concurrency and not self._queues:
+                self._inflight += 1
+                granted = True
+            elif self._queued >= self.max_queue:
+                granted = False
+            else:
+                w = _Waiter(username)
+                self._queues.setdefault(username, deque()).append(w)
+                self._queued += 1
+                granted = None
+        if granted is not None:
+            self._emit(ADMITTED if granted else SHED_QUEUE_FULL, username, 0.0)
+            return granted
+
+        w.event.wait(self.max_wait)
+        with self._lock:
+            if not w.granted:
+                q = self._queues.get(username)
+                if q is not None and w in q:
+                    q.remove(w)
+                    self._queued -= 1
+                    if not q:
+                        del self._queues[username]
+        waited = self.clock() - t0
+        self._emit(ADMITTED if w.granted else SHED_TIMEOUT, username, waited)
+        return w.granted
+
+    def release(self) -> None:
+        with self._lock:
+            self._inflight -= 1
+            self._grant_next()
+
+    @contextmanager
+    def slot(self, username: str) -> Iterator[bool]:
+        """Yields True with an LLM slot held, or False if shed (grade with baseline)."""
+        ok = self.acquire(username)
+        try:
+            yield ok
+        finally:
+            if ok:
+                self.release()
+
+    @contextmanager
+    def admit(self, username: str) -> Iterator[bool]:
+        """Rate limit (raises RateLimited) + fair slot; yields whether the LLM may be used."""
+        self.check_rate(username)
+        with self.slot(username) as ok:
+            yield ok
+
+    # ---------------- observability ----------------
+    def add_observer(self, fn: Observer) -> None:
+        """Register fn(event, username, wait_seconds) for every admission decision."""
+        if fn not in self._observers:
+            self._observers.append(fn)
+
+    def _emit(self, event: str, username: str, waited: float) -> None:
+        with self._lock:
+            self._counts[event] += 1
+        for fn in list(self._observers):
+            try:
+                fn(event, username, waited)
+            except Exception:
+                pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "inflight": self._inflight,
+                "max_concurrency": self.max_concurrency,
+                "queued": self._queued,
+                "max_queue": self.max_queue,
+                "users_waiting": len(self._queues),
+                "events": dict(self._counts),
+            }
+
+
+# Un controlador por proceso (con varios workers el tope es por worker)
+ADMISSION = AdmissionController()
@@ -0,0 +1,245 @@
+# archivo en frío de intentos antiguos
+#   - los intentos con ts < corte pasan a ficheros Parquet (zstd), un segmento por mes y lote:
+#       <ARCHIVE_DIR>/YYYY-MM/<primer_id>-<ultimo_id>.parquet
+#   - en la tabla attempts quedan solo ids, ts, score, correct, cosine, jaccard y archive_segment;
+#     el texto (respuesta, reasons, hint, keywords, feedback_json) se pone a NULL
+#   - feedback_json repetía reasons/hint/score...: en el archivo solo se guardan las claves extra
+#     y se reconstruye al leer
+#   - orden seguro: se escribe el fichero (tmp + rename) y DESPUÉS, en una transacción corta,
+#     se registra el segmento y se vacían las filas; un fallo deja como mucho un fichero huérfano
+#   - con DB_SHARDS cada shard tiene su propia tabla attempt_archives y su subcarpeta
+#     <ARCHIVE_DIR>/shard<i>/ (los attempt_id solo son únicos dentro de un shard)
+#   - lectura: fill_archived() completa filas de get_attempts(include_archived=True);
+#     read_archived() devuelve intentos completos para exportaciones / análisis
+#
+# CLI:  python -m mqth_q.archive [--older-than-days N | --before YYYY-MM-DD] [--dry-run] [--vacuum]
+
+from __future__ import annotations
+
+import argparse
+from datetime import datetime, timezone
+import json
+import math
+import os
+from pathlib import Path
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from . import db
+from .config import ARCHIVE_AFTER_DAYS, ARCHIVE_DIR
+
+SEGMENT_ROWS = 50_000
+COLD_COLUMNS = ("missing_keywords", "student_answer", "reasons", "hint", "feedback_json")
+# keys of feedback_json that already live in their own column
+_FEEDBACK_DUP = {"score", "correct", "cosine", "jaccard", "reasons", "hint"}
+
+
+def archive_dir(shard: Optional[int] = None) -> Path:
+    root = Path(ARCHIVE_DIR) if ARCHIVE_DIR else Path(db.DB_PATH).resolve().parent / "archive"
+    return root if shard is None else root / f"shard{shard}"
+
+
+def _schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("attempt_id", pa.int64()), ("user_id", pa.int64()), ("exercise_id", pa.string()),
+        ("ts", pa.float64()), ("score", pa.float64()), ("correct", pa.int8()),
+        ("cosine", pa.float64()), ("jaccard", pa.float64()),
+        ("missing_keywords", pa.string()), ("student_answer", pa.string()),
+        ("reasons", pa.string()), ("hint", pa.string()), ("feedback_extra", pa.string()),
+    ])
+
+
+def _to_record(r: Dict[str, Any]) -> Dict[str, Any]:
+    fb = json.loads(r["feedback_json"]) if r["feedback_json"] else None
+    extra = {k: v for k, v in fb.items() if k not in _FEEDBACK_DUP} if isinstance(fb, dict) else None
+    rec = {k: r[k] for k in ("attempt_id", "user_id", "exercise_id", "ts", "score", "correct",
+                             "cosine", "jaccard", "missing_keywords", "student_answer", "reasons", "hint")}
+    rec["feedback_extra"] = json.dumps(extra) if fb is not None else None
+    return rec
+
+
+def _from_record(rec: Dict[str, Any]) -> Dict[str, Any]:
+    out = dict(rec)
+    extra = out.pop("feedback_extra", None)
+    if extra is not None:
+        fb = json.loads(extra)
+        fb.update({k: out[k] for k in _FEEDBACK_DUP if out.get(k) is not None})
+        if "correct" in fb:
+            fb["correct"] = bool(fb["correct"])
+        out["feedback_json"] = json.dumps(fb)
+    else:
+        out["feedback_json"] = None
+    return out
+
+
+def _write_segment(path: Path, rows: List[Dict[str, Any]]) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table = pa.Table.from_pylist([_to_record(r) for r in rows], schema=_schema())
+    tmp = path.with_suffix(".tmp")
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, path)
+
+
+def _cutoff(before: Optional[str], older_than_days: Optional[float]) -> float:
+    if before:
+        return datetime.strptime(before, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+    days = ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    return time.time() - days * 86400
+
+
+def archive_attempts(before: Optional[str] = None, older_than_days: Optional[float] = None,
+                     dry_run: bool = False, vacuum: bool = False, segment_rows: int = SEGMENT_ROWS,
+                     log=print) -> Dict[str, int]:
+    """Move attempts older than the cutoff to Parquet segments; returns counts."""
+    t0 = time.perf_counter()
+    cutoff = _cutoff(before, older_than_days)
+    db.init_db()
+    stats = {"rows": 0, "segments": 0}
+    for shard in db.user_dbs():
+        _archive_db(shard, cutoff, dry_run, vacuum, segment_rows, stats, log)
+    log(f"{'dry run' if dry_run else 'done'} in {time.perf_counter() - t0:.2f}s: {stats}")
+    return stats
+
+
+def _archive_db(shard: Optional[int], cutoff: float, dry_run: bool, vacuum: bool, segment_rows: int,
+                stats: Dict[str, int], log) -> None:
+    root = archive_dir(shard)
+    rows_before = stats["rows"]
+    con = db.connect(shard)
+    try:
+        counts = con.execute("""
+          SELECT strftime('%Y-%m', ts, 'unixepoch') AS month, COUNT(*) FROM attempts
+          WHERE ts < ? AND archive_segment IS NULL GROUP BY month ORDER BY month
+        """, (cutoff,)).fetchall()
+        if dry_run:
+            for month, n in counts:
+                stats["rows"] += n
+                stats["segments"] += math.ceil(n / segment_rows)
+                log(f"{month}: {n} attempts would be archived")
+            return
+        for month, _ in counts:
+            while True:
+                rows = [dict(r) for r in con.execute("""
+                  SELECT * FROM attempts
+                  WHERE ts < ? AND archive_segment IS NULL AND strftime('%Y-%m', ts, 'unixepoch') = ?
+                  ORDER BY attempt_id LIMIT ?
+                """, (cutoff, month, segment_rows))]
+                if not rows:
+                    break
+                stats["rows"] += len(rows)
+                stats["segments"] += 1
+                rel = f"{month}/{rows[0]['attempt_id']}-{rows[-1]['attempt_id']}.parquet"
+                _write_segment(root / rel, rows)
+                cur = con.cursor()
+                cur.execute("""
+                  INSERT INTO attempt_archives(month, path, n_rows, min_ts, max_ts, created_ts)
+                  VALUES(?,?,?,?,?,?)
+                """, (month, rel, len(rows), min(r["ts"] for r in rows), max(r["ts"] for r in rows), time.time()))
+                seg = cur.lastrowid
+                cur.executemany(f"""
+                  UPDATE attempts SET archive_segment = ?, {", ".join(f"{c} = NULL" for c in COLD_COLUMNS)}
+                  WHERE attempt_id = ? AND archive_segment IS NULL
+                """, [(seg, r["attempt_id"]) for r in rows])
+                con.commit()
+                log(f"{month}: {len(rows)} attempts -> {root / rel}")
+        if stats["rows"] > rows_before:
+            con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            if vacuum:
+                con.execute("VACUUM")     # shrinks the file; needs exclusive access for a while
+    finally:
+        con.close()
+
+
+def _segment_paths(con, segment_ids: Optional[Iterable[int]] = None,
+                   shard: Optional[int] = None) -> Dict[int, Path]:
+    root = archive_dir(shard)
+    if segment_ids is None:
+        rows = con.execute("SELECT segment_id, path FROM attempt_archives").fetchall()
+    else:
+        ids = sorted(set(segment_ids))
+        rows = con.execute(f"SELECT segment_id, path FROM attempt_archives WHERE segment_id IN "
+                           f"({','.join('?' * len(ids))})", ids).fetchall() if ids else []
+    return {int(r[0]): root / r[1] for r in rows}
+
+
+def _read(path: Path, filters=None) -> List[Dict[str, Any]]:
+    import pyarrow.parquet as pq
+    return [_from_record(r) for r in pq.read_table(path, filters=filters).to_pylist()]
+
+
+def fill_archived(rows: List[Dict[str, Any]], user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """In place: restore the cold columns of rows (from get_attempts(user_id)) that were archived."""
+    return fill_from(rows, db.shard_of(user_id) if user_id is not None else None)
+
+
+def fill_from(rows: List[Dict[str, Any]], shard: Optional[int]) -> List[Dict[str, Any]]:
+    """fill_archived() for rows read from a given shard (None: the main DB)."""
+    by_seg: Dict[int, List[Dict[str, Any]]] = {}
+    for r in rows:
+        seg = r.pop("archive_segment", None)
+        if seg is not None:
+            by_seg.setdefault(int(seg), []).append(r)
+    if not by_seg:
+        return rows
+    with db._con(shard) as con:
+        paths = _segment_paths(con, by_seg, shard)
+    for seg, part in by_seg.items():
+        if seg not in paths:
+            continue
+        want = {r["attempt_id"]: r for r in part}
+        for rec in _read(paths[seg], filters=[("attempt_id", "in", list(want))]):
+            r = want[rec["attempt_id"]]
+            for k in COLD_COLUMNS:
+                if k in r:
+                    r[k] = rec[k]
+    return rows
+
+
+def read_archived(user_id: Optional[int] = None, since: Optional[float] = None,
+                  until: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Full archived attempts (all attempts columns), optionally for one user / ts range."""
+    q, args = "SELECT segment_id FROM attempt_archives WHERE 1=1", []
+    if since is not None:
+        q += " AND max_ts >= ?"
+        args.append(since)
+    if until is not None:
+        q += " AND min_ts < ?"
+        args.append(until)
+    filters = [("user_id", "=", user_id)] if user_id is not None else None
+    shards = [db.shard_of(user_id)] if user_id is not None else db.user_dbs()
+    out: List[Dict[str, Any]] = []
+    for shard in shards:
+        with db._con(shard) as con:
+            paths = _segment_paths(con, [r[0] for r in con.execute(q, args)], shard)
+        for seg in sorted(paths):
+            for rec in _read(paths[seg], filters=filters):
+                if user_id is None and shard is not None and db.shard_of(rec["user_id"]) != shard:
+                    continue        # stale copy: the user was moved to another shard since
+                if (since is None or rec["ts"] >= since) and (until is None or rec["ts"] < until):
+                    rec["archive_segment"] = seg
+                    out.append(rec)
+    return out
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m mqth_q.archive",
+                                 description="Move old attempts to compressed Parquet partitions.")
+    when = ap.add_mutually_exclusive_group()
+    when.add_argument("--older-than-days", type=float, default=None,
+                      help=f"Archive attempts older than N days (default ARCHIVE_AFTER_DAYS={ARCHIVE_AFTER_DAYS})")
+    when.add_argument("--before", default=None, help="Archive attempts before this UTC date (YYYY-MM-DD)")
+    ap.add_argument("--dry-run", action="store_true", help="Only count what would be archived")
+    ap.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to shrink the DB file")
+    ap.add_argument("--segment-rows", type=int, default=SEGMENT_ROWS)
+    args = ap.parse_args(argv)
+    archive_attempts(before=args.before, older_than_days=args.older_than_days, dry_run=args.dry_run,
+                     vacuum=args.vacuum, segment_rows=args.segment_rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
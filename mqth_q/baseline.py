@@ -1,13 +1,17 @@
 # src/baseline.py
+# numpy / scikit-learn se importan dentro de las funciones (primer uso), no al importar el
+# módulo: la API y cada worker arrancan sin pagar ~1 s de imports que quizá nunca usen.
 from __future__ import annotations
+
+import math
 import re
-from typing import Dict, List
-import numpy as np
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
 
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from .thresholds import threshold_for
+from .tracing import traced
 
-from .config import GRADE_THRESHOLD
+if TYPE_CHECKING:
+    import numpy as np
 
 # ----------------------
 # Tiny text utilities
@@ -24,6 +28,9 @@ def _tokens(s: str) -> List[str]:
 def _keywords(s: str, min_len: int = 4) -> List[str]:
     return [t for t in _tokens(s) if len(t) >= min_len and t not in STOPWORDS]
 
+def _clip01(x: float) -> float:
+    return float(min(1.0, max(0.0, x)))
+
 def _jaccard(a: List[str], b: List[str]) -> float:
     A, B = set(a), set(b)
     if not A and not B:
@@ -33,15 +40,20 @@ def _jaccard(a: List[str], b: List[str]) -> float:
 # ----------------------
 # Baseline grader (no LLM)
 # ----------------------
-def baseline_grade(solution: str, student: str) -> Dict:
+@traced()
+def baseline_grade(solution: str, student: str, topic: Optional[str] = None) -> Dict:
     """
     Fast, dependency-light baseline:
       - TF-IDF cosine similarity between solution and student answer
       - Token Jaccard overlap
       - Missing keywords = solution keywords not present in student answer
-      - 'correct' if blended score >= GRADE_THRESHOLD
+      - 'correct' if blended score >= threshold_for(topic) (calibrated per topic,
+        falling back to the global calibrated value and then GRADE_THRESHOLD)
     Returns a dict compatible with your DB schema.
     """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+
     sol = solution or ""
     stu = student or ""
 
@@ -54,8 +66,8 @@ def baseline_grade(solution: str, student: str) -> Dict:
     jac = float(_jaccard(_tokens(sol), _tokens(stu)))
 
     # Blend score (simple mean)
-    score = float(np.clip((cos + jac) / 2.0, 0.0, 1.0))
-    correct = bool(score >= GRADE_THRESHOLD)
+    score = _clip01((cos + jac) / 2.0)
+    correct = bool(score >= threshold_for(topic))
 
     # Simple keyword hint
     sol_kw = set(_keywords(sol))
@@ -75,5 +87,67 @@ def baseline_grade(solution: str, student: str) -> Dict:
         "hint": hint,
     }
 
+# ----------------------
+# Batch baseline (vectorized)
+# ----------------------
+# TfidfVectorizer fitted on a single (solution, student) pair only sees df in {1, 2}, so with the
+# default smooth idf a term gets idf=1 if it is in both docs and 1+ln(3/2) otherwise. One
+# CountVectorizer over the whole batch + that rule reproduces baseline_grade's cosine per row.
+_IDF_ONE_SIDED = 1.0 + math.log(1.5)
+
+def baseline_cosine_batch(solutions: Sequence[str], students: Sequence[str]) -> "np.ndarray":
+    """Row-wise pair TF-IDF cosine for many pairs at once (0.0 where either side is empty)."""
+    import numpy as np
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    sols = [s or "" for s in solutions]
+    stus = [s or "" for s in students]
+    n = len(sols)
+    if n == 0:
+        return np.zeros(0)
+    try:
+        counts = CountVectorizer(ngram_range=(1, 2), min_df=1).fit_transform(sols + stus).tocsr()
+    except ValueError:   # empty vocabulary across the whole batch
+        return np.zeros(n)
+    A = counts[:n].astype(np.float64)
+    B = counts[n:].astype(np.float64)
+    both_a = A.multiply(B > 0)           # A's entries for terms shared with B
+    both_b = B.multiply(A > 0)
+    Aw = A * _IDF_ONE_SIDED - both_a * (_IDF_ONE_SIDED - 1.0)
+    Bw = B * _IDF_ONE_SIDED - both_b * (_IDF_ONE_SIDED - 1.0)
+    dot = np.asarray(both_a.multiply(both_b).sum(axis=1)).ravel()   # shared terms weigh 1*1
+    na = np.sqrt(np.asarray(Aw.multiply(Aw).sum(axis=1)).ravel())
+    nb = np.sqrt(np.asarray(Bw.multiply(Bw).sum(axis=1)).ravel())
+    denom = na * nb
+    return np.divide(dot, denom, out=np.zeros(n), where=denom > 0)
+
+@traced()
+def baseline_grade_batch(solutions: Sequence[str], students: Sequence[str],
+                         topics: Optional[Sequence[Optional[str]]] = None) -> List[Dict]:
+    """
+    Same output as [baseline_grade(s, a, t) for s, a, t in zip(...)] but with one vectorizer
+    for the whole batch. Pairs with no tokens at all score 0 instead of raising.
+    """
+    cos = baseline_cosine_batch(solutions, students)
+    topics = topics if topics is not None else [None] * len(cos)
+    out: List[Dict] = []
+    for c, sol, stu, topic in zip(cos, solutions, students, topics):
+        sol = sol or ""
+        stu = stu or ""
+        c = float(c)
+        jac = float(_jaccard(_tokens(sol), _tokens(stu)))
+        score = _clip01((c + jac) / 2.0)
+        missing = sorted(set(_keywords(sol)) - set(_keywords(stu)))[:10]
+        out.append({
+            "score": score,
+            "correct": bool(score >= threshold_for(topic)),
+            "cosine": c,
+            "jaccard": jac,
+            "missing_keywords": missing,
+            "reasons": f"Baseline similarity — cosine={c:.2f}, jaccard={jac:.2f}.",
+            "hint": "Revisa los conceptos clave ausentes: " + ", ".join(missing) if missing else "",
+        })
+    return out
+
 # Optional alias to keep backward compatibility with older imports
 grade_answer = baseline_grade
@@ -0,0 +1,229 @@
+# circuit breaker para dependencias lentas/caídas (Ollama)
+# closed    -> todo pasa, se registran errores y latencias en una ventana
+# open      -> nada pasa (baseline-only) hasta que vence el cooldown
+# half_open -> pasan pocas sondas; éxito = closed, fallo = open otra vez
+# El timeout se adapta al p95 observado en lugar de un valor fijo
+
+from __future__ import annotations
+
+from collections import deque
+from contextlib import contextmanager
+import threading
+import time
+from typing import Callable, Deque, Dict, List, Optional, Tuple, Type
+
+from .config import (
+    LLM_BREAKER_COOLDOWN,
+    LLM_BREAKER_ERROR_RATE,
+    LLM_BREAKER_MIN_CALLS,
+    LLM_BREAKER_PROBES,
+    LLM_BREAKER_SLOW_P95,
+    LLM_BREAKER_WINDOW,
+    LLM_TIMEOUT,
+    LLM_TIMEOUT_MIN,
+    LLM_TIMEOUT_P95_FACTOR,
+)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+STATES = (CLOSED, OPEN, HALF_OPEN)
+
+Listener = Callable[[str, str], None]
+
+
+class BreakerOpen(RuntimeError):
+    """Raised by `CircuitBreaker.guard` when the circuit rejects the call."""
+
+
+def _percentile(xs: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..100) without numpy."""
+    if not xs:
+        return 0.0
+    s = sorted(xs)
+    k = max(0, min(len(s) - 1, int(round(q / 100.0 * (len(s) - 1)))))
+    return float(s[k])
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker with a rolling window of (ok, latency) samples.
+
+    Opens when, with at least `min_calls` samples, the error rate reaches
+    `error_rate` or the latency p95 exceeds `slow_p95` seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = LLM_BREAKER_WINDOW,
+        min_calls: int = LLM_BREAKER_MIN_CALLS,
+        error_rate: float = LLM_BREAKER_ERROR_RATE,
+        slow_p95: float = LLM_BREAKER_SLOW_P95,
+        cooldown: float = LLM_BREAKER_COOLDOWN,
+        probes: int = LLM_BREAKER_PROBES,
+        timeout_min: float = LLM_TIMEOUT_MIN,
+        timeout_max: float = LLM_TIMEOUT,
+        timeout_factor: float = LLM_TIMEOUT_P95_FACTOR,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.min_calls = max(1, int(min_calls))
+        self.error_rate = float(error_rate)
+        self.slow_p95 = float(slow_p95)
+        self.cooldown = float(cooldown)
+        self.probes = max(1, int(probes))
+        self.timeout_min = float(timeout_min)
+        self.timeout_max = float(timeout_max)
+        self.timeout_factor = float(timeout_factor)
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._samples: Deque[Tuple[bool, float]] = deque(maxlen=max(1, int(window)))
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._inflight_probes = 0
+        self._transitions: Dict[Tuple[str, str], int] = {}
+        self._rejected = 0
+        self._listeners: List[Listener] = []
+
+    # ---------------- state machine ----------------
+    def _set_state(self, new: str) -> None:
+        old = self._state
+        if old == new:
+            return
+        self._state = new
+        if new == OPEN:
+            self._opened_at = self._clock()
+        if new != HALF_OPEN:
+            self._inflight_probes = 0
+        if new == CLOSED:
+            self._samples.clear()   # start fresh after recovery
+        self._transitions[(old, new)] = self._transitions.get((old, new), 0) + 1
+        for fn in list(self._listeners):
+            try:
+                fn(old, new)
+            except Exception:
+                pass
+
+    def _should_open(self) -> bool:
+        if len(self._samples) < self.min_calls:
+            return False
+        errors = sum(1 for ok, _ in self._samples if not ok)
+        if errors / len(self._samples) >= self.error_rate:
+            return True
+        return _percentile([lat for _, lat in self._samples], 95) > self.slow_p95
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self) -> None:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.cooldown:
+            self._set_state(HALF_OPEN)
+
+    def allow(self) -> bool:
+        """Ask permission for one call. Every True must be followed by record_*()."""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._inflight_probes < self.probes:
+                self._inflight_probes += 1
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._set_state(CLOSED)
+            self._samples.append((True, float(latency)))
+            if self._state == CLOSED and self._should_open():
+                self._set_state(OPEN)
+
+    def record_failure(self, latency: float) -> None:
+        with self._lock:
+            self._samples.append((False, float(latency)))
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._should_open()):
+                self._set_state(OPEN)
+
+    def cancel(self) -> None:
+        """Give back a permission from allow() without recording an outcome."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._inflight_probes > 0:
+                self._inflight_probes -= 1
+
+    @contextmanager
+    def guard(self, ignore: Tuple[Type[BaseException], ...] = ()):
+        """
+        `with breaker.guard(): ...` — raises BreakerOpen if rejected, records the outcome.
+        Exceptions in `ignore` (e.g. no free backend: load, not an outage) record nothing, and
+        neither does a caller going away (GeneratorExit on a closed stream, KeyboardInterrupt):
+        a truncated call says nothing about the dependency's health or latency.
+        """
+        if not self.allow():
+            raise BreakerOpen(f"circuit '{self.name}' is {self._state}")
+        t0 = time.perf_counter()
+        try:
+            yield
+        except ignore:
+            self.cancel()
+            raise
+        except Exception:
+            self.record_failure(time.perf_counter() - t0)
+            raise
+        except BaseException:
+            self.cancel()
+            raise
+        else:
+            self.record_success(time.perf_counter() - t0)
+
+    # ---------------- adaptive timeout ----------------
+    def latency_p95(self) -> Optional[float]:
+        with self._lock:
+            lats = [lat for ok, lat in self._samples if ok]
+        return _percentile(lats, 95) if lats else None
+
+    def timeout(self) -> float:
+        """p95 * factor clipped to [timeout_min, timeout_max]; max until there is data."""
+        with self._lock:
+            lats = [lat for ok, lat in self._samples if ok]
+        if len(lats) < self.min_calls:
+            return self.timeout_max
+        t = _percentile(lats, 95) * self.timeout_factor
+        return float(min(self.timeout_max, max(self.timeout_min, t)))
+
+    # ---------------- introspection ----------------
+    def add_listener(self, fn: Listener) -> None:
+        """Register fn(old_state, new_state), called on every transition."""
+        with self._lock:
+            if fn not in self._listeners:
+                self._listeners.append(fn)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._set_state(CLOSED)
+            self._samples.clear()
+            self._rejected = 0
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            self._maybe_half_open()
+            n = len(self._samples)
+            errors = sum(1 for ok, _ in self._samples if not ok)
+            lats = [lat for _, lat in self._samples]
+            state = self._state
+            transitions = {f"{a}->{b}": c for (a, b), c in self._transitions.items()}
+            rejected = self._rejected
+        return {
+            "name": self.name,
+            "state": state,
+            "calls": n,
+            "error_rate": round(errors / n, 3) if n else 0.0,
+            "p50": round(_percentile(lats, 50), 3) if lats else None,
+            "p95": round(_percentile(lats, 95), 3) if lats else None,
+            "timeout": round(self.timeout(), 3),
+            "rejected": rejected,
+            "transitions": transitions,
+        }
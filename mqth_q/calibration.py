@@ -0,0 +1,99 @@
+# calibración del umbral de baseline
+#   - curves(): ordena los scores una vez y calcula PR/ROC/F1 para TODOS los umbrales únicos
+#     con sumas acumuladas (sin recalcular predicciones por umbral)
+#   - fit_thresholds(): umbral óptimo global + uno por topic_pred (fallback al global)
+#   - la tabla en memoria que consulta baseline_grade vive en thresholds.py (sin numpy)
+
+from __future__ import annotations
+
+from typing import Dict, Optional
+
+import numpy as np
+
+from .config import CALIBRATION_MIN_ROWS, GRADE_THRESHOLD
+from .thresholds import GLOBAL_KEY, reload_thresholds, threshold_for  # noqa: F401 (re-export)
+
+
+def curves(y_true, scores) -> Dict[str, np.ndarray]:
+    """
+    Metrics for every unique threshold t (predict positive iff score >= t), thresholds
+    descending. One sort + cumulative sums: O(n log n) for the whole curve.
+    """
+    y = np.asarray(y_true, dtype=np.int64)
+    s = np.asarray(scores, dtype=np.float64)
+    if y.shape != s.shape:
+        raise ValueError("y_true and scores must have the same length.")
+    order = np.argsort(-s, kind="mergesort")
+    s, y = s[order], y[order]
+
+    # last index of each run of equal scores = cut point for that threshold
+    last = np.r_[np.flatnonzero(np.diff(s)), s.size - 1] if s.size else np.zeros(0, dtype=int)
+    tp = np.cumsum(y)[last].astype(np.float64)
+    fp = (last + 1) - tp
+    P = float(y.sum())
+    N = float(y.size - y.sum())
+    fn = P - tp
+    tn = N - fp
+
+    precision = np.divide(tp, tp + fp, out=np.zeros_like(tp), where=(tp + fp) > 0)
+    recall = np.divide(tp, P, out=np.zeros_like(tp), where=P > 0) if P else np.zeros_like(tp)
+    f1 = np.divide(2 * precision * recall, precision + recall,
+                   out=np.zeros_like(tp), where=(precision + recall) > 0)
+    tpr = recall
+    fpr = np.divide(fp, N, out=np.zeros_like(fp), where=N > 0) if N else np.zeros_like(fp)
+    accuracy = (tp + tn) / max(1, y.size)
+    return {
+        "threshold": s[last], "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+        "precision": precision, "recall": recall, "f1": f1,
+        "tpr": tpr, "fpr": fpr, "accuracy": accuracy,
+    }
+
+
+def roc_auc(c: Dict[str, np.ndarray]) -> Optional[float]:
+    """Trapezoidal ROC-AUC from curves() output (None if only one class)."""
+    if c["tp"].size == 0 or c["tp"][-1] == 0 or c["fp"][-1] == 0:
+        return None
+    fpr = np.r_[0.0, c["fpr"]]
+    tpr = np.r_[0.0, c["tpr"]]
+    return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2.0))
+
+
+def best_threshold(y_true, scores, metric: str = "f1") -> Dict[str, float]:
+    """Threshold maximizing `metric` (ties -> the higher threshold, i.e. the stricter one)."""
+    c = curves(y_true, scores)
+    if c["threshold"].size == 0:
+        return {"threshold": GRADE_THRESHOLD, "f1": 0.0, "precision": 0.0, "recall": 0.0,
+                "accuracy": 0.0, "tp": 0, "fp": 0, "tn": 0, "fn": 0}
+    i = int(np.argmax(c[metric]))
+    return {
+        "threshold": float(c["threshold"][i]),
+        "f1": float(c["f1"][i]), "precision": float(c["precision"][i]),
+        "recall": float(c["recall"][i]), "accuracy": float(c["accuracy"][i]),
+        "tp": int(c["tp"][i]), "fp": int(c["fp"][i]), "tn": int(c["tn"][i]), "fn": int(c["fn"][i]),
+    }
+
+
+def fit_thresholds(y_true, scores, topics, min_rows: int = CALIBRATION_MIN_ROWS) -> Dict[str, Dict]:
+    """
+    {GLOBAL_KEY: {...}, topic: {...}} with threshold, n and f1. Topics with fewer than
+    `min_rows` rows or a single class are left out, so they fall back to the global value.
+    """
+    y = np.asarray(y_true, dtype=np.int64)
+    s = np.asarray(scores, dtype=np.float64)
+    t = np.asarray([x if x else "" for x in topics], dtype=object)
+
+    out: Dict[str, Dict] = {}
+    g = best_threshold(y, s)
+    out[GLOBAL_KEY] = {"threshold": g["threshold"], "n": int(y.size), "f1": g["f1"]}
+
+    uniq, inv = np.unique(t, return_inverse=True)
+    for k, topic in enumerate(uniq):
+        if not topic:
+            continue
+        m = inv == k
+        ym = y[m]
+        if m.sum() < min_rows or ym.min() == ym.max():
+            continue
+        b = best_threshold(ym, s[m])
+        out[str(topic)] = {"threshold": b["threshold"], "n": int(m.sum()), "f1": b["f1"]}
+    return out
@@ -1,6 +1,9 @@
 from __future__ import annotations
-import os, json
-from typing import Any, Dict, Optional
+
+import json
+import os
+from typing import Any, Dict, List, Optional
+
 
 # ---------- Environment variable helpers ----------
 def env_bool(name: str, default: bool = False) -> bool:
@@ -10,7 +13,7 @@ def env_bool(name: str, default: bool = False) -> bool:
     return val.strip().lower() in {"1", "true", "yes", "on"}
 
 
-def env_json(name: str, default: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+def env_json(name: str, default: Optional[Any] = None) -> Any:
     raw = os.getenv(name)
     if not raw:
         return default or {}
@@ -22,11 +25,23 @@ def env_json(name: str, default: Optional[Dict[str, Any]] = None) -> Dict[str, A
 # ------------- core knobs -------------
 # SQLite database with your questions/attempts
 DB_PATH: str = os.getenv("DB_PATH", "data\\temporal\\exams.db")
+# Split users/attempts across N SQLite files next to DB_PATH (<db>.shard{i}.db); DB_PATH keeps
+# the shared catalog and the routing table. 0/1 = single database. See python -m mqth_q.shards
+DB_SHARDS: int = int(os.getenv("DB_SHARDS", "0"))
 
 # LLM endpoint (Ollama by default).
 # Note: inside Docker, you’ll often set OLLAMA_URL=http://host.docker.internal:11434
 OLLAMA_URL: str = os.getenv("OLLAMA_URL", "http://localhost:11434")
 
+# Optional pool of Ollama backends (overrides OLLAMA_URL when set), e.g.
+#   export OLLAMA_BACKENDS='[{"url":"http://localhost:11434","weight":2,"max_concurrency":4},
+#                            {"url":"http://localhost:11435"}]'
+OLLAMA_BACKENDS: List[Dict[str, Any]] = env_json("OLLAMA_BACKENDS", []) or [{"url": OLLAMA_URL}]
+# Max seconds a call waits for a free backend slot before falling back to baseline
+LLM_ROUTER_WAIT: float = float(os.getenv("LLM_ROUTER_WAIT", "2"))
+# Active health checks (GET /api/tags) per backend; 0 disables them
+LLM_HEALTH_INTERVAL: float = float(os.getenv("LLM_HEALTH_INTERVAL", "10"))
+
 # Local model tag to use with Ollama
 OLLAMA_MODEL: str = os.getenv("OLLAMA_MODEL", "llama3.2:3b")
 
@@ -34,11 +49,128 @@ OLLAMA_MODEL: str = os.getenv("OLLAMA_MODEL", "llama3.2:3b")
 # You can override with: export LLM_OPTIONS='{"num_ctx":1024,"num_gpu":0}'
 LLM_OPTIONS: Dict[str, Any] = env_json("LLM_OPTIONS", {"num_ctx": 1024})
 
+# Model residency: Ollama keep_alive for every call, warm-up at startup and a periodic
+# keep-warm ping during LLM_KEEP_WARM_HOURS (local "start-end", e.g. "7-23"; empty = always)
+LLM_KEEP_ALIVE: str = os.getenv("LLM_KEEP_ALIVE", "30m")
+LLM_WARMUP: bool = env_bool("LLM_WARMUP", True)
+LLM_KEEP_WARM_INTERVAL: float = float(os.getenv("LLM_KEEP_WARM_INTERVAL", "240"))
+LLM_KEEP_WARM_HOURS: str = os.getenv("LLM_KEEP_WARM_HOURS", "7-23")
+# Report ready (baseline-only) anyway if the model is still cold after this many seconds
+LLM_READY_TIMEOUT: float = float(os.getenv("LLM_READY_TIMEOUT", "120"))
+
+# Prompt budgeting: tokens reserved for the JSON answer, cap for the student answer,
+# and how many compacted solutions to keep in memory (per exercise_id)
+LLM_MAX_OUTPUT_TOKENS: int = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "160"))
+LLM_STUDENT_MAX_TOKENS: int = int(os.getenv("LLM_STUDENT_MAX_TOKENS", "256"))
+LLM_PROMPT_CACHE_SIZE: int = int(os.getenv("LLM_PROMPT_CACHE_SIZE", "2048"))
+
+# LLM timeouts: adaptive between MIN and MAX, driven by the observed p95 latency
+LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_TIMEOUT_MIN: float = float(os.getenv("LLM_TIMEOUT_MIN", "5"))
+LLM_TIMEOUT_P95_FACTOR: float = float(os.getenv("LLM_TIMEOUT_P95_FACTOR", "1.5"))
+
+# Circuit breaker around the LLM (open -> baseline-only until cooldown, then probes)
+LLM_BREAKER_WINDOW: int = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+LLM_BREAKER_MIN_CALLS: int = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+LLM_BREAKER_ERROR_RATE: float = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+LLM_BREAKER_SLOW_P95: float = float(os.getenv("LLM_BREAKER_SLOW_P95", "45"))
+LLM_BREAKER_COOLDOWN: float = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+LLM_BREAKER_PROBES: int = int(os.getenv("LLM_BREAKER_PROBES", "1"))
+
+# Admission control for LLM grading (per process): concurrent LLM calls, fair wait queue
+# (depth + max seconds before falling back to baseline), and per-username token bucket
+# (ADMISSION_RATE submissions/second refill, bursts up to ADMISSION_BURST; rate 0 = no limit).
+# Sync endpoints run in anyio's threadpool (40 threads per process) and a queued submission
+# parks one of those threads for up to ADMISSION_MAX_WAIT: keep MAX_CONCURRENCY + MAX_QUEUE
+# well below 40, or raise the threadpool limit along with them
+ADMISSION_MAX_CONCURRENCY: int = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "4"))
+ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "16"))
+ADMISSION_MAX_WAIT: float = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+ADMISSION_RATE: float = float(os.getenv("ADMISSION_RATE", "0.2"))
+ADMISSION_BURST: float = float(os.getenv("ADMISSION_BURST", "3"))
+
+# POST /attempts/batch (a whole exam sheet): max items per request and threads shared by all
+# batches for the LLM calls (each call still waits for an admission slot)
+BATCH_MAX_ITEMS: int = int(os.getenv("BATCH_MAX_ITEMS", "20"))
+BATCH_LLM_WORKERS: int = int(os.getenv("BATCH_LLM_WORKERS", str(ADMISSION_MAX_CONCURRENCY)))
+
+# Near-duplicate answers (mqth_q.near_dup): reuse the LLM verdict of an earlier answer to the same
+# exercise when their MinHash similarity (character shingles) is >= NEAR_DUP_THRESHOLD (0 = off).
+# NEAR_DUP_PERMS hashes split into NEAR_DUP_BANDS LSH bands; answers shorter than
+# NEAR_DUP_MIN_CHARS only reuse exact (normalized) matches; the newest
+# NEAR_DUP_MAX_PER_EXERCISE LLM-graded answers are indexed per exercise (older ones are evicted).
+# Off by default: `python -m mqth_q.near_dup` replays stored grades to pick a threshold (~0.85)
+NEAR_DUP_THRESHOLD: float = float(os.getenv("NEAR_DUP_THRESHOLD", "0"))
+NEAR_DUP_PERMS: int = int(os.getenv("NEAR_DUP_PERMS", "64"))
+NEAR_DUP_BANDS: int = int(os.getenv("NEAR_DUP_BANDS", "16"))
+NEAR_DUP_MIN_CHARS: int = int(os.getenv("NEAR_DUP_MIN_CHARS", "24"))
+NEAR_DUP_MAX_PER_EXERCISE: int = int(os.getenv("NEAR_DUP_MAX_PER_EXERCISE", "5000"))
+
 # Grading cutoff for correct/incorrect (used by baseline & LLM paths)
 GRADE_THRESHOLD: float = float(os.getenv("GRADE_THRESHOLD", "0.6"))
 
+# Per-topic thresholds need at least this many golden rows (else the global one is used)
+CALIBRATION_MIN_ROWS: int = int(os.getenv("CALIBRATION_MIN_ROWS", "20"))
+
+# Topic classifier seeds {topic: [seed phrases]}; empty = built-in list (mqth_q.topics)
+TOPIC_SEEDS: Dict[str, List[str]] = env_json("TOPIC_SEEDS", {})
+
+# Import numpy/scikit-learn in a background thread right after API startup (they are lazy)
+PRELOAD_HEAVY: bool = env_bool("PRELOAD_HEAVY", True)
+
+# HTTP caching of catalog endpoints (ETag + 304): browser/proxy max-age, how often the
+# catalog version is re-read from SQLite, and how many encoded responses stay in memory
+HTTP_CACHE_MAX_AGE: int = int(os.getenv("HTTP_CACHE_MAX_AGE", "60"))
+HTTP_CACHE_VERSION_TTL: float = float(os.getenv("HTTP_CACHE_VERSION_TTL", "2"))
+HTTP_CACHE_SIZE: int = int(os.getenv("HTTP_CACHE_SIZE", "4096"))
+
+# Opt-in fast responses: orjson bodies without re-validating service output against the
+# response models, and pre-encoded question cards (benchmark: python -m mqth_q.fastjson)
+FAST_JSON: bool = env_bool("FAST_JSON", False)
+
+# Multi-process serving (python -m mqth_q.serve): worker processes (0 = one per CPU),
+# how often each worker polls SQLite for cross-process cache invalidation, and how often
+# it refreshes its scrape-time gauges (Prometheus multiprocess mode)
+WEB_WORKERS: int = int(os.getenv("WEB_WORKERS", "1"))
+INVALIDATION_POLL: float = float(os.getenv("INVALIDATION_POLL", "1"))
+METRICS_REFRESH: float = float(os.getenv("METRICS_REFRESH", "5"))
+
+# Cold storage of attempts (python -m mqth_q.archive): Parquet segments under ARCHIVE_DIR
+# (empty = "archive" next to the DB); attempts older than ARCHIVE_AFTER_DAYS are moved
+ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "")
+ARCHIVE_AFTER_DAYS: int = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+
+# Analytics snapshot (python -m mqth_q.snapshot): read-only copy of the DB for reports and
+# ?consistency=snapshot. SNAPSHOT_PATH empty = <db>.snapshot.db next to the DB; the API refreshes
+# it every SNAPSHOT_INTERVAL s (0 = never, e.g. when a cron/sidecar does it), copying
+# SNAPSHOT_PAGES pages per step with SNAPSHOT_SLEEP s between steps
+SNAPSHOT_PATH: str = os.getenv("SNAPSHOT_PATH", "")
+SNAPSHOT_INTERVAL: float = float(os.getenv("SNAPSHOT_INTERVAL", "0"))
+SNAPSHOT_PAGES: int = int(os.getenv("SNAPSHOT_PAGES", "256"))
+SNAPSHOT_SLEEP: float = float(os.getenv("SNAPSHOT_SLEEP", "0.005"))
+
+# On-demand sampling profiler (mqth_q.profiling): a request is profiled when it carries
+# X-Profile: <PROFILE_TOKEN> (header only), or at random with PROFILE_SAMPLE_RATE.
+# Both off = no profiling hooks installed. Files go to PROFILE_DIR; one sample per PROFILE_INTERVAL s
+PROFILE_TOKEN: str = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR: str = os.getenv("PROFILE_DIR", "reports/profiles")
+PROFILE_INTERVAL: float = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+
+# Per-request span tracing (mqth_q.tracing): TRACE_EXPORT = OTLP/JSON lines file ("" = off),
+# TRACE_SAMPLE_RATE = share of requests exported; requests slower than TRACE_SLOW_MS (0 = off)
+# log their span tree to TRACE_SLOW_LOG. All off = the API opens no traces
+TRACE_EXPORT: str = os.getenv("TRACE_EXPORT", "")
+TRACE_SAMPLE_RATE: float = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+TRACE_SLOW_MS: float = float(os.getenv("TRACE_SLOW_MS", "0"))
+TRACE_SLOW_LOG: str = os.getenv("TRACE_SLOW_LOG", "reports/slow_requests.jsonl")
+
 # Default number of recommendations to fetch
 RECS_K: int = int(os.getenv("RECS_K", "5"))
+# Difficulty-aware picks: prefer unseen exercises whose cohort first-try success rate is near
+# RECS_TARGET_SUCCESS (negative = off), once at least RECS_STATS_MIN_USERS users tried them
+RECS_TARGET_SUCCESS: float = float(os.getenv("RECS_TARGET_SUCCESS", "0.7"))
+RECS_STATS_MIN_USERS: int = int(os.getenv("RECS_STATS_MIN_USERS", "5"))
 
 # SQLite pragmas (we’ll apply these in db.py)
 SQLITE_JOURNAL_MODE: str = os.getenv("SQLITE_JOURNAL", "WAL")
@@ -47,6 +179,6 @@ SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNC", "NORMAL")
 # Handy one-liner to print current config (useful when debugging containers)
 def explain() -> str:
     return (
-        f"DB={DB_PATH} | OLLAMA={OLLAMA_MODEL}@{OLLAMA_URL} | "
+        f"DB={DB_PATH} | OLLAMA={OLLAMA_MODEL}@{','.join(b['url'] for b in OLLAMA_BACKENDS)} | "
         f"THRESH={GRADE_THRESHOLD} | LLM_OPTIONS={LLM_OPTIONS}"
     )
\ No newline at end of file
@@ -2,33 +2,99 @@
 # usamos pequeñas funciones que reutilizamos en app_streamlit.py y 4_llm.py
 #       - get_user_id() - crear usuario si no existe y devolver user_id
 #       - fetch_question() - obtener datos de una pregunta por exercise_id | text + metada por un ejercicio
+#       - fetch_questions() - lo mismo para muchos exercise_id en una sola conexión
 #       - list_unseen() - listar preguntas no intentadas por un usuario
 #       - get_attempts() - obtener dataframe con intentos de un usuario
 #       - save_attempt() - guardar intento de un usuario
+#       - save_attempts() - varios intentos de un usuario en una sola transacción (hoja de examen)
+#       - catalog_version() / user_version() - versiones para ETags de la API
+#       - bump_generation() / read_generations() - canales de invalidación entre procesos
+#       - search_questions() - búsqueda full-text (FTS5 + BM25) sobre enunciados, soluciones y topic
+#       - update_exercise_stats() / get_exercise_stats() / list_exercise_stats() - dificultad por ejercicio
+#       - con DB_SHARDS > 1 los datos por usuario van en <db>.shard{i}.db (route() / shard_of())
+#       - los intentos antiguos pueden estar archivados (mqth_q.archive): en la tabla quedan
+#         solo ids, ts y puntuaciones; get_attempts(include_archived=True) recupera el resto
 
 from __future__ import annotations
-import sqlite3, json, time
-from typing import Any, Dict, List, Optional
+
 from contextlib import contextmanager
+from contextvars import ContextVar
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote
 
-from .config import DB_PATH, SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS
+from .config import DB_PATH, DB_SHARDS, SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS
+from .tracing import traced
 
 # --------------------------- Connection helpers ---------------------------
-def connect() -> sqlite3.Connection:
+# dentro de reading_snapshot(path) todas las lecturas van a la réplica de solo lectura
+_READ_FROM: ContextVar[Optional[str]] = ContextVar("mqth_q_read_from", default=None)
+
+# sharding (DB_SHARDS > 1): DB_PATH guarda el catálogo (preguntas, exámenes, FTS, umbrales...)
+# y la tabla de ruteo user_shards; users/attempts/exercise_stats van en <db>.shard{i}.db.
+# Una conexión a un shard adjunta el catálogo como "catalog": las consultas que cruzan
+# intentos con preguntas funcionan sin cambios (SQLite busca la tabla en main y luego en catalog).
+SHARDS: int = DB_SHARDS
+
+def _base() -> str:
+    return _READ_FROM.get() or DB_PATH
+
+def shard_path(i: int, base: Optional[str] = None) -> str:
+    root, ext = os.path.splitext(base or _base())
+    return f"{root}.shard{i}{ext or '.db'}"
+
+def _open(path: str, read_only: bool) -> sqlite3.Connection:
+    if read_only:
+        return sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True, check_same_thread=False, timeout=2.0)
     # timeout evita que cuelgue si hay lock (mejor falla rápido)
-    con = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=2.0)
+    return sqlite3.connect(path, check_same_thread=False, timeout=2.0)
+
+def connect(shard: Optional[int] = None, catalog: bool = True) -> sqlite3.Connection:
+    """Main/catalog DB, or shard `shard` with the catalog attached (ignored when not sharded)."""
+    read_only = _READ_FROM.get() is not None
+    if shard is None or SHARDS <= 1:
+        con = _open(_base(), read_only)
+    else:
+        con = _open(shard_path(shard), read_only)
+        if not catalog:         # writes that never read the catalog skip the ATTACH (~0.6 ms)
+            con.row_factory = sqlite3.Row
+            return con
+        target = f"file:{quote(_base())}?mode=ro" if read_only else _base()
+        con.execute("ATTACH DATABASE ? AS catalog", (target,))
     con.row_factory = sqlite3.Row
     return con
 
 @contextmanager
-def _con():
-    con = connect()
+def reading_snapshot(path: str):
+    """Route connect() in this thread/task to the read-only analytics snapshot at `path`."""
+    token = _READ_FROM.set(path)
+    try:
+        yield
+    finally:
+        _READ_FROM.reset(token)
+
+def in_snapshot() -> bool:
+    return _READ_FROM.get() is not None
+
+@contextmanager
+def _con(shard: Optional[int] = None, catalog: bool = True):
+    con = connect(shard, catalog)
     try:
         yield con
         con.commit()
     finally:
         con.close()
 
+def user_dbs() -> List[Optional[int]]:
+    """Where per-user rows live: [None] (main DB) or every shard index."""
+    return list(range(SHARDS)) if SHARDS > 1 else [None]
+
 # --------------------------- Schema init ---------------------------
 def init_db() -> None:
     with _con() as con:
@@ -36,13 +102,6 @@ def init_db() -> None:
         cur.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE};")
         cur.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS};")
 
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS users(
-          user_id   INTEGER PRIMARY KEY AUTOINCREMENT,
-          username  TEXT NOT NULL UNIQUE
-        );
-        """)
-
         cur.execute("""
         CREATE TABLE IF NOT EXISTS exams(
           exam_id    TEXT PRIMARY KEY,
@@ -63,41 +122,351 @@ def init_db() -> None:
         );
         """)
 
+        _create_user_tables(cur)
+
+        # calibrated baseline thresholds: topic '*' = global, others per topic_pred
         cur.execute("""
-        CREATE TABLE IF NOT EXISTS attempts(
-          attempt_id        INTEGER PRIMARY KEY AUTOINCREMENT,
-          ts                REAL DEFAULT (strftime('%s','now')),
-          user_id           INTEGER NOT NULL,
-          exercise_id       TEXT    NOT NULL,
-          score             REAL,
-          correct           INTEGER,
-          cosine            REAL,
-          jaccard           REAL,
-          missing_keywords  TEXT,   -- JSON array
-          student_answer    TEXT,
-          reasons           TEXT,
-          hint              TEXT,
-          feedback_json     TEXT,
-          FOREIGN KEY (user_id)     REFERENCES users(user_id),
-          FOREIGN KEY (exercise_id) REFERENCES questions(exercise_id)
+        CREATE TABLE IF NOT EXISTS grade_thresholds(
+          topic       TEXT PRIMARY KEY,
+          threshold   REAL NOT NULL,
+          n           INTEGER,
+          f1          REAL,
+          updated_ts  REAL
         );
         """)
 
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_attempts_user ON attempts(user_id);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_attempts_ex   ON attempts(exercise_id);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_questions_topic ON questions(topic_pred);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_exams_date ON exams(date);")
+        # ingestion bookkeeping (mqth_q.ingest): cached page text + content hashes
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_pages(
+          source        TEXT    NOT NULL,
+          page_no       INTEGER NOT NULL,
+          content_hash  TEXT    NOT NULL,
+          text          TEXT,
+          PRIMARY KEY (source, page_no)
+        );
+        """)
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_exams(
+          exam_id       TEXT PRIMARY KEY,
+          content_hash  TEXT NOT NULL,
+          n_exercises   INTEGER,
+          updated_ts    REAL
+        );
+        """)
+
+        # topic classifier bookkeeping (mqth_q.topics): what each topic_pred was computed from
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS topic_assignments(
+          exercise_id   TEXT PRIMARY KEY,
+          content_hash  TEXT NOT NULL,
+          topic         TEXT,
+          score         REAL,
+          model         TEXT,
+          updated_ts    REAL
+        );
+        """)
+
+        # catalog version (HTTP ETags): bumped by triggers on any questions/exams change
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS catalog_meta(
+          id       INTEGER PRIMARY KEY CHECK (id = 1),
+          version  INTEGER NOT NULL
+        );
+        """)
+        cur.execute("INSERT OR IGNORE INTO catalog_meta(id, version) VALUES(1, 1)")
+        for table in ("questions", "exams"):
+            for op in ("INSERT", "UPDATE", "DELETE"):
+                cur.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS catalog_version_{table}_{op.lower()} AFTER {op} ON {table}
+                BEGIN UPDATE catalog_meta SET version = version + 1 WHERE id = 1; END;
+                """)
+
+        # cross-process invalidation channels (mqth_q.invalidation): generation per channel
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS invalidation(
+          channel     TEXT PRIMARY KEY,
+          generation  INTEGER NOT NULL DEFAULT 0
+        );
+        """)
+
+        # sharding (DB_SHARDS > 1): username -> shard placement; user_id is allocated here so it
+        # stays unique across shards
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_shards(
+          user_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+          username  TEXT    NOT NULL UNIQUE,
+          shard     INTEGER NOT NULL,
+          pinned    INTEGER NOT NULL DEFAULT 0   -- fixed placement, rebalancing leaves it alone
+        );
+        """)
+
+        create_indexes(cur)
+        create_fts(cur)
+
+        if SHARDS > 1:
+            # ids of users still in the main DB (before sharding) must not be handed out again
+            legacy = cur.execute("SELECT COALESCE(MAX(user_id), 0) FROM users").fetchone()[0]
+            seq = cur.execute("SELECT seq FROM sqlite_sequence WHERE name='user_shards'").fetchone()
+            if legacy > (seq[0] if seq else 0):
+                cur.execute("DELETE FROM sqlite_sequence WHERE name='user_shards'")
+                cur.execute("INSERT INTO sqlite_sequence(name, seq) VALUES('user_shards', ?)", (legacy,))
+    for i in range(SHARDS if SHARDS > 1 else 0):
+        with _con(i) as con:
+            cur = con.cursor()
+            cur.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE};")
+            _create_user_tables(cur)
+
+def _create_user_tables(cur: sqlite3.Cursor) -> None:
+    """Per-user data: in the main DB, or in every shard file when DB_SHARDS > 1."""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS users(
+      user_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+      username  TEXT NOT NULL UNIQUE
+    );
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS attempts(
+      attempt_id        INTEGER PRIMARY KEY AUTOINCREMENT,
+      ts                REAL DEFAULT (strftime('%s','now')),
+      user_id           INTEGER NOT NULL,
+      exercise_id       TEXT    NOT NULL,
+      score             REAL,
+      correct           INTEGER,
+      cosine            REAL,
+      jaccard           REAL,
+      missing_keywords  TEXT,   -- JSON array
+      student_answer    TEXT,
+      reasons           TEXT,
+      hint              TEXT,
+      feedback_json     TEXT,
+      archive_segment   INTEGER,  -- attempt_archives.segment_id once moved to cold storage
+      FOREIGN KEY (user_id)     REFERENCES users(user_id),
+      FOREIGN KEY (exercise_id) REFERENCES questions(exercise_id)
+    );
+    """)
+    _add_column(cur, "attempts", "archive_segment", "INTEGER")
+
+    # per-exercise cohort statistics, updated by save_attempt (rebuild: mqth_q.exercise_stats).
+    # "first" = a user's first try at the exercise; d_* = sums over first tries of users with
+    # history, a = their mean score before that try (ability), x = first try correct (0/1)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS exercise_stats(
+      exercise_id    TEXT PRIMARY KEY,
+      n_attempts     INTEGER NOT NULL DEFAULT 0,
+      score_sum      REAL    NOT NULL DEFAULT 0,
+      score_sq_sum   REAL    NOT NULL DEFAULT 0,
+      n_first        INTEGER NOT NULL DEFAULT 0,
+      first_correct  INTEGER NOT NULL DEFAULT 0,
+      d_n            INTEGER NOT NULL DEFAULT 0,
+      d_a            REAL    NOT NULL DEFAULT 0,
+      d_aa           REAL    NOT NULL DEFAULT 0,
+      d_x            REAL    NOT NULL DEFAULT 0,
+      d_ax           REAL    NOT NULL DEFAULT 0,
+      updated_ts     REAL
+    );
+    """)
+
+    # cold storage of old attempts (mqth_q.archive): one Parquet file per segment
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS attempt_archives(
+      segment_id  INTEGER PRIMARY KEY AUTOINCREMENT,
+      month       TEXT    NOT NULL,   -- YYYY-MM (UTC) of the attempts it holds
+      path        TEXT    NOT NULL,   -- relative to the archive directory
+      n_rows      INTEGER,
+      min_ts      REAL,
+      max_ts      REAL,
+      created_ts  REAL
+    );
+    """)
+    for name in USER_INDEXES:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {INDEXES[name]};")
+
+
+def _add_column(cur: sqlite3.Cursor, table: str, column: str, decl: str) -> None:
+    """Migration for databases created before `column` existed."""
+    if column not in {r[1] for r in cur.execute(f"PRAGMA table_info({table})")}:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+# secondary indexes; bulk loads drop the catalog ones and rebuild them afterwards
+INDEXES = {
+    "idx_users_username":  "users(username)",
+    "idx_attempts_user":   "attempts(user_id)",
+    "idx_attempts_ex":     "attempts(exercise_id)",
+    "idx_attempts_user_ex": "attempts(user_id, exercise_id)",
+    "idx_questions_topic": "questions(topic_pred)",
+    "idx_exams_date":      "exams(date)",
+}
+CATALOG_INDEXES = ("idx_questions_topic", "idx_exams_date")
+USER_INDEXES = ("idx_users_username", "idx_attempts_user", "idx_attempts_ex", "idx_attempts_user_ex")
+
+def create_indexes(cur: sqlite3.Cursor) -> None:
+    for name, target in INDEXES.items():
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target};")
+
+def drop_indexes(cur: sqlite3.Cursor, names=CATALOG_INDEXES) -> None:
+    for name in names:
+        cur.execute(f"DROP INDEX IF EXISTS {name};")
+
+# full-text index over the catalog (external content: no copy of the text, synced by triggers)
+FTS_TOKENIZE = "porter unicode61 remove_diacritics 2"
+
+def create_fts(cur: sqlite3.Cursor) -> bool:
+    """Create questions_fts + sync triggers; rebuilds from questions on first creation.
+    Returns False if this SQLite build has no FTS5 (search is then unavailable)."""
+    exists = cur.execute("SELECT 1 FROM sqlite_master WHERE name='questions_fts'").fetchone()
+    try:
+        cur.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+          question, solution, topic_pred,
+          content='questions', content_rowid='rowid', tokenize='{FTS_TOKENIZE}'
+        );
+        """)
+    except sqlite3.OperationalError:
+        return False
+    cur.executescript("""
+    CREATE TRIGGER IF NOT EXISTS questions_fts_ai AFTER INSERT ON questions BEGIN
+      INSERT INTO questions_fts(rowid, question, solution, topic_pred)
+      VALUES (new.rowid, new.question, new.solution, new.topic_pred);
+    END;
+    CREATE TRIGGER IF NOT EXISTS questions_fts_ad AFTER DELETE ON questions BEGIN
+      INSERT INTO questions_fts(questions_fts, rowid, question, solution, topic_pred)
+      VALUES ('delete', old.rowid, old.question, old.solution, old.topic_pred);
+    END;
+    CREATE TRIGGER IF NOT EXISTS questions_fts_au AFTER UPDATE OF question, solution, topic_pred ON questions BEGIN
+      INSERT INTO questions_fts(questions_fts, rowid, question, solution, topic_pred)
+      VALUES ('delete', old.rowid, old.question, old.solution, old.topic_pred);
+      INSERT INTO questions_fts(rowid, question, solution, topic_pred)
+      VALUES (new.rowid, new.question, new.solution, new.topic_pred);
+    END;
+    """)
+    if not exists:
+        cur.execute("INSERT INTO questions_fts(questions_fts) VALUES('rebuild')")
+    return True
 
 # --------------------------- Users ---------------------------
+# ruteo username -> (user_id, shard), cacheado por proceso; mqth_q.shards publica "shards"
+# al mover usuarios y app.py vacía la caché con clear_routes()
+_ROUTES: Dict[str, Tuple[int, int]] = {}
+_SHARD_OF: Dict[int, int] = {}
+_ROUTES_LOCK = threading.Lock()
+
+def home_shard(username: str, n: Optional[int] = None) -> int:
+    """Default placement: stable hash of the username (not Python's salted hash())."""
+    n = n or SHARDS
+    return int.from_bytes(hashlib.blake2b(username.encode("utf-8"), digest_size=8).digest(), "big") % n
+
+def clear_routes() -> None:
+    with _ROUTES_LOCK:
+        _ROUTES.clear()
+        _SHARD_OF.clear()
+
+def _remember(username: str, user_id: int, shard: int) -> None:
+    with _ROUTES_LOCK:
+        _ROUTES[username] = (user_id, shard)
+        _SHARD_OF[user_id] = shard
+
+def route(username: str, create: bool = True) -> Optional[Tuple[int, int]]:
+    """(user_id, shard) of a user in a sharded setup; placed on its home shard when new."""
+    hit = _ROUTES.get(username)
+    if hit is not None:
+        return hit
+    with _con() as con:
+        row = con.execute("SELECT user_id, shard FROM user_shards WHERE username=?", (username,)).fetchone()
+        if row is None:
+            if not create:
+                return None
+            # a user from before sharding keeps its id (its old rows move with mqth_q.shards rebalance)
+            legacy = con.execute("SELECT user_id FROM users WHERE username=?", (username,)).fetchone()
+            con.execute("INSERT OR IGNORE INTO user_shards(user_id, username, shard) VALUES(?,?,?)",
+                        (legacy[0] if legacy else None, username, home_shard(username)))
+            row = con.execute("SELECT user_id, shard FROM user_shards WHERE username=?", (username,)).fetchone()
+    user_id, shard = int(row[0]), int(row[1])
+    if create:
+        with _con(shard, catalog=False) as con:
+            con.execute("INSERT OR IGNORE INTO users(user_id, username) VALUES(?,?)", (user_id, username))
+    _remember(username, user_id, shard)
+    return user_id, shard
+
+def shard_of(user_id: int) -> Optional[int]:
+    """Shard holding `user_id` (None when not sharded; shard 0 for unknown ids, which hold no rows)."""
+    if SHARDS <= 1:
+        return None
+    hit = _SHARD_OF.get(user_id)
+    if hit is not None:
+        return hit
+    with _con() as con:
+        row = con.execute("SELECT username, shard FROM user_shards WHERE user_id=?", (user_id,)).fetchone()
+    if row is None:
+        return 0
+    _remember(row[0], user_id, int(row[1]))
+    return int(row[1])
+
+@traced()
 def get_user_id(username: str) -> int:
+    if SHARDS > 1:
+        r = route(username, create=not in_snapshot())
+        return r[0] if r else 0
     with _con() as con:
         cur = con.cursor()
+        if in_snapshot():       # read-only replica: unknown users have no rows (id 0)
+            row = cur.execute("SELECT user_id FROM users WHERE username=?", (username,)).fetchone()
+            return int(row["user_id"]) if row else 0
         cur.execute("INSERT OR IGNORE INTO users(username) VALUES(?)", (username,))
         cur.execute("SELECT user_id FROM users WHERE username=?", (username,))
         return int(cur.fetchone()["user_id"])
 
+# --------------------------- Versions (HTTP caching) ---------------------------
+@traced()
+def catalog_version() -> Optional[int]:
+    """Monotonic counter of questions/exams changes (None if init_db has not created it)."""
+    with _con() as con:
+        try:
+            row = con.execute("SELECT version FROM catalog_meta WHERE id = 1").fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return int(row[0]) if row else None
+
+@traced()
+def user_version(username: str) -> str:
+    """Changes whenever the user records an attempt; does not create the user."""
+    shard = None
+    if SHARDS > 1:
+        r = route(username, create=False)
+        if r is None:
+            return "0-0"
+        shard = r[1]
+    with _con(shard) as con:
+        row = con.execute("""
+          SELECT COUNT(a.attempt_id), COALESCE(MAX(a.attempt_id), 0)
+          FROM users u LEFT JOIN attempts a ON a.user_id = u.user_id
+          WHERE u.username = ?
+        """, (username,)).fetchone()
+        return f"{row[0]}-{row[1]}" if row else "0-0"
+
+def bump_generation(cur: sqlite3.Cursor, channel: str) -> int:
+    """Advance an invalidation channel inside the caller's transaction; returns the new generation."""
+    cur.execute("""
+      INSERT INTO invalidation(channel, generation) VALUES(?, 1)
+      ON CONFLICT(channel) DO UPDATE SET generation = generation + 1
+    """, (channel,))
+    return int(cur.execute("SELECT generation FROM invalidation WHERE channel=?", (channel,)).fetchone()[0])
+
+def read_generations(con: sqlite3.Connection) -> Dict[str, int]:
+    """{channel: generation}, with the catalog version exposed as channel 'catalog'."""
+    out: Dict[str, int] = {}
+    try:
+        out.update({r[0]: int(r[1]) for r in con.execute("SELECT channel, generation FROM invalidation")})
+        row = con.execute("SELECT version FROM catalog_meta WHERE id = 1").fetchone()
+        if row:
+            out["catalog"] = int(row[0])
+    except sqlite3.OperationalError:
+        pass
+    return out
+
 # --------------------------- Questions / Exams ---------------------------
+@traced()
 def fetch_question(exercise_id: str) -> Optional[Dict[str, Any]]:
     with _con() as con:
         cur = con.cursor()
@@ -111,8 +480,28 @@ def fetch_question(exercise_id: str) -> Optional[Dict[str, Any]]:
         row = cur.fetchone()
         return dict(row) if row else None
 
-def list_unseen(user_id: int, k: int = 20) -> List[Dict[str, Any]]:
+@traced()
+def fetch_questions(exercise_ids: Iterable[str], chunk: int = 500) -> Dict[str, Dict[str, Any]]:
+    """Bulk version of fetch_question: one connection, IN (...) queries in chunks."""
+    ids = list(dict.fromkeys(str(x) for x in exercise_ids))
+    out: Dict[str, Dict[str, Any]] = {}
     with _con() as con:
+        cur = con.cursor()
+        for i in range(0, len(ids), chunk):
+            part = ids[i:i + chunk]
+            cur.execute(f"""
+              SELECT q.exercise_id, q.question, q.solution, q.topic_pred AS topic,
+                     e.exam_id, e.exam_type, e.date, e.year
+              FROM questions q
+              LEFT JOIN exams e ON e.exam_id = q.exam_id
+              WHERE q.exercise_id IN ({",".join("?" * len(part))})
+            """, part)
+            out.update({r["exercise_id"]: dict(r) for r in cur.fetchall()})
+    return out
+
+@traced()
+def list_unseen(user_id: int, k: int = 20) -> List[Dict[str, Any]]:
+    with _con(shard_of(user_id)) as con:
         cur = con.cursor()
         cur.execute("""
           SELECT q.exercise_id, q.topic_pred AS topic, e.date, e.exam_type
@@ -127,14 +516,16 @@ def list_unseen(user_id: int, k: int = 20) -> List[Dict[str, Any]]:
         return [dict(r) for r in cur.fetchall()]
 
 # --- NEW: topics list + pick by topic (unseen / any) ---
+@traced()
 def list_topics() -> List[str]:
     with _con() as con:
         cur = con.cursor()
         cur.execute("SELECT DISTINCT topic_pred FROM questions WHERE topic_pred IS NOT NULL AND topic_pred <> '' ORDER BY topic_pred ASC;")
         return [r[0] for r in cur.fetchall()]
 
+@traced()
 def pick_unseen_by_topic(user_id: int, topic: str) -> Optional[Dict[str, Any]]:
-    with _con() as con:
+    with _con(shard_of(user_id)) as con:
         cur = con.cursor()
         cur.execute("""
           SELECT q.exercise_id, q.topic_pred AS topic, e.date, e.exam_type
@@ -148,6 +539,7 @@ def pick_unseen_by_topic(user_id: int, topic: str) -> Optional[Dict[str, Any]]:
         row = cur.fetchone()
         return dict(row) if row else None
 
+@traced()
 def pick_any_by_topic(topic: str) -> Optional[Dict[str, Any]]:
     with _con() as con:
         cur = con.cursor()
@@ -162,8 +554,55 @@ def pick_any_by_topic(topic: str) -> Optional[Dict[str, Any]]:
         row = cur.fetchone()
         return dict(row) if row else None
 
+# --- full-text search (questions_fts) ---
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+def fts_query(text: str) -> str:
+    """User text -> safe FTS5 MATCH expression: every word required, last one as a prefix."""
+    terms = _TERM_RE.findall(text or "")
+    if not terms:
+        return ""
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+@traced()
+def search_questions(text: str, topic: Optional[str] = None, unseen_for: Optional[int] = None,
+                     limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+    """BM25-ranked matches (question > topic > solution) with a highlighted snippet + total count."""
+    match = fts_query(text)
+    if not match:
+        return {"total": 0, "items": []}
+    where = ["questions_fts MATCH ?"]
+    args: List[Any] = [match]
+    if topic:
+        where.append("q.topic_pred = ?")
+        args.append(topic)
+    if unseen_for is not None:
+        where.append("NOT EXISTS (SELECT 1 FROM attempts a WHERE a.user_id = ? AND a.exercise_id = q.exercise_id)")
+        args.append(unseen_for)
+    base = f"""
+      FROM questions_fts
+      JOIN questions q ON q.rowid = questions_fts.rowid
+      LEFT JOIN exams e ON e.exam_id = q.exam_id
+      WHERE {" AND ".join(where)}
+    """
+    with _con(shard_of(unseen_for) if unseen_for is not None else None) as con:
+        cur = con.cursor()
+        total = cur.execute(f"SELECT COUNT(*) {base}", args).fetchone()[0]
+        cur.execute(f"""
+          SELECT q.exercise_id, q.topic_pred AS topic, e.date, e.exam_type,
+                 snippet(questions_fts, -1, '[', ']', '…', 16) AS snippet,
+                 bm25(questions_fts, 4.0, 1.0, 2.0) AS rank
+          {base}
+          ORDER BY rank
+          LIMIT ? OFFSET ?
+        """, (*args, limit, offset))
+        return {"total": int(total), "items": [dict(r) for r in cur.fetchall()]}
+
 # --------------------------- Attempts ---------------------------
-def save_attempt(user_id: int, exercise_id: str, result: Dict[str, Any], student_answer: str) -> None:
+def _insert_attempt(cur: sqlite3.Cursor, user_id: int, exercise_id: str, result: Dict[str, Any],
+                    student_answer: str) -> None:
     score  = float(result.get("score", 0.0))
     correct = 1 if bool(result.get("correct", False)) else 0
     cosine = result.get("cosine")
@@ -173,25 +612,46 @@ def save_attempt(user_id: int, exercise_id: str, result: Dict[str, Any], student
     hint    = result.get("hint", "")
     feedback_json = json.dumps({k: v for k, v in result.items() if k not in {"missing_keywords"}})
 
-    with _con() as con:
+    update_exercise_stats(cur, user_id, exercise_id, score, correct)   # reads history before the insert
+    cur.execute("""
+      INSERT INTO attempts(
+        ts, user_id, exercise_id, score, correct,
+        cosine, jaccard, missing_keywords, student_answer,
+        reasons, hint, feedback_json
+      )
+      VALUES(?,?,?,?,?,?,?,?,?,?,?,?)
+    """, (time.time(), user_id, exercise_id, score, correct,
+          cosine, jaccard, missing, student_answer, reasons, hint, feedback_json))
+
+@traced()
+def save_attempt(user_id: int, exercise_id: str, result: Dict[str, Any], student_answer: str) -> None:
+    with _con(shard_of(user_id), catalog=False) as con:
+        _insert_attempt(con.cursor(), user_id, exercise_id, result, student_answer)
+
+@traced()
+def save_attempts(user_id: int, items: Iterable[Tuple[str, Dict[str, Any], str]]) -> int:
+    """Several (exercise_id, result, student_answer) of one user in a single transaction, in order."""
+    n = 0
+    with _con(shard_of(user_id), catalog=False) as con:
         cur = con.cursor()
-        cur.execute("""
-          INSERT INTO attempts(
-            ts, user_id, exercise_id, score, correct,
-            cosine, jaccard, missing_keywords, student_answer,
-            reasons, hint, feedback_json
-          )
-          VALUES(?,?,?,?,?,?,?,?,?,?,?,?)
-        """, (time.time(), user_id, exercise_id, score, correct,
-              cosine, jaccard, missing, student_answer, reasons, hint, feedback_json))
+        for exercise_id, result, student_answer in items:
+            _insert_attempt(cur, user_id, exercise_id, result, student_answer)
+            n += 1
+    return n
 
-def get_attempts(user_id: int, limit: int = 200) -> List[Dict[str, Any]]:
-    with _con() as con:
+@traced()
+def get_attempts(user_id: int, limit: int = 200, include_archived: bool = False) -> List[Dict[str, Any]]:
+    """
+    Latest attempts of a user. Archived rows only keep ids, ts and scores here;
+    include_archived=True also returns student_answer and restores reasons/hint from the archive.
+    """
+    extra = ", a.student_answer, a.archive_segment" if include_archived else ""
+    with _con(shard_of(user_id)) as con:
         cur = con.cursor()
-        cur.execute("""
+        cur.execute(f"""
           SELECT a.attempt_id, a.ts, a.exercise_id, a.score, a.correct,
                  a.reasons, a.hint,
-                 q.topic_pred AS topic, e.date, e.exam_type
+                 q.topic_pred AS topic, e.date, e.exam_type{extra}
           FROM attempts a
           JOIN questions q ON q.exercise_id = a.exercise_id
           LEFT JOIN exams e  ON e.exam_id    = q.exam_id
@@ -199,4 +659,168 @@ def get_attempts(user_id: int, limit: int = 200) -> List[Dict[str, Any]]:
           ORDER BY a.ts DESC
           LIMIT ?
         """, (user_id, limit))
-        return [dict(r) for r in cur.fetchall()]
+        rows = [dict(r) for r in cur.fetchall()]
+    if include_archived:
+        from .archive import fill_archived
+        fill_archived(rows, user_id)
+    return rows
+
+@traced()
+def llm_answers(exercise_id: str, after: Dict[Optional[int], int], limit: Optional[int] = None
+                ) -> Tuple[List[Dict[str, Any]], Dict[Optional[int], int]]:
+    """
+    Live LLM-graded answers to `exercise_id` with attempt_id > after[shard], newest first (at
+    most `limit` per shard, tagged with their shard), and the new high-water mark per shard.
+    LLM verdicts are the rows without a baseline cosine; reused ones (feedback_json.reused) are
+    left out. Archived rows have no answer text.
+    """
+    fb = "CASE WHEN json_valid(feedback_json) THEN json_extract(feedback_json, '$.{}') END"
+    rows: List[Dict[str, Any]] = []
+    marks = dict(after)
+    for shard in user_dbs():
+        with _con(shard, catalog=False) as con:
+            try:
+                top = con.execute("SELECT MAX(attempt_id) FROM attempts WHERE exercise_id = ?",
+                                  (exercise_id,)).fetchone()[0]
+                if top is None or top <= after.get(shard, 0):
+                    continue
+                cur = con.execute(f"""
+                  SELECT attempt_id, student_answer, score, correct, reasons, hint,
+                         {fb.format("solution_fp")} AS solution_fp
+                  FROM attempts
+                  WHERE exercise_id = ? AND attempt_id > ? AND attempt_id <= ?
+                    AND cosine IS NULL AND student_answer IS NOT NULL AND {fb.format("reused")} IS NULL
+                  ORDER BY attempt_id DESC LIMIT ?
+                """, (exercise_id, after.get(shard, 0), top, -1 if limit is None else limit))
+            except sqlite3.OperationalError:     # schema without these columns (init_db not run)
+                continue
+            rows.extend(dict(r, shard=shard) for r in cur)
+            marks[shard] = top
+    return rows, marks
+
+# --------------------------- Exercise statistics ---------------------------
+def update_exercise_stats(cur: sqlite3.Cursor, user_id: int, exercise_id: str,
+                          score: float, correct: int) -> None:
+    """Fold one new attempt into exercise_stats; call in the same transaction, before inserting it."""
+    first = cur.execute("SELECT 1 FROM attempts WHERE user_id=? AND exercise_id=? LIMIT 1",
+                        (user_id, exercise_id)).fetchone() is None
+    d_n = d_a = d_aa = d_x = d_ax = 0.0
+    if first:
+        n_prev, s_prev = cur.execute("SELECT COUNT(*), TOTAL(score) FROM attempts WHERE user_id=?",
+                                     (user_id,)).fetchone()
+        if n_prev:
+            a = s_prev / n_prev
+            d_n, d_a, d_aa, d_x, d_ax = 1, a, a * a, correct, a * correct
+    cur.execute("""
+      INSERT INTO exercise_stats(exercise_id, n_attempts, score_sum, score_sq_sum, n_first, first_correct,
+                                 d_n, d_a, d_aa, d_x, d_ax, updated_ts)
+      VALUES(?,1,?,?,?,?,?,?,?,?,?,?)
+      ON CONFLICT(exercise_id) DO UPDATE SET
+        n_attempts = n_attempts + 1, score_sum = score_sum + excluded.score_sum,
+        score_sq_sum = score_sq_sum + excluded.score_sq_sum, n_first = n_first + excluded.n_first,
+        first_correct = first_correct + excluded.first_correct, d_n = d_n + excluded.d_n,
+        d_a = d_a + excluded.d_a, d_aa = d_aa + excluded.d_aa, d_x = d_x + excluded.d_x,
+        d_ax = d_ax + excluded.d_ax, updated_ts = excluded.updated_ts
+    """, (exercise_id, score, score * score, int(first), correct if first else 0,
+          d_n, d_a, d_aa, d_x, d_ax, time.time()))
+
+def derive_exercise_stats(r: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of an exercise_stats row (rates, variance, discrimination)."""
+    n, nf, dn = r["n_attempts"], r["n_first"], r["d_n"]
+    mean = r["score_sum"] / n if n else 0.0
+    disc = None
+    if dn >= 3:
+        # Pearson r between ability and first-try correctness (point-biserial); x*x = x
+        cov = dn * r["d_ax"] - r["d_a"] * r["d_x"]
+        var_a = dn * r["d_aa"] - r["d_a"] ** 2
+        var_x = dn * r["d_x"] - r["d_x"] ** 2
+        if var_a > 1e-12 and var_x > 1e-12:
+            disc = round(cov / (var_a * var_x) ** 0.5, 3)
+    return {
+        "exercise_id": r["exercise_id"],
+        "topic": r.get("topic"),
+        "attempts": n,
+        "users": nf,
+        "first_try_correct_rate": round(r["first_correct"] / nf, 3) if nf else None,
+        "mean_score": round(mean, 3) if n else None,
+        "score_var": round(max(0.0, r["score_sq_sum"] / n - mean * mean), 4) if n else None,
+        "discrimination": disc,
+    }
+
+_STATS_SELECT = """
+  SELECT q.exercise_id, q.topic_pred AS topic,
+         COALESCE(s.n_attempts, 0) AS n_attempts, COALESCE(s.score_sum, 0) AS score_sum,
+         COALESCE(s.score_sq_sum, 0) AS score_sq_sum, COALESCE(s.n_first, 0) AS n_first,
+         COALESCE(s.first_correct, 0) AS first_correct, COALESCE(s.d_n, 0) AS d_n,
+         COALESCE(s.d_a, 0) AS d_a, COALESCE(s.d_aa, 0) AS d_aa, COALESCE(s.d_x, 0) AS d_x,
+         COALESCE(s.d_ax, 0) AS d_ax
+  FROM questions q LEFT JOIN exercise_stats s ON s.exercise_id = q.exercise_id
+"""
+
+_STATS_SUMS = ("n_attempts", "score_sum", "score_sq_sum", "n_first", "first_correct",
+               "d_n", "d_a", "d_aa", "d_x", "d_ax")
+
+def _merged_stats(where: str, args: List[Any]) -> List[Dict[str, Any]]:
+    """Raw exercise_stats rows; every column is a sum, so shards merge by adding them up."""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for shard in user_dbs():
+        with _con(shard) as con:
+            for r in con.execute(_STATS_SELECT + where + " ORDER BY q.exercise_id", args):
+                m = merged.get(r["exercise_id"])
+                if m is None:
+                    merged[r["exercise_id"]] = dict(r)
+                else:
+                    for k in _STATS_SUMS:
+                        m[k] += r[k]
+    return list(merged.values())
+
+@traced()
+def get_exercise_stats(exercise_id: str) -> Optional[Dict[str, Any]]:
+    """None for an unknown exercise; zero counts if it was never attempted."""
+    rows = _merged_stats(" WHERE q.exercise_id = ?", [exercise_id])
+    return derive_exercise_stats(rows[0]) if rows else None
+
+@traced()
+def list_exercise_stats(topic: Optional[str] = None, exercise_ids: Optional[Iterable[str]] = None,
+                        min_attempts: int = 0) -> List[Dict[str, Any]]:
+    where, args = ["1=1"], []
+    if topic:
+        where.append("q.topic_pred = ?")
+        args.append(topic)
+    if exercise_ids is not None:
+        ids = list(exercise_ids)
+        if not ids:
+            return []
+        where.append(f"q.exercise_id IN ({','.join('?' * len(ids))})")
+        args.extend(ids)
+    try:
+        rows = _merged_stats(" WHERE " + " AND ".join(where), args)
+    except sqlite3.OperationalError as e:
+        if "no such table" not in str(e):   # only a schema older than exercise_stats
+            raise                           # (init_db not run) means "no stats yet"
+        return []
+    return [derive_exercise_stats(r) for r in rows if r["n_attempts"] >= min_attempts]
+
+# --------------------------- Grading thresholds ---------------------------
+@traced()
+def load_thresholds() -> Dict[str, float]:
+    with _con() as con:
+        cur = con.cursor()
+        cur.execute("SELECT topic, threshold FROM grade_thresholds")
+        return {r["topic"]: float(r["threshold"]) for r in cur.fetchall()}
+
+def save_thresholds(fitted: Dict[str, Dict[str, Any]], replace: bool = True) -> None:
+    """fitted = {topic: {"threshold", "n", "f1"}}; replace=True drops topics not in `fitted`."""
+    now = time.time()
+    with _con() as con:
+        cur = con.cursor()
+        if replace:
+            cur.execute("DELETE FROM grade_thresholds")
+        cur.executemany("""
+          INSERT INTO grade_thresholds(topic, threshold, n, f1, updated_ts)
+          VALUES(?,?,?,?,?)
+          ON CONFLICT(topic) DO UPDATE SET
+            threshold=excluded.threshold, n=excluded.n, f1=excluded.f1, updated_ts=excluded.updated_ts
+        """, [(t, float(v["threshold"]), int(v.get("n", 0)), float(v.get("f1", 0.0)), now)
+              for t, v in fitted.items()])
+        bump_generation(cur, "thresholds")     # other API workers reload their in-memory table
@@ -0,0 +1,136 @@
+# reconstrucción completa de exercise_stats (dificultad y discriminación por ejercicio)
+#   - save_attempt() la mantiene al día de forma incremental (db.update_exercise_stats);
+#     esto la recalcula desde cero: tras importar/borrar intentos o cambiar la definición
+#   - los intentos se leen por bloques de usuarios (ORDER BY user_id, ts) y cada bloque se
+#     agrega con NumPy: cumsum por usuario para la habilidad previa, np.unique para el primer
+#     intento de cada (usuario, ejercicio), np.bincount por ejercicio para las sumas
+#   - mismas definiciones que la versión incremental: habilidad = media de los scores previos
+#     del usuario (NULL cuenta como 0), x = acierto en el primer intento
+#   - la escritura bloquea a los demás escritores (BEGIN IMMEDIATE) para no perder intentos
+#   - con DB_SHARDS cada shard reconstruye su propia tabla (los usuarios no cruzan shards y
+#     todas las columnas son sumas: list_exercise_stats() las suma al leer)
+#
+# CLI:  python -m mqth_q.exercise_stats [--chunk-users 500]
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from typing import Dict, Optional, Sequence
+
+from .db import connect, init_db, user_dbs
+
+CHUNK_USERS = 500
+FIELDS = ("n_attempts", "score_sum", "score_sq_sum", "n_first", "first_correct",
+          "d_n", "d_a", "d_aa", "d_x", "d_ax")
+
+
+def aggregate_chunk(uid, ex, score, correct, n_ex: int):
+    """
+    Sums per exercise code for attempts sorted by (user, time).
+    Returns an array of shape (n_ex, len(FIELDS)).
+    """
+    import numpy as np
+    n = len(uid)
+    out = np.zeros((n_ex, len(FIELDS)))
+    if n == 0:
+        return out
+    score = np.nan_to_num(np.asarray(score, dtype=np.float64))
+    correct = np.asarray(correct, dtype=np.float64)
+
+    # position of each row within its user's run and the user's score total before it
+    start = np.r_[True, uid[1:] != uid[:-1]]
+    run_start = np.maximum.accumulate(np.where(start, np.arange(n), 0))
+    csum = np.cumsum(score)
+    prev_n = np.arange(n) - run_start
+    prev_sum = csum - score - (csum[run_start] - score[run_start])
+
+    # first try of each (user, exercise): rows are time-ordered, np.unique keeps the first index
+    _, first_idx = np.unique(uid.astype(np.int64) * n_ex + ex, return_index=True)
+    first = np.zeros(n, dtype=bool)
+    first[first_idx] = True
+    has_a = first & (prev_n > 0)
+    a = np.divide(prev_sum, prev_n, out=np.zeros(n), where=prev_n > 0)
+    x = correct * has_a
+
+    cols = (np.ones(n), score, score * score, first, correct * first,
+            has_a, a * has_a, a * a * has_a, x, a * x)
+    for j, w in enumerate(cols):
+        out[:, j] = np.bincount(ex, weights=w, minlength=n_ex)
+    return out
+
+
+def rebuild(chunk_users: int = CHUNK_USERS, log=print) -> Dict[str, int]:
+    t0 = time.perf_counter()
+    init_db()
+    stats = {"attempts": 0, "users": 0, "exercises": 0}
+    seen: set = set()
+    for shard in user_dbs():
+        part, exercises = _rebuild_db(shard, chunk_users)
+        stats["attempts"] += part["attempts"]
+        stats["users"] += part["users"]
+        seen.update(exercises)
+    stats["exercises"] = len(seen)
+    log(f"exercise_stats rebuilt in {time.perf_counter() - t0:.2f}s: {stats}")
+    return stats
+
+
+def _rebuild_db(shard: Optional[int], chunk_users: int):
+    import numpy as np
+    con = connect(shard)
+    con.isolation_level = None
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        codes: Dict[str, int] = {r[0]: i for i, r in enumerate(con.execute("SELECT exercise_id FROM questions"))}
+        users = [r[0] for r in con.execute("SELECT DISTINCT user_id FROM attempts ORDER BY user_id")]
+        totals: Optional["np.ndarray"] = None
+        n_rows = 0
+        for i in range(0, len(users), chunk_users):
+            lo, hi = users[i], users[min(i + chunk_users, len(users)) - 1]
+            rows = con.execute("""
+              SELECT user_id, exercise_id, score, correct FROM attempts
+              WHERE user_id BETWEEN ? AND ? ORDER BY user_id, ts, attempt_id
+            """, (lo, hi)).fetchall()
+            n_rows += len(rows)
+            uid = np.fromiter((r[0] for r in rows), np.int64, len(rows))
+            ex = np.fromiter((codes.setdefault(r[1], len(codes)) for r in rows), np.int64, len(rows))
+            score = np.array([r[2] for r in rows], dtype=np.float64)
+            correct = np.fromiter((r[3] or 0 for r in rows), np.float64, len(rows))
+            part = aggregate_chunk(uid, ex, score, correct, len(codes))
+            if totals is None:
+                totals = part
+            else:
+                totals = np.vstack([totals, np.zeros((len(codes) - len(totals), len(FIELDS)))]) + part
+        names = list(codes)
+        present = [] if totals is None else [names[k] for k in np.flatnonzero(totals[:, 0])]
+        now = time.time()
+        con.execute("DELETE FROM exercise_stats")
+        if totals is not None:
+            con.executemany(f"""
+              INSERT INTO exercise_stats(exercise_id, {", ".join(FIELDS)}, updated_ts)
+              VALUES(?, {", ".join("?" * len(FIELDS))}, ?)
+            """, [(names[k], *[int(v) if f in ("n_attempts", "n_first", "first_correct", "d_n") else float(v)
+                               for f, v in zip(FIELDS, totals[k])], now)
+                  for k in np.flatnonzero(totals[:, 0])])
+        con.execute("COMMIT")
+    except BaseException:
+        if con.in_transaction:
+            con.execute("ROLLBACK")
+        raise
+    finally:
+        con.close()
+    return {"attempts": n_rows, "users": len(users)}, present
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m mqth_q.exercise_stats",
+                                 description="Rebuild per-exercise difficulty statistics from all attempts.")
+    ap.add_argument("--chunk-users", type=int, default=CHUNK_USERS)
+    args = ap.parse_args(argv)
+    rebuild(chunk_users=args.chunk_users)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
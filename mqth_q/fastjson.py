@@ -0,0 +1,160 @@
+# serialización rápida de respuestas (modo opcional FAST_JSON)
+#   - dumps(): orjson si está instalado (bytes, UTF-8, compacto); si no, json estándar
+#   - CardCache: bytes JSON ya codificados de cada tarjeta de pregunta, válidos por versión
+#     del catálogo; una lista de tarjetas se arma uniendo bytes (sin validar ni re-codificar)
+#   - benchmark por endpoint: ruta estándar de FastAPI (validación pydantic + json) vs rápida
+#
+# CLI:  python -m mqth_q.fastjson [--n 2000] [--json reports/serialization.json]
+
+from __future__ import annotations
+
+import argparse
+from collections import OrderedDict
+import json
+from pathlib import Path
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional: plain json fallback
+    orjson = None
+
+from .config import HTTP_CACHE_SIZE
+
+HAVE_ORJSON = orjson is not None
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def json_array(parts: Sequence[bytes]) -> bytes:
+    """Join already-encoded JSON values into one array."""
+    return b"[" + b",".join(parts) + b"]"
+
+
+class CardCache:
+    """LRU of encoded question cards: exercise_id -> (catalog version, bytes)."""
+
+    def __init__(self, max_entries: int = HTTP_CACHE_SIZE):
+        self.max_entries = max(0, int(max_entries))
+        self._data: "OrderedDict[str, Tuple[Any, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, ids: Sequence[str], version: Any,
+                 load: Callable[[List[str]], List[Dict[str, Any]]]) -> bytes:
+        """
+        JSON array of the cards for `ids` (in order). Misses are loaded in one `load(missing)`
+        call; ids that `load` does not return are skipped, like next_questions_for does.
+        """
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            for ex in ids:
+                item = self._data.get(ex)
+                if item is not None and version is not None and item[0] == version:
+                    self._data.move_to_end(ex)
+                    found[ex] = item[1]
+            missing = [ex for ex in dict.fromkeys(ids) if ex not in found]
+            self.hits += len(found)
+            self.misses += len(missing)
+        if missing:
+            fresh = {c["exercise_id"]: dumps(c) for c in load(missing)}
+            found.update(fresh)
+            if version is not None and self.max_entries:
+                with self._lock:
+                    for ex, body in fresh.items():
+                        self._data[ex] = (version, body)
+                        self._data.move_to_end(ex)
+                    while len(self._data) > self.max_entries:
+                        self._data.popitem(last=False)
+        return json_array([found[ex] for ex in ids if ex in found])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses,
+                "orjson": HAVE_ORJSON}
+
+
+# ---------------- benchmark ----------------
+def _fake_card(i: int) -> Dict[str, Any]:
+    return {"exercise_id": f"General_2020-01-{i % 28 + 1:02d}_Exercise_{i % 6 + 1}",
+            "question": "Let (X, d) be a complete metric space and f: X → X a contraction. " * 4,
+            "topic": "banach_contraction_theorem", "date": "2020-01-15", "exam_type": "General"}
+
+def _fake_attempt(i: int) -> Dict[str, Any]:
+    return {"ts": 1.7e9 + i, "exercise_id": f"General_2020-01-15_Exercise_{i % 6 + 1}",
+            "topic": "metric_spaces", "score": 0.5 + (i % 50) / 100, "correct": bool(i % 2)}
+
+def _timeit(fn: Callable[[], Any], n: int) -> float:
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6      # µs per call
+
+def benchmark(n: int = 2000) -> List[Dict[str, Any]]:
+    """Serialization cost per endpoint shape: FastAPI's default path vs the FAST_JSON path."""
+    from app import QuestionCard, SearchOut
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+
+    def standard(adapter: Optional[TypeAdapter], data):
+        # serialize_response: validate against response_model, dump, then JSONResponse.render
+        content = adapter.dump_python(adapter.validate_python(data), mode="json") if adapter else jsonable_encoder(data)
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+    cards = [_fake_card(i) for i in range(5)]
+    attempts = [_fake_attempt(i) for i in range(1000)]
+    search = {"query": "contraction", "total": 120, "limit": 20, "offset": 0,
+              "items": [{**{k: c[k] for k in ("exercise_id", "topic", "date", "exam_type")},
+                         "snippet": "… a [contraction] on a complete …", "rank": -3.2} for c in map(_fake_card, range(20))]}
+
+    cache = CardCache()
+    ids = [c["exercise_id"] for c in cards]
+    by_id = {c["exercise_id"]: c for c in cards}
+    cache.get_many(ids, 1, lambda miss: [by_id[x] for x in miss])
+
+    cards_model, search_model = TypeAdapter(List[QuestionCard]), TypeAdapter(SearchOut)   # built once, like FastAPI
+    cases = [
+        ("GET /questions/next (k=5)", lambda: standard(cards_model, cards),
+         lambda: cache.get_many(ids, 1, lambda miss: [by_id[x] for x in miss])),
+        ("GET /users/{u}/attempts?limit=1000", lambda: standard(None, attempts), lambda: dumps(attempts)),
+        ("GET /questions/search (20 hits)", lambda: standard(search_model, search), lambda: dumps(search)),
+    ]
+    rows = []
+    for name, slow, fast in cases:
+        assert json.loads(slow()) == json.loads(fast())
+        std_us, fast_us = _timeit(slow, n), _timeit(fast, n)
+        rows.append({"endpoint": name, "standard_us": round(std_us, 1), "fast_us": round(fast_us, 1),
+                     "speedup": round(std_us / fast_us, 1) if fast_us else None})
+    return rows
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m mqth_q.fastjson", description="Response serialization benchmark.")
+    ap.add_argument("--n", type=int, default=2000, help="Iterations per case")
+    ap.add_argument("--json", type=Path, default=None, help="Write results here")
+    args = ap.parse_args(argv)
+
+    rows = benchmark(args.n)
+    print(f"orjson: {'yes' if HAVE_ORJSON else 'no (json fallback)'}")
+    print(f"{'endpoint':<38} {'standard µs':>12} {'fast µs':>9} {'x':>6}")
+    for r in rows:
+        print(f"{r['endpoint']:<38} {r['standard_us']:>12.1f} {r['fast_us']:>9.1f} {r['speedup']:>6}")
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        args.json.write_text(json.dumps({"orjson": HAVE_ORJSON, "n": args.n, "rows": rows}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
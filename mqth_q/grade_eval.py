@@ -1,136 +1,299 @@
 # ===== Golden set evaluation (baseline + optional LLM) =====
-import time, os, warnings
-import numpy as np
-import pandas as pd
+# CLI:  python -m mqth_q.grade_eval [--llm] [--workers 4] [--checkpoint reports/golden_eval.parquet]
+#   - soluciones en una sola consulta (fetch_questions)
+#   - baseline vectorizado por lotes (baseline_grade_batch)
+#   - LLM en un pool acotado de hilos
+#   - checkpoint en Parquet: si se interrumpe, se reanuda donde quedó
+#   - calibración vectorizada (global + por tema); --save-thresholds las guarda en la DB
+#   - --snapshot: lee las soluciones de la réplica de analítica (mqth_q.snapshot), no de la DB viva
+#   - --profile: perfil por muestreo de toda la ejecución (mqth_q.profiling) en PROFILE_DIR
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+import hashlib
+import os
 from pathlib import Path
+import sys
+import time
+from typing import Dict, List, Optional, Sequence
+import warnings
 
-from dotenv import load_dotenv, find_dotenv
-load_dotenv(find_dotenv(usecwd=True))
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, classification_report, precision_recall_fscore_support
 
-from sklearn.metrics import accuracy_score, precision_recall_fscore_support, confusion_matrix, classification_report, roc_auc_score
+from .baseline import baseline_grade_batch
+from .calibration import (
+    GLOBAL_KEY,
+    best_threshold,
+    curves,
+    fit_thresholds,
+    reload_thresholds,
+    roc_auc,
+)
+from .config import CALIBRATION_MIN_ROWS
 
 # --- project imports ---
-from .db import fetch_question
-from .baseline import baseline_grade
-from .grading import llm_grade_and_feedback  # optional
-
-# ------------- config -------------
-GOLDEN_PATH = Path("data/golden/golden.csv")  # move/adjust if needed
-THRESHOLDS = np.round(np.linspace(0.30, 0.85, 23), 2)  # sweep range for baseline
-RUN_LLM = False        # set True to evaluate a small LLM subset
-LLM_SUBSET = 8         # how many rows to test with LLM (keep small)
+from .db import fetch_questions, save_thresholds
+from .grading import llm_grade_and_feedback
+from .profiling import profiled
+from .snapshot import reading as reading_snapshot
+
+# ------------- defaults -------------
+GOLDEN_PATH = Path("data/golden/golden.csv")
+CHECKPOINT_PATH = Path("reports/golden_eval.parquet")
+BASELINE_BATCH = 256
+LLM_WORKERS = 4
 LLM_TIMEOUT = 30       # seconds per call
+CHECKPOINT_EVERY = 20  # LLM rows between checkpoint writes
+
+LABEL_MAP = {"correct": 1, "partial": 0, "incorrect": 0}
+RESULT_COLS = ["row_key", "baseline_score", "baseline_sec",
+               "llm_score", "llm_pred", "llm_sec", "llm_ok"]
 
 # ------------- load & join with solutions -------------
-assert GOLDEN_PATH.exists(), f"Golden file not found at {GOLDEN_PATH}"
-df = pd.read_csv(GOLDEN_PATH)
+def _row_keys(df: pd.DataFrame) -> List[str]:
+    """Content hash per golden row (+ occurrence counter so duplicates stay distinct)."""
+    seen: Dict[str, int] = {}
+    keys = []
+    for ex, ans, lab in zip(df["exercise_id"].astype(str), df["student_answer"].fillna("").astype(str), df["label"]):
+        h = hashlib.sha1(f"{ex}\x00{ans}\x00{lab}".encode("utf-8")).hexdigest()[:16]
+        n = seen.get(h, 0)
+        seen[h] = n + 1
+        keys.append(f"{h}-{n}")
+    return keys
+
+def load_golden(path: Path) -> pd.DataFrame:
+    if not path.exists():
+        raise FileNotFoundError(f"Golden file not found at {path}")
+    df = pd.read_csv(path)
+
+    # map labels to binary: correct=1, partial/incorrect=0
+    if not set(df["label"]).issubset(LABEL_MAP.keys()):
+        raise ValueError(f"Unexpected labels in golden set: {set(df['label']) - set(LABEL_MAP)}")
+    df["y_true"] = df["label"].map(LABEL_MAP).astype(int)
+
+    # attach question & solution in one query (warn if any exercise_id is missing)
+    qs = fetch_questions(df["exercise_id"].astype(str))
+    missing = sorted(set(df["exercise_id"].astype(str)) - set(qs))
+    if missing:
+        warnings.warn(f"{len(missing)} exercise_id not found in DB. They will be dropped:\n{missing}")
+    df["solution"] = [qs.get(str(ex), {}).get("solution") for ex in df["exercise_id"]]
+    df["question"] = [qs.get(str(ex), {}).get("question") for ex in df["exercise_id"]]
+    df["topic"] = [qs.get(str(ex), {}).get("topic") for ex in df["exercise_id"]]
+    df = df.dropna(subset=["solution"]).reset_index(drop=True)
+    if len(df) == 0:
+        raise ValueError("No rows left after matching solutions. Fix exercise_id values.")
+    df["row_key"] = _row_keys(df)
+    return df
+
+# ------------- checkpoint -------------
+def load_checkpoint(path: Optional[Path]) -> pd.DataFrame:
+    if path is not None and path.exists():
+        ck = pd.read_parquet(path)
+        return ck.drop_duplicates("row_key", keep="last").set_index("row_key")
+    return pd.DataFrame(columns=RESULT_COLS).set_index("row_key")
+
+def save_checkpoint(results: pd.DataFrame, path: Optional[Path]) -> None:
+    if path is None:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    results.reset_index().to_parquet(tmp, index=False)
+    os.replace(tmp, path)   # atomic: a crash never leaves a half-written checkpoint
+
+# ------------- baseline (vectorized batches) -------------
+def run_baseline(df: pd.DataFrame, results: pd.DataFrame, batch: int = BASELINE_BATCH) -> pd.DataFrame:
+    todo = df[~df["row_key"].isin(results.index[results["baseline_score"].notna()])]
+    for i in range(0, len(todo), batch):
+        part = todo.iloc[i:i + batch]
+        t0 = time.perf_counter()
+        graded = baseline_grade_batch(part["solution"].tolist(), part["student_answer"].fillna("").tolist())
+        # vectorized: no per-row time exists, each row stores its share of the batch time
+        per_row = (time.perf_counter() - t0) / max(1, len(part))
+        for key, g in zip(part["row_key"], graded):
+            results.loc[key, "baseline_score"] = float(g["score"])
+            results.loc[key, "baseline_sec"] = per_row
+    return results
+
+# ------------- LLM (bounded pool) -------------
+def _llm_one(row: Dict, timeout: float) -> Dict:
+    t0 = time.perf_counter()
+    g = llm_grade_and_feedback(
+        question=row["question"] or "",
+        solution=row["solution"] or "",
+        student=row["student_answer"] or "",
+        timeout=timeout,
+        exercise_id=str(row["exercise_id"]),
+    )
+    dt = time.perf_counter() - t0
+    if g is None:
+        return {"llm_score": np.nan, "llm_pred": np.nan, "llm_sec": dt, "llm_ok": False}
+    return {"llm_score": float(g["score"]), "llm_pred": 1.0 if g.get("correct") else 0.0, "llm_sec": dt, "llm_ok": True}
 
-# map labels to binary: correct=1, partial/incorrect=0
-label_map = {"correct": 1, "partial": 0, "incorrect": 0}
-if not set(df["label"]).issubset(label_map.keys()):
-    raise ValueError(f"Unexpected labels in golden set: {set(df['label']) - set(label_map)}")
+def run_llm(df: pd.DataFrame, results: pd.DataFrame, workers: int = LLM_WORKERS,
+            timeout: float = LLM_TIMEOUT, limit: Optional[int] = None,
+            checkpoint: Optional[Path] = None, every: int = CHECKPOINT_EVERY) -> pd.DataFrame:
+    # rows that failed (timeouts, breaker open) are retried on the next run
+    done = set(results.index[results["llm_ok"] == True]) if "llm_ok" in results else set()  # noqa: E712
+    todo = df[~df["row_key"].isin(done)]
+    if limit is not None:
+        todo = todo.head(max(0, limit - len(done)))
+    if todo.empty:
+        return results
 
-df["y_true"] = df["label"].map(label_map).astype(int)
+    print(f"LLM grading {len(todo)} rows with {workers} workers ({len(done)} already done)")
+    n = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futs = {pool.submit(_llm_one, row, timeout): row["row_key"] for row in todo.to_dict("records")}
+        try:
+            for fut in as_completed(futs):
+                for col, val in fut.result().items():
+                    results.loc[futs[fut], col] = val
+                n += 1
+                if n % every == 0:
+                    save_checkpoint(results, checkpoint)
+                    print(f"  {n}/{len(todo)} LLM rows")
+        except KeyboardInterrupt:
+            for f in futs:
+                f.cancel()
+            save_checkpoint(results, checkpoint)
+            raise
+    return results
 
-# attach question & solution (warn if any exercise_id is missing)
-solutions, questions, missing = [], [], []
-for ex in df["exercise_id"]:
-    q = fetch_question(str(ex))
-    if q is None:
-        solutions.append(None); questions.append(None); missing.append(ex)
-    else:
-        solutions.append(q["solution"]); questions.append(q["question"])
+def _latency_line(name: str, xs: Sequence[float]) -> str:
+    xs = np.asarray(xs, dtype=float)
+    xs = xs[~np.isnan(xs)]
+    if xs.size == 0:
+        return f"{name} latency: n/a"
+    p50, p90, p95, p99 = np.percentile(xs, [50, 90, 95, 99])
+    return (f"{name} latency per row (n={xs.size}): mean={xs.mean():.4f}s p50={p50:.4f}s "
+            f"p90={p90:.4f}s p95={p95:.4f}s p99={p99:.4f}s max={xs.max():.4f}s")
 
-if missing:
-    warnings.warn(f"{len(missing)} exercise_id not found in DB. They will be dropped:\n{missing}")
+def _batch_latency_line(name: str, xs: Sequence[float]) -> str:
+    """Total and mean only: rows graded in one batch share its time, so no percentiles."""
+    xs = np.asarray(xs, dtype=float)
+    xs = xs[~np.isnan(xs)]
+    if xs.size == 0:
+        return f"{name} latency: n/a"
+    return (f"{name} latency (vectorized batches, n={xs.size}): total={xs.sum():.4f}s "
+            f"mean per row={xs.mean():.6f}s")
 
-df["solution"] = solutions
-df["question"] = questions
-df = df.dropna(subset=["solution"]).reset_index(drop=True)
-assert len(df) > 0, "No rows left after matching solutions. Fix exercise_id values."
+def report(df: pd.DataFrame, min_rows: int = CALIBRATION_MIN_ROWS) -> Dict:
+    y = df["y_true"].values
+    s = df["baseline_score"].values.astype(float)
 
-print(f"Golden rows ready: {len(df)}")
+    # full PR/ROC over every unique score in one sort (see calibration.curves)
+    c = curves(y, s)
+    best = best_threshold(y, s)
+    print("\n=== Baseline threshold calibration (tuned on golden) ===")
+    print(f"Unique thresholds evaluated: {c['threshold'].size}")
+    print(f"Best threshold: {best['threshold']:.3f}")
+    print(f"Accuracy: {best['accuracy']:.3f} | Precision: {best['precision']:.3f} | Recall: {best['recall']:.3f} | F1: {best['f1']:.3f}")
+    print(f"Confusion (tn fp fn tp): {best['tn']} {best['fp']} {best['fn']} {best['tp']}")
 
-# ------------- baseline scores -------------
-def _safe_baseline_score(sol, stu):
+    # optional: ROC-AUC of baseline score (threshold-free)
+    auc = roc_auc(c)
+    if auc is not None:
+        print(f"ROC-AUC (baseline score): {auc:.3f}")
+
+    fitted = fit_thresholds(y, s, df["topic"].tolist(), min_rows=min_rows)
+    print(f"\nPer-topic thresholds (min {min_rows} rows; others use the global one):")
+    for topic, v in sorted(fitted.items()):
+        if topic != GLOBAL_KEY:
+            print(f"  {topic:<30} thr={v['threshold']:.3f}  n={v['n']:<4} F1={v['f1']:.3f}")
+    best["fitted"] = fitted
+
+    # show a compact classification report at best threshold
+    y_pred_best = (s >= best["threshold"]).astype(int)
+    print("\nClassification report @ best threshold:")
+    print(classification_report(y, y_pred_best, target_names=["not-correct","correct"], zero_division=0))
+    print(_batch_latency_line("Baseline", df["baseline_sec"]))
+
+    if "llm_ok" in df and df["llm_ok"].notna().any():
+        sub = df[df["llm_ok"] == True]  # noqa: E712 (object column after resume)
+        print("\n=== LLM ===")
+        print(f"LLM rows attempted={int(df['llm_ok'].notna().sum())} ok={len(sub)}")
+        if len(sub):
+            yp = sub["llm_pred"].astype(int).values
+            acc = accuracy_score(sub["y_true"], yp)
+            pr, rc, f1, _ = precision_recall_fscore_support(sub["y_true"], yp, average="binary", zero_division=0)
+            print(f"LLM n={len(sub)} | Acc={acc:.3f} P={pr:.3f} R={rc:.3f} F1={f1:.3f}")
+        print(_latency_line("LLM", df.loc[df["llm_ok"].notna(), "llm_sec"]))
+
+    # ------------- suggestion -------------
+    print("\n>>> Suggested GRADE_THRESHOLD for .env:", best["threshold"])
+    return best
+
+# ------------- entry point -------------
+def evaluate(golden: Path = GOLDEN_PATH, checkpoint: Optional[Path] = CHECKPOINT_PATH,
+             llm: bool = False, workers: int = LLM_WORKERS, timeout: float = LLM_TIMEOUT,
+             limit: Optional[int] = None, batch: int = BASELINE_BATCH,
+             save: bool = False, snapshot: bool = False) -> pd.DataFrame:
+    with reading_snapshot() if snapshot else nullcontext():
+        df = load_golden(golden)
+    print(f"Golden rows ready: {len(df)}")
+
+    results = load_checkpoint(checkpoint)
+    for col in RESULT_COLS[1:]:
+        if col not in results:
+            results[col] = np.nan
+    results = results.astype({"llm_ok": object})
+
+    t0 = time.perf_counter()
+    results = run_baseline(df, results, batch=batch)
+    print(f"Computed baseline scores for {len(df)} rows in {time.perf_counter() - t0:.2f}s")
+    save_checkpoint(results, checkpoint)
+
+    if llm:
+        results = run_llm(df, results, workers=workers, timeout=timeout, limit=limit, checkpoint=checkpoint)
+        save_checkpoint(results, checkpoint)
+
+    out = df.merge(results.reset_index(), on="row_key", how="left")
+    out = out.dropna(subset=["baseline_score"]).reset_index(drop=True)
+    best = report(out)
+    if save:
+        save_thresholds(best["fitted"])
+        reload_thresholds()
+        print(f"Saved {len(best['fitted'])} thresholds to grade_thresholds.")
+    return out
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    from dotenv import find_dotenv, load_dotenv
+    load_dotenv(find_dotenv(usecwd=True))
+
+    ap = argparse.ArgumentParser(prog="python -m mqth_q.grade_eval", description="Evaluate graders on the golden set.")
+    ap.add_argument("--golden", type=Path, default=GOLDEN_PATH)
+    ap.add_argument("--checkpoint", type=Path, default=CHECKPOINT_PATH, help="Parquet file used to resume runs")
+    ap.add_argument("--no-checkpoint", action="store_true", help="Do not read or write a checkpoint")
+    ap.add_argument("--fresh", action="store_true", help="Ignore an existing checkpoint and start over")
+    ap.add_argument("--llm", action="store_true", help="Also grade every row with the LLM")
+    ap.add_argument("--limit", type=int, default=None, help="Max LLM rows (default: all)")
+    ap.add_argument("--workers", type=int, default=LLM_WORKERS)
+    ap.add_argument("--timeout", type=float, default=LLM_TIMEOUT)
+    ap.add_argument("--batch", type=int, default=BASELINE_BATCH)
+    ap.add_argument("--save-thresholds", action="store_true",
+                    help="Store the global + per-topic thresholds in the DB (grade_thresholds)")
+    ap.add_argument("--snapshot", action="store_true",
+                    help="Read questions from the analytics snapshot instead of the live DB")
+    ap.add_argument("--profile", action="store_true",
+                    help="Sample the run and write a speedscope/flamegraph profile to PROFILE_DIR")
+    args = ap.parse_args(argv)
+
+    ck = None if args.no_checkpoint else args.checkpoint
+    if ck is not None and args.fresh and ck.exists():
+        ck.unlink()
     try:
-        return float(baseline_grade(sol, stu)["score"])
-    except Exception as e:
-        warnings.warn(f"Baseline failed on a row: {e}")
-        return np.nan
-
-t0 = time.perf_counter()
-df["baseline_score"] = [ _safe_baseline_score(sol, ans) for sol, ans in zip(df["solution"], df["student_answer"]) ]
-dt = time.perf_counter() - t0
-df = df.dropna(subset=["baseline_score"]).reset_index(drop=True)
-print(f"Computed baseline scores for {len(df)} rows in {dt:.2f}s")
-
-# ------------- threshold sweep -------------
-def evaluate_threshold(y_true, scores, thr):
-    y_pred = (scores >= thr).astype(int)
-    acc = accuracy_score(y_true, y_pred)
-    pr, rc, f1, _ = precision_recall_fscore_support(y_true, y_pred, average="binary", zero_division=0)
-    tn, fp, fn, tp = confusion_matrix(y_true, y_pred, labels=[0,1]).ravel()
-    return dict(threshold=float(thr), accuracy=acc, precision=pr, recall=rc, f1=f1, tp=int(tp), fp=int(fp), tn=int(tn), fn=int(fn))
-
-sweep = [evaluate_threshold(df["y_true"].values, df["baseline_score"].values, t) for t in THRESHOLDS]
-sweep_df = pd.DataFrame(sweep).sort_values("f1", ascending=False).reset_index(drop=True)
-
-best = sweep_df.iloc[0].to_dict()
-print("\n=== Baseline threshold selection (tuned on golden) ===")
-print(f"Best threshold: {best['threshold']:.2f}")
-print(f"Accuracy: {best['accuracy']:.3f} | Precision: {best['precision']:.3f} | Recall: {best['recall']:.3f} | F1: {best['f1']:.3f}")
-print(f"Confusion (tn fp fn tp): {best['tn']} {best['fp']} {best['fn']} {best['tp']}")
-
-# optional: ROC-AUC of baseline score (threshold-free)
-try:
-    auc = roc_auc_score(df["y_true"].values, df["baseline_score"].values)
-    print(f"ROC-AUC (baseline score): {auc:.3f}")
-except Exception:
-    pass
-
-# show a compact classification report at best threshold
-y_pred_best = (df["baseline_score"].values >= best["threshold"]).astype(int)
-print("\nClassification report @ best threshold:")
-print(classification_report(df["y_true"].values, y_pred_best, target_names=["not-correct","correct"], zero_division=0))
-
-# ------------- suggestion -------------
-print("\n>>> Suggested GRADE_THRESHOLD for .env:", best["threshold"])
-
-# ------------- OPTIONAL: quick LLM spot-check on a subset -------------
-if RUN_LLM:
-    print("\n=== LLM spot-check (subset) ===")
-    sub = df.sample(min(LLM_SUBSET, len(df)), random_state=42).copy()
-    preds, latencies = [], []
-
-    for i, row in sub.iterrows():
-        t0 = time.perf_counter()
-        g = llm_grade_and_feedback(
-            question=row["question"] or "",
-            solution=row["solution"] or "",
-            student=row["student_answer"] or "",
-            timeout=LLM_TIMEOUT
-        )
-        lat = time.perf_counter() - t0
-        latencies.append(lat)
-
-        if g is None:
-            preds.append(None)
-        else:
-            preds.append(1 if g.get("correct") else 0)
-
-    sub["y_pred_llm"] = preds
-    sub = sub.dropna(subset=["y_pred_llm"]).astype({"y_pred_llm": int})
-    if len(sub) == 0:
-        print("No LLM predictions returned (timeouts or errors).")
-    else:
-        acc = accuracy_score(sub["y_true"], sub["y_pred_llm"])
-        pr, rc, f1, _ = precision_recall_fscore_support(sub["y_true"], sub["y_pred_llm"], average="binary", zero_division=0)
-        print(f"LLM subset n={len(sub)} | Acc={acc:.3f} P={pr:.3f} R={rc:.3f} F1={f1:.3f}")
-        if latencies:
-            print(f"LLM latency: median={np.median(latencies):.2f}s, p95={np.percentile(latencies,95):.2f}s")
-
-    # show 2 examples
-    with pd.option_context('display.max_colwidth', 120):
-        print("\nSample rows (golden vs LLM correctness):")
-        print(sub[["exercise_id","label","student_answer","y_true","y_pred_llm"]].head(2))
+        with profiled("grade_eval") if args.profile else nullcontext() as prof:
+            evaluate(args.golden, ck, llm=args.llm, workers=args.workers,
+                     timeout=args.timeout, limit=args.limit, batch=args.batch,
+                     save=args.save_thresholds, snapshot=args.snapshot)
+        if prof is not None:
+            print(f"Profile: {prof.paths['speedscope']}")
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; progress saved to {ck}. Re-run to resume.", file=sys.stderr)
+        return 130
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
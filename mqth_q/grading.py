@@ -1,60 +1,218 @@
 # calificación base (text similarity)
 # LLM para feedback + ajuste de nota
 # expone entrypoint grade_best_with_feedback() -- combina ambos enfoques y luego guarda el intento
+# grade_best_streaming() -- igual, pero emite los tokens del LLM a medida que llegan
+# grade_best_batch() -- varias respuestas a la vez (hoja de examen): baseline vectorizado para
+#   todas y llamadas al LLM en paralelo en un pool acotado; latencia ~ la del ítem más lento
+# con exercise_id, las tres reutilizan antes el veredicto del LLM de una respuesta casi idéntica
+#   (mqth_q.near_dup) y entonces no llaman al LLM
 
 from __future__ import annotations
-import json, requests
-from typing import Dict, Optional
-import numpy as np
 
-from .config import OLLAMA_URL, OLLAMA_MODEL, LLM_OPTIONS
-from .baseline import baseline_grade 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from contextvars import copy_context
+import json
+import threading
+from typing import Callable, ContextManager, Dict, Iterator, List, Optional, Sequence, Tuple
 
-def llm_grade_and_feedback(question: str, solution: str, student: str, timeout: int = 60) -> Optional[Dict]:
-    prompt = f"""You grade a student's short math answer. Be brief and do not reveal full solutions.
+from .baseline import baseline_grade, baseline_grade_batch
+from .breaker import CircuitBreaker
+from .config import (
+    BATCH_LLM_WORKERS,
+    LLM_KEEP_ALIVE,
+    LLM_MAX_OUTPUT_TOKENS,
+    LLM_OPTIONS,
+    OLLAMA_MODEL,
+)
+from .near_dup import NEAR_DUPS, solution_fp
+from .prompt import build_grading_prompt
+from .router import LLM_ROUTER, NoBackendAvailable
+from .tracing import annotate, traced
 
-Question:
-{question}
+# Breaker agregado para todo el pool de Ollama (cada backend tiene además el suyo)
+LLM_BREAKER = CircuitBreaker("ollama")
 
-Reference solution:
-{solution}
+# todos los backends ocupados = carga (se degrada a baseline), no una caída: no cuenta como fallo;
+# NoHealthyBackend (ninguno sano) sí es una caída y abre el breaker agregado
+_SATURATED = (NoBackendAvailable,)
 
-Student answer:
-{student}
+# slot() envuelve solo la llamada al LLM (p.ej. admisión); por defecto el LLM siempre disponible
+Slot = Callable[[], ContextManager[bool]]
 
-Return ONLY valid compact JSON with EXACT keys:
-- "score": number 0..1
-- "correct": true/false
-- "explanation": one short sentence explaining the verdict
-- "hint": one short hint the student can try next (do NOT reveal the full solution)
-"""
+def _free_slot() -> ContextManager[bool]:
+    return nullcontext(True)
+
+def _stamped(g: Optional[Dict], solution: str) -> Optional[Dict]:
+    """Tag an LLM verdict with the solution it was given against (kept in feedback_json)."""
+    if g:
+        g["solution_fp"] = solution_fp(solution)
+    return g
+
+# num_predict acota la salida al presupuesto reservado en el prompt (si no viene en LLM_OPTIONS)
+_OPTIONS = {"num_predict": LLM_MAX_OUTPUT_TOKENS, **LLM_OPTIONS}
+
+def _parse_llm_json(raw: str) -> Dict:
+    """Normalize the model's JSON into the grader dict (raises on invalid JSON)."""
+    data = json.loads((raw or "").strip())
+
+    score = min(1.0, max(0.0, float(data.get("score", 0.0))))
+    correct = bool(data.get("correct", False))
+    reasons = (data.get("explanation") or "").strip()
+    hint = (data.get("hint") or "").strip()
+
+    return {
+        "score": score,
+        "correct": correct,
+        "cosine": None,
+        "jaccard": None,
+        "missing_keywords": [],
+        "reasons": reasons,
+        "hint": hint,
+    }
+
+@traced()
+def llm_grade_and_feedback(question: str, solution: str, student: str, timeout: Optional[float] = None,
+                           exercise_id: Optional[str] = None) -> Optional[Dict]:
+    """
+    Grade with the local LLM. Returns None when the LLM is unavailable so callers fall back.
+    Calls go through LLM_BREAKER (open -> None at once) and LLM_ROUTER, which picks the
+    least-loaded backend; `timeout=None` uses that backend's adaptive (p95-based) timeout.
+    Passing `exercise_id` lets the prompt builder reuse the compacted solution.
+    """
+    import requests
+
+    prompt = build_grading_prompt(question, solution, student, exercise_id=exercise_id).text
     try:
-        payload = {"model": OLLAMA_MODEL, "prompt": prompt, "stream": False, "format": "json", "options": LLM_OPTIONS}
-        r = requests.post(f"{OLLAMA_URL}/api/generate", json=payload, timeout=timeout)
-        r.raise_for_status()
-        raw = r.json().get("response", "").strip()
-        data = json.loads(raw)
-
-        score = float(np.clip(float(data.get("score", 0.0)), 0.0, 1.0))
-        correct = bool(data.get("correct", False))
-        reasons = (data.get("explanation") or "").strip()
-        hint = (data.get("hint") or "").strip()
-
-        return {
-            "score": score,
-            "correct": correct,
-            "cosine": None,
-            "jaccard": None,
-            "missing_keywords": [],
-            "reasons": reasons,
-            "hint": hint,
-        }
-    except Exception:
+        payload = {"model": OLLAMA_MODEL, "prompt": prompt, "stream": False, "format": "json",
+                   "options": _OPTIONS, "keep_alive": LLM_KEEP_ALIVE}
+        with LLM_BREAKER.guard(ignore=_SATURATED), LLM_ROUTER.acquire() as backend:
+            annotate(backend=backend.url)
+            r = requests.post(f"{backend.url}/api/generate", json=payload,
+                              timeout=timeout if timeout is not None else backend.timeout())
+            r.raise_for_status()
+        return _parse_llm_json(r.json().get("response", ""))
+    except Exception as e:   # includes BreakerOpen -> caller falls back to baseline
+        annotate(fallback=type(e).__name__)
         return None
 
-def grade_best_with_feedback(question: str, solution: str, student: str) -> Dict:
-    """Try LLM first; if it fails, fall back to the baseline grader."""
-    g = llm_grade_and_feedback(question, solution, student)
+def llm_stream_tokens(question: str, solution: str, student: str, timeout: Optional[float] = None,
+                      exercise_id: Optional[str] = None) -> Iterator[str]:
+    """
+    Yield response fragments from Ollama's streaming API (NDJSON, one chunk per line).
+    Raises BreakerOpen / NoBackendAvailable / NoHealthyBackend / requests errors; the whole
+    stream counts as one call on both the aggregate and the backend breaker (none if the
+    consumer closes it early).
+    `timeout` bounds the wait between chunks, not the full generation.
+    """
+    import requests
+
+    prompt = build_grading_prompt(question, solution, student, exercise_id=exercise_id).text
+    payload = {"model": OLLAMA_MODEL, "prompt": prompt, "stream": True, "format": "json",
+               "options": _OPTIONS, "keep_alive": LLM_KEEP_ALIVE}
+    with LLM_BREAKER.guard(ignore=_SATURATED), LLM_ROUTER.acquire() as backend:
+        with requests.post(f"{backend.url}/api/generate", json=payload, stream=True,
+                           timeout=timeout if timeout is not None else backend.timeout()) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(chunk["error"])
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    break
+
+@traced()
+def grade_best_with_feedback(question: str, solution: str, student: str,
+                             exercise_id: Optional[str] = None, topic: Optional[str] = None,
+                             use_llm: bool = True, slot: Optional[Slot] = None) -> Dict:
+    """
+    Reuse a near-duplicate's LLM verdict, else try the LLM; if it fails (or use_llm=False,
+    e.g. load shedding), use the baseline grader. Only the LLM call runs inside `slot()`
+    (e.g. an admission slot; yields False to skip the LLM), as in grade_best_batch.
+    """
+    g = NEAR_DUPS.lookup(exercise_id, student, solution)
     if g:
         return g
-    return baseline_grade(solution, student)
+    if use_llm:
+        with (slot or _free_slot)() as ok:
+            annotate(llm_admitted=ok)
+            g = _stamped(llm_grade_and_feedback(question, solution, student, exercise_id=exercise_id)
+                         if ok else None, solution)
+    if g:
+        return g
+    return baseline_grade(solution, student, topic=topic)
+
+def grade_best_streaming(question: str, solution: str, student: str,
+                         exercise_id: Optional[str] = None,
+                         topic: Optional[str] = None,
+                         use_llm: bool = True,
+                         slot: Optional[Slot] = None) -> Iterator[Tuple[str, object]]:
+    """
+    Streaming variant of grade_best_with_feedback. Yields ("token", str) while the LLM
+    generates, then exactly one ("result", dict). If the stream fails, the final text is
+    not valid JSON or use_llm=False, the result comes from the baseline grader; a reused
+    near-duplicate verdict is yielded at once, without tokens. `slot()` is held only while
+    the LLM streams.
+    """
+    parts = []
+    result: Optional[Dict] = NEAR_DUPS.lookup(exercise_id, student, solution)
+    try:
+        if use_llm and not result:
+            with (slot or _free_slot)() as ok:
+                annotate(llm_admitted=ok)
+                if ok:
+                    for tok in llm_stream_tokens(question, solution, student,
+                                                 exercise_id=exercise_id):
+                        parts.append(tok)
+                        yield "token", tok
+                    result = _stamped(_parse_llm_json("".join(parts)), solution)
+    except Exception:
+        result = None
+    if not result:
+        result = baseline_grade(solution, student, topic=topic)
+    yield "result", result
+
+# Hilos para las llamadas al LLM de los lotes; compartido por todas las peticiones del proceso
+_BATCH_POOL: Optional[ThreadPoolExecutor] = None
+_BATCH_POOL_LOCK = threading.Lock()
+
+def _batch_pool() -> ThreadPoolExecutor:
+    global _BATCH_POOL
+    with _BATCH_POOL_LOCK:
+        if _BATCH_POOL is None:
+            _BATCH_POOL = ThreadPoolExecutor(max_workers=max(1, BATCH_LLM_WORKERS),
+                                             thread_name_prefix="grade-batch")
+        return _BATCH_POOL
+
+@traced()
+def grade_best_batch(items: Sequence[Dict], use_llm: bool = True,
+                     slot: Optional[Slot] = None) -> List[Dict]:
+    """
+    Grade many answers at once. `items` are dicts with question, solution, student and
+    optionally exercise_id / topic; results come back in the same order.
+    The baseline runs for every item in one vectorized pass (it is also the fallback); with
+    use_llm the LLM calls run concurrently on a shared bounded pool, each one inside `slot()`
+    (e.g. an admission slot; yields False to skip the LLM for that item).
+    """
+    base = baseline_grade_batch([it["solution"] for it in items], [it["student"] for it in items],
+                                [it.get("topic") for it in items])
+    reused = [NEAR_DUPS.lookup(it.get("exercise_id"), it["student"], it["solution"]) for it in items]
+    if not use_llm or not items:
+        return [r or b for r, b in zip(reused, base)]
+    slot = slot or _free_slot
+
+    def _one(i: int) -> Dict:
+        it = items[i]
+        if reused[i]:
+            return reused[i]
+        with slot() as ok:
+            g = llm_grade_and_feedback(it["question"], it["solution"], it["student"],
+                                       exercise_id=it.get("exercise_id")) if ok else None
+        return _stamped(g, it["solution"]) or base[i]
+
+    ctxs = [copy_context() for _ in items]          # pool threads join the caller's trace
+    return list(_batch_pool().map(lambda i: ctxs[i].run(_one, i), range(len(items))))
@@ -0,0 +1,139 @@
+# historial de intentos en columnas (en vez de listas de dicts)
+#   - load_history(): una consulta, el cursor devuelve tuplas y se vuelcan a arrays NumPy
+#     (ts, score, correct) + códigos enteros internados para exercise_id y topic
+#   - agregados vectorizados con np.bincount / np.unique: último intento por ejercicio,
+#     medias y tasa de acierto por tema, resumen global
+#   - score/correct NULL -> NaN / máscara; topic NULL -> código -1
+# numpy se importa al cargar el historial (la API arranca sin él, ver startup.HEAVY_MODULES)
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from . import db
+from .tracing import traced
+
+if TYPE_CHECKING:
+    import numpy as np
+
+FETCH_CHUNK = 2048
+
+
+class AttemptHistory:
+    """Attempts of one user, newest first, as parallel arrays."""
+
+    __slots__ = ("ts", "score", "correct", "has_correct", "exercise", "topic", "exercises", "topics")
+
+    def __init__(self, ts: "np.ndarray", score: "np.ndarray", correct: "np.ndarray",
+                 has_correct: "np.ndarray", exercise: "np.ndarray", topic: "np.ndarray",
+                 exercises: List[str], topics: List[str]):
+        self.ts = ts                     # float64
+        self.score = score               # float64, NaN = no score
+        self.correct = correct           # int8 (0 where unknown)
+        self.has_correct = has_correct   # bool
+        self.exercise = exercise         # int32 codes into self.exercises
+        self.topic = topic               # int32 codes into self.topics, -1 = no topic
+        self.exercises = exercises
+        self.topics = topics
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def latest_per_exercise(self) -> "np.ndarray":
+        """Row index of the most recent attempt of each exercise."""
+        import numpy as np
+        # rows are newest first, so the first occurrence of each code is the latest attempt
+        _, first = np.unique(self.exercise, return_index=True)
+        return first
+
+    def recent_mistakes(self, limit: int = 10) -> List[str]:
+        """Exercises whose latest attempt is incorrect, most recent first."""
+        import numpy as np
+        idx = self.latest_per_exercise()
+        idx = idx[self.correct[idx] == 0]
+        idx = idx[np.argsort(-self.ts[idx], kind="stable")][:limit]
+        return [self.exercises[i] for i in self.exercise[idx]]
+
+    def by_topic(self, missing_as_zero: bool = True, unknown: Optional[str] = "unknown") -> List[Dict]:
+        """
+        {topic, n, avg_score, correct_rate} per topic, sorted by topic name.
+        missing_as_zero=True counts attempts without score/correct as 0 (dashboard semantics);
+        False ignores them. unknown=None drops attempts without a topic.
+        """
+        import numpy as np
+        k = len(self.topics)
+        none_code = self.topics.index(unknown) if unknown in self.topics else k
+        code = np.where(self.topic < 0, none_code, self.topic)    # slot k = no topic
+        scored = ~np.isnan(self.score)
+        score_w = np.where(scored, self.score, 0.0)
+        if missing_as_zero:
+            n = n_corr = np.bincount(code, minlength=k + 1)
+        else:
+            n = np.bincount(code, weights=scored, minlength=k + 1).astype(np.int64)
+            n_corr = np.bincount(code, weights=self.has_correct, minlength=k + 1).astype(np.int64)
+        sums = np.bincount(code, weights=score_w, minlength=k + 1)
+        hits = np.bincount(code, weights=self.correct, minlength=k + 1)
+        names = list(self.topics) + [unknown]
+        out = []
+        for t in np.flatnonzero(n):
+            if names[t] is None:
+                continue
+            out.append({
+                "topic": names[t],
+                "n": int(n[t]),
+                "avg_score": float(sums[t] / n[t]),
+                "correct_rate": float(hits[t] / n_corr[t]) if n_corr[t] else 0.0,
+            })
+        out.sort(key=lambda d: d["topic"])
+        return out
+
+    def overall(self) -> Dict:
+        import numpy as np
+        scored = self.score[~np.isnan(self.score)]
+        n_corr = int(self.has_correct.sum())
+        return {
+            "attempts": int(scored.size),
+            "correct_rate": float(self.correct[self.has_correct].sum() / n_corr) if n_corr else 0.0,
+            "avg_score": float(scored.mean()) if scored.size else 0.0,
+            "last_attempt_ts": float(np.nanmax(self.ts)) if len(self) else None,
+        }
+
+
+@traced()
+def load_history(user_id: int, limit: int = 10_000) -> AttemptHistory:
+    """Latest `limit` attempts of a user (newest first) straight from the cursor into arrays."""
+    import numpy as np
+    ex_codes: Dict[str, int] = {}
+    topic_codes: Dict[str, int] = {}
+    parts: List[tuple] = []
+    con = db.connect(db.shard_of(user_id))
+    con.row_factory = None       # plain tuples, no sqlite3.Row / dict per attempt
+    try:
+        cur = con.execute("""
+          SELECT a.ts, a.score, a.correct, a.exercise_id, q.topic_pred
+          FROM attempts a
+          JOIN questions q ON q.exercise_id = a.exercise_id
+          WHERE a.user_id = ?
+          ORDER BY a.ts DESC
+          LIMIT ?
+        """, (user_id, limit))
+        # chunks keep only FETCH_CHUNK row tuples alive at a time
+        while rows := cur.fetchmany(FETCH_CHUNK):
+            n = len(rows)
+            ts, score, correct, ex_ids, topics = zip(*rows)
+            parts.append((
+                np.array(ts, dtype=np.float64),
+                np.array(score, dtype=np.float64),                # None -> nan
+                np.fromiter((c or 0 for c in correct), np.int8, n),
+                np.fromiter((c is not None for c in correct), bool, n),
+                np.fromiter((ex_codes.setdefault(x, len(ex_codes)) for x in ex_ids), np.int32, n),
+                np.fromiter((-1 if t is None else topic_codes.setdefault(t, len(topic_codes))
+                             for t in topics), np.int32, n),
+            ))
+    finally:
+        con.close()
+
+    dtypes = (np.float64, np.float64, np.int8, bool, np.int32, np.int32)
+    cols = [np.concatenate([p[i] for p in parts]) if parts else np.zeros(0, dtype=dt)
+            for i, dt in enumerate(dtypes)]
+    return AttemptHistory(*cols, exercises=list(ex_codes), topics=list(topic_codes))
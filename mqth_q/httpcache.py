@@ -0,0 +1,99 @@
+# caché HTTP para endpoints de catálogo
+#   - ETag fuerte = hash(clave del recurso, versión) -> sin serializar para validar
+#   - If-None-Match -> 304 sin tocar servicio/DB; "*" solo tras comprobar que el recurso existe
+#   - ResponseCache: LRU de bytes ya serializados por (clave, etag)
+#   - VersionProbe: lee la versión (p.ej. catalog_version) como mucho cada `ttl` segundos
+# Las versiones viven en db.py (catalog_meta con triggers, conteo de intentos por usuario).
+
+from __future__ import annotations
+
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+from typing import Any, Callable, Optional, Tuple
+
+from .config import HTTP_CACHE_SIZE, HTTP_CACHE_VERSION_TTL
+
+
+def make_etag(*parts: Any) -> str:
+    raw = "\x1f".join(str(p) for p in parts).encode("utf-8")
+    return '"' + hashlib.blake2b(raw, digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    If-None-Match uses weak comparison: W/ prefixes are ignored. '*' is not handled here: it
+    matches only a resource that exists, which the caller knows (see is_any_etag).
+    """
+    if not if_none_match:
+        return False
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def is_any_etag(if_none_match: Optional[str]) -> bool:
+    """If-None-Match: * (any current representation)."""
+    return bool(if_none_match) and if_none_match.strip() == "*"
+
+
+class ResponseCache:
+    """Thread-safe LRU of encoded bodies; an entry is valid only for the etag it was stored with."""
+
+    def __init__(self, max_entries: int = HTTP_CACHE_SIZE):
+        self.max_entries = max(0, int(max_entries))
+        self._data: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, etag: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] != etag:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: str, etag: str, body: bytes) -> None:
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._data[key] = (etag, body)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def snapshot(self) -> dict:
+        return {"entries": len(self._data), "max_entries": self.max_entries,
+                "hits": self.hits, "misses": self.misses}
+
+
+class VersionProbe:
+    """Memoize a version getter for `ttl` seconds (0 = read on every call)."""
+
+    def __init__(self, fn: Callable[[], Any], ttl: float = HTTP_CACHE_VERSION_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.fn = fn
+        self.ttl = float(ttl)
+        self.clock = clock
+        self._value: Any = None
+        self._at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def __call__(self) -> Any:
+        with self._lock:
+            now = self.clock()
+            if self._at is None or now - self._at >= self.ttl:
+                self._value = self.fn()
+                self._at = now
+            return self._value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._at = None
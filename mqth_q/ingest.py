@@ -0,0 +1,295 @@
+# ingesta PDF -> SQLite (reemplaza 0_data.ipynb + 1_Seed_DB.ipynb)
+#   1) hash del contenido crudo de cada página (sin extraer texto)
+#   2) extracción de texto SOLO de páginas nuevas/cambiadas, en un pool de procesos
+#   3) agrupación en exámenes (cabecera "General|Midterm Exam ... <Mes> <d>, <yyyy>") y
+#      separación en ejercicios (Exercise N ... Solution ...)
+#   4) exámenes cuyo hash no cambió se saltan; el resto se escribe con upserts por lotes y se
+#      borran los ejercicios que el examen ya no tiene (el índice FTS sigue por sus triggers)
+#   5) en cargas masivas los índices del catálogo se crean al final
+#
+# CLI:  python -m mqth_q.ingest data/raw/exams.pdf [--workers 4] [--exclude General_2013-01-23] [--profile]
+# Re-ejecutar con el mismo PDF no escribe nada (idempotente). Los ejercicios nuevos o
+# cambiados se clasifican al final (mqth_q.topics) salvo --no-classify.
+
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+import hashlib
+import os
+import re
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .db import connect, create_indexes, drop_indexes, init_db
+from .profiling import profiled
+
+EXAM_RE = re.compile(r"(General|Midterm)\s+Exam.*?([A-Za-z]+\s+\d{1,2},\s+\d{4})", re.DOTALL)
+EXERCISE_SPLIT_RE = re.compile(r"Exercise\s*\d+")
+MAX_EXERCISES = 6        # exámenes con más "ejercicios" son falsos positivos del parser
+UPSERT_BATCH = 500
+SKIP_PAGES = 1           # portada
+
+
+# ---------------- text helpers (same rules as the notebooks) ----------------
+def clean_text(s: str) -> str:
+    if not s:
+        return ""
+    s = re.sub(r"\s*EXTRA PAGE\s*", " ", s)
+    s = re.sub(r"\(cid:\d+\)", " ", s)     # drop cid artifacts
+    s = re.sub(r"\s+", " ", s)
+    return s.strip()
+
+def _hash(*parts: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for p in parts:
+        h.update(p.encode("utf-8", "surrogatepass"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+# ---------------- pages ----------------
+def page_hashes(pdf_path: str) -> List[str]:
+    """Hash of each page's raw content streams (+ media box); no layout analysis."""
+    from pdfminer.pdftypes import resolve1
+    import pdfplumber
+
+    out: List[str] = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            h = hashlib.blake2b(digest_size=16)
+            h.update(repr(page.mediabox).encode())
+            contents = page.page_obj.contents or []
+            for stream in contents:
+                h.update(resolve1(stream).get_data())
+            out.append(h.hexdigest())
+    return out
+
+_PDF = None
+
+def _init_worker(pdf_path: str) -> None:
+    global _PDF
+    import pdfplumber
+    _PDF = pdfplumber.open(pdf_path)
+
+def _extract_pages(page_nos: Sequence[int]) -> List[Tuple[int, str]]:
+    return [(i, _PDF.pages[i].extract_text() or "") for i in page_nos]
+
+def extract_pages(pdf_path: str, page_nos: Sequence[int], workers: int = 0,
+                  chunk: int = 8) -> Dict[int, str]:
+    """Text of the given pages; each worker opens the PDF once and handles page chunks."""
+    if not page_nos:
+        return {}
+    workers = workers or min(len(page_nos) // chunk + 1, os.cpu_count() or 1)
+    chunks = [list(page_nos[i:i + chunk]) for i in range(0, len(page_nos), chunk)]
+    if workers <= 1:
+        _init_worker(pdf_path)
+        return dict(p for c in chunks for p in _extract_pages(c))
+    out: Dict[int, str] = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(pdf_path,)) as pool:
+        for part in pool.map(_extract_pages, chunks):
+            out.update(part)
+    return out
+
+
+# ---------------- parsing ----------------
+def split_exams(pages: Iterable[str], skip: int = SKIP_PAGES) -> Dict[str, Dict]:
+    """
+    Group page texts into exams. A page with an exam header starts (or continues) that exam;
+    pages without a header belong to the last exam seen.
+    """
+    exams: Dict[str, Dict] = {}
+    current: Optional[str] = None
+    for i, text in enumerate(pages):
+        if i < skip:
+            continue
+        text = text or ""
+        m = EXAM_RE.search(text)
+        if m:
+            try:
+                d = datetime.strptime(re.sub(r"\s+", " ", m.group(2)), "%B %d, %Y")
+            except ValueError:
+                continue
+            current = f"{m.group(1)}_{d:%Y-%m-%d}"
+            exams.setdefault(current, {
+                "exam_id": current, "exam_type": m.group(1),
+                "date": f"{d:%Y-%m-%d}", "year": d.year, "pages": [],
+            })
+        if current is not None:
+            exams[current]["pages"].append(text)
+    return exams
+
+def parse_exercises(exam: Dict) -> List[Dict]:
+    full = clean_text(" ".join(exam["pages"]))
+    out = []
+    for i, chunk in enumerate(EXERCISE_SPLIT_RE.split(full)[1:], start=1):
+        q, _, sol = chunk.strip().partition("Solution")
+        out.append({
+            "exercise_id": f"{exam['exam_id']}_Exercise_{i}",
+            "exam_id": exam["exam_id"],
+            "question": clean_text(q),
+            "solution": clean_text(sol),
+        })
+    return out
+
+
+# ---------------- writes ----------------
+def _batched(rows: Iterable[tuple], n: int) -> Iterator[List[tuple]]:
+    batch: List[tuple] = []
+    for r in rows:
+        batch.append(r)
+        if len(batch) >= n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _upsert_exercises(cur, rows: Iterable[Dict], batch: int) -> int:
+    # topic_pred is left alone on update (filled by the topic classifier)
+    n = 0
+    for part in _batched(((r["exercise_id"], r["exam_id"], r["question"], r["solution"]) for r in rows), batch):
+        cur.executemany("""
+          INSERT INTO questions(exercise_id, exam_id, question, solution)
+          VALUES(?,?,?,?)
+          ON CONFLICT(exercise_id) DO UPDATE SET
+            exam_id=excluded.exam_id, question=excluded.question, solution=excluded.solution
+          WHERE questions.question IS NOT excluded.question
+             OR questions.solution IS NOT excluded.solution
+             OR questions.exam_id  IS NOT excluded.exam_id
+        """, part)
+        n += len(part)
+    return n
+
+def _delete_dropped(cur, changed: Sequence[Tuple[Dict, List[Dict], str]]) -> int:
+    """Delete exercises of the re-parsed exams that the new parse no longer has."""
+    gone: List[str] = []
+    for exam, exs, _ in changed:
+        keep = [x["exercise_id"] for x in exs]
+        gone += [r[0] for r in cur.execute(
+            f"SELECT exercise_id FROM questions WHERE exam_id = ? "
+            f"AND exercise_id NOT IN ({','.join('?' * len(keep))})", [exam["exam_id"], *keep])]
+    cur.executemany("DELETE FROM questions WHERE exercise_id = ?", [(x,) for x in gone])
+    cur.executemany("DELETE FROM topic_assignments WHERE exercise_id = ?", [(x,) for x in gone])
+    return len(gone)
+
+
+def load_exams(cur, pages: Sequence[str], exclude: Sequence[str] = (),
+               max_exercises: int = MAX_EXERCISES, defer_indexes: Optional[bool] = None,
+               batch: int = UPSERT_BATCH, log=print) -> Dict[str, int]:
+    """
+    Page texts -> exams/questions upserts on an open cursor (caller commits).
+    Exams whose content hash matches ingest_exams are skipped.
+    defer_indexes=None -> only when the catalog is empty (initial bulk load).
+    """
+    exams = split_exams(pages)
+    known = {r["exam_id"]: r["content_hash"] for r in cur.execute("SELECT exam_id, content_hash FROM ingest_exams")}
+    changed: List[Tuple[Dict, List[Dict], str]] = []
+    skipped = 0
+    for exam_id, exam in exams.items():
+        if exam_id in exclude:
+            continue
+        exs = parse_exercises(exam)
+        if not exs or len(exs) > max_exercises:
+            continue
+        h = _hash(*exam["pages"])
+        if known.get(exam_id) == h:
+            skipped += 1
+            continue
+        changed.append((exam, exs, h))
+    log(f"{len(exams)} exams found, {len(changed)} to write, {skipped} unchanged")
+
+    if defer_indexes is None:
+        defer_indexes = cur.execute("SELECT COUNT(*) FROM questions").fetchone()[0] == 0 and bool(changed)
+    if defer_indexes:
+        drop_indexes(cur)
+
+    cur.executemany("""
+      INSERT INTO exams(exam_id, exam_type, date, year) VALUES(?,?,?,?)
+      ON CONFLICT(exam_id) DO UPDATE SET exam_type=excluded.exam_type, date=excluded.date, year=excluded.year
+    """, [(e["exam_id"], e["exam_type"], e["date"], e["year"]) for e, _, _ in changed])
+    n_ex = _upsert_exercises(cur, (x for _, exs, _ in changed for x in exs), batch)
+    n_del = _delete_dropped(cur, changed)
+    now = time.time()
+    cur.executemany("""
+      INSERT INTO ingest_exams(exam_id, content_hash, n_exercises, updated_ts) VALUES(?,?,?,?)
+      ON CONFLICT(exam_id) DO UPDATE SET content_hash=excluded.content_hash,
+        n_exercises=excluded.n_exercises, updated_ts=excluded.updated_ts
+    """, [(e["exam_id"], h, len(exs), now) for e, exs, h in changed])
+
+    if defer_indexes:
+        create_indexes(cur)
+    return {"exams": len(exams), "exams_written": len(changed),
+            "exams_unchanged": skipped, "exercises_written": n_ex, "exercises_deleted": n_del}
+
+
+def ingest_pdf(pdf_path: str, workers: int = 0, exclude: Sequence[str] = (),
+               max_exercises: int = MAX_EXERCISES, defer_indexes: Optional[bool] = None,
+               batch: int = UPSERT_BATCH, log=print) -> Dict[str, int]:
+    """
+    Incremental, idempotent PDF -> exams/questions load. Returns counters.
+    Only pages whose raw content changed since the last run are re-extracted.
+    """
+    t0 = time.perf_counter()
+    init_db()
+    source = os.path.basename(pdf_path)
+
+    hashes = page_hashes(pdf_path)
+    con = connect()
+    try:
+        cur = con.cursor()
+        cached = {r["page_no"]: (r["content_hash"], r["text"]) for r in cur.execute(
+            "SELECT page_no, content_hash, text FROM ingest_pages WHERE source=?", (source,))}
+        todo = [i for i, h in enumerate(hashes) if cached.get(i, (None,))[0] != h]
+        log(f"{len(hashes)} pages, {len(todo)} new/changed")
+
+        fresh = extract_pages(pdf_path, todo, workers=workers)
+        cur.executemany("""
+          INSERT INTO ingest_pages(source, page_no, content_hash, text) VALUES(?,?,?,?)
+          ON CONFLICT(source, page_no) DO UPDATE SET content_hash=excluded.content_hash, text=excluded.text
+        """, [(source, i, hashes[i], fresh[i]) for i in todo])
+        cur.execute("DELETE FROM ingest_pages WHERE source=? AND page_no>=?", (source, len(hashes)))
+        pages = [fresh[i] if i in fresh else cached[i][1] for i in range(len(hashes))]
+
+        stats = load_exams(cur, pages, exclude=exclude, max_exercises=max_exercises,
+                           defer_indexes=defer_indexes, batch=batch, log=log)
+        con.commit()
+    finally:
+        con.close()
+
+    stats = {"pages": len(hashes), "pages_extracted": len(todo), **stats}
+    log(f"done in {time.perf_counter() - t0:.2f}s: {stats}")
+    return stats
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m mqth_q.ingest", description="Load exam PDFs into the SQLite catalog.")
+    ap.add_argument("pdf", nargs="+", help="PDF file(s), e.g. data/raw/exams.pdf")
+    ap.add_argument("--workers", type=int, default=0, help="Extraction processes (0 = auto)")
+    ap.add_argument("--exclude", action="append", default=[], help="exam_id to skip (repeatable)")
+    ap.add_argument("--max-exercises", type=int, default=MAX_EXERCISES)
+    ap.add_argument("--defer-indexes", choices=["auto", "yes", "no"], default="auto")
+    ap.add_argument("--no-classify", action="store_true", help="Skip topic classification of new rows")
+    ap.add_argument("--profile", action="store_true",
+                    help="Sample the run (main process) and write a speedscope/flamegraph profile to PROFILE_DIR")
+    args = ap.parse_args(argv)
+
+    defer = {"auto": None, "yes": True, "no": False}[args.defer_indexes]
+    written = 0
+    with profiled("ingest") if args.profile else nullcontext() as prof:
+        for path in args.pdf:
+            stats = ingest_pdf(path, workers=args.workers, exclude=args.exclude,
+                               max_exercises=args.max_exercises, defer_indexes=defer)
+            written += stats["exercises_written"]
+        if written and not args.no_classify:
+            from .topics import classify_pending
+            classify_pending()
+    if prof is not None:
+        print(f"Profile: {prof.paths['speedscope']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
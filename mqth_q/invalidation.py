@@ -0,0 +1,106 @@
+# invalidación de cachés entre procesos (varios workers de la API + CLIs)
+#   - canal = contador de generación en SQLite (tabla invalidation; 'catalog' = catalog_meta)
+#   - cada proceso mantiene UNA conexión y consulta PRAGMA data_version cada INVALIDATION_POLL s;
+#     solo si otra conexión hizo commit se leen las generaciones y se avisa a los suscriptores
+#   - publish(): sube la generación (la ven los demás procesos) y avisa localmente al instante
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional
+
+from . import db
+from .config import INVALIDATION_POLL
+
+log = logging.getLogger(__name__)
+
+Listener = Callable[[int], None]
+
+
+class InvalidationBus:
+    def __init__(self, interval: float = INVALIDATION_POLL):
+        self.interval = float(interval)
+        self._listeners: Dict[str, List[Listener]] = {}
+        self._gens: Dict[str, int] = {}
+        self._data_version: Optional[int] = None
+        self._con: Optional[sqlite3.Connection] = None
+        self._con_path: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, channel: str, fn: Listener) -> None:
+        """fn(new_generation) runs whenever `channel` advances (in any process)."""
+        fns = self._listeners.setdefault(channel, [])
+        if fn not in fns:
+            fns.append(fn)
+
+    def _fire(self, channel: str, gen: int) -> None:
+        for fn in list(self._listeners.get(channel, ())):
+            try:
+                fn(gen)
+            except Exception as e:
+                log.warning("invalidation listener for %s failed: %s", channel, e)
+
+    def publish(self, channel: str) -> int:
+        with db._con() as con:
+            gen = db.bump_generation(con.cursor(), channel)
+        with self._lock:
+            self._gens[channel] = max(gen, self._gens.get(channel, 0))
+        self._fire(channel, gen)
+        return gen
+
+    def poll_once(self) -> List[str]:
+        """Check for commits by other connections; returns the channels that advanced."""
+        with self._lock:
+            if self._con is None or self._con_path != db.DB_PATH:
+                self._reset_connection()
+            dv = self._con.execute("PRAGMA data_version").fetchone()[0]
+            if dv == self._data_version:
+                return []
+            first = self._data_version is None
+            self._data_version = dv
+            gens = db.read_generations(self._con)
+            changed = [c for c, g in gens.items() if g > self._gens.get(c, 0)]
+            self._gens.update(gens)
+        if first:      # baseline snapshot, nothing to invalidate yet
+            return []
+        for c in changed:
+            self._fire(c, gens[c])
+        return changed
+
+    def _reset_connection(self) -> None:
+        if self._con is not None:
+            self._con.close()
+        self._con = db.connect()
+        self._con_path = db.DB_PATH
+        self._data_version = None
+        self._gens = {}
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll_once()
+            except Exception as e:
+                log.warning("invalidation poll failed: %s", e)
+
+    def start(self) -> None:
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self.poll_once()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="invalidation", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._gens)
+
+
+# Un bus por proceso; app.py suscribe sus cachés
+INVALIDATION = InvalidationBus()
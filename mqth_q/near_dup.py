@@ -0,0 +1,331 @@
+# respuestas casi duplicadas: reutilizar el veredicto del LLM (MinHash + LSH por ejercicio)
+#   - las respuestas a un mismo ejercicio se repiten con pocas variaciones (puntuación, orden,
+#     alguna palabra): antes de llamar al LLM se busca una respuesta ya calificada por el LLM
+#     con similitud de Jaccard estimada >= NEAR_DUP_THRESHOLD y se reutiliza su nota y pista
+#   - normalización: NFKC, minúsculas, palabras y operadores (+ - * / ^ = < > ...) separados
+#     por un espacio; el resto de la puntuación desaparece ("fixed-point" = "fixed point")
+#   - firma: shingles de 5 bytes empaquetados en un uint64 (exactos, sin colisiones) y
+#     NEAR_DUP_PERMS hashes multiply-shift; el mínimo por hash sale de una sola operación numpy
+#   - LSH: la firma se parte en NEAR_DUP_BANDS bandas; candidatos = respuestas con alguna banda
+#     igual, y se confirma con la fracción de hashes iguales. Anclas: los números, operadores y
+#     negaciones deben coincidir en orden ("x = 3" / "x = 4", "es continua" / "no es continua")
+#   - respuestas cortas (< NEAR_DUP_MIN_CHARS normalizados): solo coincidencia exacta
+#   - el índice se alimenta de la tabla attempts (de cualquier proceso o shard): antes de cada
+#     búsqueda se leen los intentos nuevos del ejercicio (attempt_id > último visto, por
+#     idx_attempts_ex). Se indexan solo veredictos del LLM (sin coseno del baseline) que no
+#     sean a su vez reutilizados, así los errores no se encadenan
+#   - arranque en frío acotado: solo se leen las NEAR_DUP_MAX_PER_EXERCISE respuestas más
+#     recientes (ORDER BY attempt_id DESC LIMIT) y solo las columnas necesarias
+#   - lleno el índice de un ejercicio, cada respuesta nueva reemplaza a la más antigua (anillo):
+#     los veredictos recientes se siguen viendo
+#   - grading guarda en cada veredicto del LLM "solution_fp" (hash de la solución); con
+#     lookup(..., solution=) se reutilizan solo veredictos de esa misma solución y, si la
+#     solución cambió, se rehace el índice de ese ejercicio (no el de todos)
+#   - el resultado reutilizado lleva "reused": {attempt_id, shard, similarity} (queda en feedback_json)
+#   - app.py vacía el índice en el canal "shards" (los intentos movidos cambian de id)
+#
+# CLI:  python -m mqth_q.near_dup [--threshold 0.85] [EXERCISE_ID ...]
+#       repite la historia: cuántas llamadas al LLM se habrían ahorrado y con qué acuerdo
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import re
+import sys
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple
+import unicodedata
+
+from . import db
+from .config import (
+    NEAR_DUP_BANDS,
+    NEAR_DUP_MAX_PER_EXERCISE,
+    NEAR_DUP_MIN_CHARS,
+    NEAR_DUP_PERMS,
+    NEAR_DUP_THRESHOLD,
+)
+from .tracing import annotate, traced
+
+if TYPE_CHECKING:
+    import numpy as np
+
+log = logging.getLogger(__name__)
+
+Observer = Callable[[str], None]
+
+EXACT, NEAR, MISS = "exact", "near", "miss"
+SHINGLE = 5
+_SEED = 0x6D717468
+
+_TOKEN_RE = re.compile(r"\w+|[+\-*/^=<>≤≥≠∈∉⊂⊆]", re.UNICODE)
+_WORD_HYPHEN_RE = re.compile(r"(?<=[^\W\d_]{2})-(?=[^\W\d_]{2})")     # a hyphenated word, not a minus
+_OPERATORS = set("+-*/^=<>≤≥≠∈∉⊂⊆")
+NEGATIONS = {
+    "not", "no", "never", "none", "nor", "cannot", "without", "false", "isn", "doesn", "don",
+    "aren", "wasn", "nunca", "ni", "sin", "ningún", "ninguna", "ninguno", "tampoco", "falso",
+}
+
+
+def normalize(text: str) -> Tuple[str, Tuple[str, ...]]:
+    """(normalized text, anchors): anchors are the numbers, operators and negations, in order."""
+    text = _WORD_HYPHEN_RE.sub(" ", unicodedata.normalize("NFKC", text or "").lower())
+    tokens = _TOKEN_RE.findall(text)
+    anchors = tuple(t for t in tokens
+                    if t in _OPERATORS or t in NEGATIONS or any(c.isdigit() for c in t))
+    return " ".join(tokens), anchors
+
+
+_HASH: Optional[Tuple["np.ndarray", "np.ndarray", "np.ndarray"]] = None
+
+def _hash_params(perms: int) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    global _HASH
+    import numpy as np
+    if _HASH is None or len(_HASH[0]) != perms:
+        rng = np.random.default_rng(_SEED)
+        a = rng.integers(1, 2**63, size=perms, dtype=np.uint64) * np.uint64(2) + np.uint64(1)   # odd
+        b = rng.integers(0, 2**63, size=perms, dtype=np.uint64)
+        _HASH = (a[:, None], b[:, None], np.uint64(256) ** np.arange(SHINGLE, dtype=np.uint64))
+    return _HASH
+
+
+def signature(norm: str, perms: int = NEAR_DUP_PERMS) -> "np.ndarray":
+    """MinHash of the byte 5-shingles of `norm`: uint32 array of length `perms`."""
+    import numpy as np
+    a, b, shifts = _hash_params(perms)
+    data = np.frombuffer(norm.encode("utf-8"), dtype=np.uint8)
+    if data.size < SHINGLE:
+        data = np.pad(data, (0, SHINGLE - data.size))
+    windows = np.lib.stride_tricks.sliding_window_view(data, SHINGLE).astype(np.uint64)
+    shingles = np.unique(windows @ shifts)                      # 40-bit codes, one per shingle
+    return ((a * shingles + b) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+
+def solution_fp(solution: Optional[str]) -> str:
+    """Short fingerprint of a reference solution; verdicts are reused only for the same one."""
+    return hashlib.blake2b((solution or "").encode("utf-8"), digest_size=8).hexdigest()
+
+
+class _Exercise:
+    """LSH index of the LLM-graded answers to one exercise."""
+
+    def __init__(self, perms: int, bands: int, fp: Optional[str] = None, capacity: int = 5000):
+        self.lock = threading.Lock()
+        self.fp = fp                                # solution_fp() of the solution it was built for
+        self.perms = perms
+        self.capacity = max(1, int(capacity))
+        self.next = 0                               # once full, the slot of the oldest answer
+        self.rows = max(1, perms // max(1, bands))
+        self.marks: Dict[Optional[int], int] = {}
+        self.sigs: List["np.ndarray"] = []
+        self.anchors: List[Tuple[str, ...]] = []
+        self.verdicts: List[Dict[str, Any]] = []
+        self.digests: List[bytes] = []
+        self.bands: List[Dict[bytes, List[int]]] = [{} for _ in range(perms // self.rows)]
+        self.exact: Dict[bytes, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.verdicts)
+
+    def _keys(self, sig: "np.ndarray") -> List[bytes]:
+        return [sig[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(len(self.bands))]
+
+    def _evict(self, i: int) -> None:
+        del self.exact[self.digests[i]]
+        for band, key in zip(self.bands, self._keys(self.sigs[i])):
+            slots = band[key]
+            slots.remove(i)
+            if not slots:
+                del band[key]
+
+    def add(self, answer: str, verdict: Dict[str, Any]) -> None:
+        """Index one answer; when full it takes the slot of the oldest one."""
+        norm, anchors = normalize(answer)
+        if not norm:
+            return
+        digest = hashlib.blake2b(norm.encode("utf-8"), digest_size=16).digest()
+        if digest in self.exact:
+            return
+        sig = signature(norm, self.perms)
+        if len(self.verdicts) < self.capacity:
+            i = len(self.verdicts)
+            self.verdicts.append(verdict)
+            self.anchors.append(anchors)
+            self.sigs.append(sig)
+            self.digests.append(digest)
+        else:
+            i = self.next
+            self.next = (i + 1) % self.capacity
+            self._evict(i)
+            self.verdicts[i], self.anchors[i] = verdict, anchors
+            self.sigs[i], self.digests[i] = sig, digest
+        self.exact[digest] = i
+        for band, key in zip(self.bands, self._keys(sig)):
+            band.setdefault(key, []).append(i)
+
+    def match(self, answer: str, threshold: float, min_chars: int) -> Tuple[Optional[Dict[str, Any]], float]:
+        """(verdict, similarity) of the closest indexed answer above `threshold`, or (None, 0)."""
+        import numpy as np
+        norm, anchors = normalize(answer)
+        if not norm:
+            return None, 0.0
+        hit = self.exact.get(hashlib.blake2b(norm.encode("utf-8"), digest_size=16).digest())
+        if hit is not None:
+            return self.verdicts[hit], 1.0
+        if len(norm) < min_chars or not self.verdicts:
+            return None, 0.0
+        sig = signature(norm, self.perms)
+        cands = sorted({i for band, key in zip(self.bands, self._keys(sig)) for i in band.get(key, ())
+                        if self.anchors[i] == anchors})
+        if not cands:
+            return None, 0.0
+        sims = (np.stack([self.sigs[i] for i in cands]) == sig).mean(axis=1)
+        best = int(sims.argmax())
+        if sims[best] < threshold:
+            return None, 0.0
+        return self.verdicts[cands[best]], float(sims[best])
+
+
+def _llm_verdict(row: Dict[str, Any]) -> Dict[str, Any]:
+    """The reusable part of a db.llm_answers() row."""
+    return {"score": float(row["score"] or 0.0), "correct": bool(row["correct"]),
+            "reasons": row.get("reasons") or "", "hint": row.get("hint") or "",
+            "attempt_id": row["attempt_id"], "shard": row.get("shard")}
+
+
+class NearDupIndex:
+    """Per-exercise MinHash/LSH indexes, fed from the attempts table."""
+
+    def __init__(self, threshold: float = NEAR_DUP_THRESHOLD, perms: int = NEAR_DUP_PERMS,
+                 bands: int = NEAR_DUP_BANDS, min_chars: int = NEAR_DUP_MIN_CHARS,
+                 max_per_exercise: int = NEAR_DUP_MAX_PER_EXERCISE):
+        self.threshold = float(threshold)
+        self.perms = max(1, int(perms))
+        self.bands = max(1, min(int(bands), self.perms))
+        self.min_chars = int(min_chars)
+        self.max_per_exercise = int(max_per_exercise)
+        self._exercises: Dict[Tuple[str, str], _Exercise] = {}
+        self._lock = threading.Lock()
+        self._observers: List[Observer] = []
+
+    def add_observer(self, fn: Observer) -> None:
+        """Register fn(outcome) with outcome in exact / near / miss, called for every lookup."""
+        if fn not in self._observers:
+            self._observers.append(fn)
+
+    def _notify(self, outcome: str) -> None:
+        for fn in list(self._observers):
+            try:
+                fn(outcome)
+            except Exception:
+                pass
+
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def _exercise(self, exercise_id: str, fp: Optional[str] = None) -> _Exercise:
+        key = (db.DB_PATH, exercise_id)            # a different database gets its own indexes
+        with self._lock:
+            ex = self._exercises.get(key)
+            if ex is None or (fp is not None and ex.fp != fp):   # new or edited solution: rebuild
+                ex = _Exercise(self.perms, self.bands, fp, capacity=self.max_per_exercise)
+                self._exercises[key] = ex
+            return ex
+
+    def _sync(self, exercise_id: str, ex: _Exercise) -> None:
+        rows, ex.marks = db.llm_answers(exercise_id, ex.marks, limit=ex.capacity)
+        rows.sort(key=lambda r: r["attempt_id"], reverse=True)     # newest first across shards
+        rows = [r for r in rows if ex.fp is None or r["solution_fp"] == ex.fp][:ex.capacity]
+        for r in reversed(rows):            # oldest first: a full index evicts its oldest answers
+            ex.add(r["student_answer"], _llm_verdict(r))
+
+    @traced("near_dup.lookup")
+    def lookup(self, exercise_id: Optional[str], answer: str,
+               solution: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Grader dict reusing the LLM verdict of a near-duplicate earlier answer, or None.
+        With `solution`, only verdicts given against that same solution are reused.
+        Never raises: any failure just means grading as usual.
+        """
+        if not self.enabled() or not exercise_id:
+            return None
+        try:
+            ex = self._exercise(exercise_id, None if solution is None else solution_fp(solution))
+            with ex.lock:
+                self._sync(exercise_id, ex)
+                v, sim = ex.match(answer, self.threshold, self.min_chars)
+        except Exception as e:
+            log.warning("near-duplicate lookup failed for %s: %s", exercise_id, e)
+            return None
+        self._notify(MISS if v is None else EXACT if sim >= 1.0 else NEAR)
+        if v is None:
+            return None
+        annotate(reused_attempt=v["attempt_id"], similarity=round(sim, 3))
+        return {
+            "score": v["score"], "correct": v["correct"], "cosine": None, "jaccard": None,
+            "missing_keywords": [], "reasons": v["reasons"], "hint": v["hint"],
+            "reused": {"attempt_id": v["attempt_id"], "shard": v["shard"], "similarity": round(sim, 3)},
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._exercises.clear()
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {"exercises": len(self._exercises), "answers": sum(len(e) for e in self._exercises.values())}
+
+
+# Índice compartido por todo el proceso
+NEAR_DUPS = NearDupIndex()
+
+
+# ---------------- offline replay ----------------
+def replay(exercise_ids: Optional[Sequence[str]] = None, threshold: float = NEAR_DUP_THRESHOLD,
+           log=print) -> Dict[str, Any]:
+    """
+    Walk the stored LLM verdicts in order and count the ones an earlier answer would have
+    served; agreement = reused verdict has the same `correct` as the LLM gave.
+    """
+    with db._con() as con:
+        ids = list(exercise_ids) if exercise_ids else [
+            r[0] for r in con.execute("SELECT exercise_id FROM questions ORDER BY exercise_id")]
+    idx = NearDupIndex(threshold=threshold)
+    out = {"llm_graded": 0, "reused": 0, "agree": 0, "abs_score_diff": 0.0}
+    for exercise_id in ids:
+        ex = idx._exercise(exercise_id)
+        rows, _ = db.llm_answers(exercise_id, {})
+        for r in sorted(rows, key=lambda r: (r["shard"] or 0, r["attempt_id"])):
+            v = _llm_verdict(r)
+            out["llm_graded"] += 1
+            prev, _sim = ex.match(r["student_answer"], threshold, idx.min_chars)
+            if prev is None:
+                ex.add(r["student_answer"], v)
+                continue
+            out["reused"] += 1
+            out["agree"] += int(prev["correct"] == v["correct"])
+            out["abs_score_diff"] += abs(prev["score"] - v["score"])
+    n = max(1, out["reused"])
+    summary = {
+        "exercises": len(ids), "llm_graded": out["llm_graded"], "reused": out["reused"],
+        "llm_calls_saved": round(out["reused"] / max(1, out["llm_graded"]), 4),
+        "agreement": round(out["agree"] / n, 4), "mean_abs_score_diff": round(out["abs_score_diff"] / n, 4),
+    }
+    log(json.dumps(summary, indent=2))
+    return summary
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m mqth_q.near_dup",
+                                 description="Replay stored LLM grades: how many near-duplicates would be reused.")
+    ap.add_argument("exercise_ids", nargs="*", help="Default: every exercise")
+    ap.add_argument("--threshold", type=float, default=NEAR_DUP_THRESHOLD or 0.85)
+    args = ap.parse_args(argv)
+    replay(args.exercise_ids, threshold=args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
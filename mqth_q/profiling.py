@@ -0,0 +1,284 @@
+# perfilado bajo demanda por muestreo (sin dependencias: sys._current_frames en un hilo)
+#   - Sampler: cada PROFILE_INTERVAL s copia la pila de los hilos registrados (o de todos) y
+#     cuenta pilas idénticas; el código perfilado no se instrumenta, así que el coste es el
+#     del hilo muestreador y solo mientras hay un perfil activo
+#   - salida por perfil en PROFILE_DIR:
+#       <id>.speedscope.json  -> https://www.speedscope.app (flamegraph / left heavy / sandwich)
+#       <id>.folded           -> pilas colapsadas (flamegraph.pl, inferno, speedscope)
+#       <id>.summary.json     -> tiempo por componente (sqlite, sklearn, pydantic, llm_http...)
+#                                y funciones con más muestras propias / totales
+#   - API: la petición se perfila con la cabecera X-Profile: <PROFILE_TOKEN> (solo cabecera, para
+#     que el token no acabe en logs de acceso; comparación en tiempo constante con hmac)
+#     o al azar con PROFILE_SAMPLE_RATE; desactivado (token vacío y rate 0) app.py no instala
+#     ni el middleware ni ProfiledRoute: coste cero. Se muestrean los hilos que ejecutan el
+#     endpoint (ProfiledRoute los registra al entrar y salir) y, en respuestas en streaming, los
+#     que generan el cuerpo (sampled()); el perfil se cierra cuando se termina de enviar el cuerpo
+#   - CLIs: profiled(name) como context manager; grade_eval / ingest --profile
+#
+# Uso:  with profiled("grade_eval") as p: ...   ->  p.paths
+
+from __future__ import annotations
+
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+import hmac
+import itertools
+import json
+import os
+from pathlib import Path
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from .config import PROFILE_DIR, PROFILE_INTERVAL, PROFILE_SAMPLE_RATE, PROFILE_TOKEN
+
+Frame = Tuple[str, str, int]          # (function, file, first line)
+MAX_DEPTH = 200
+TOP_N = 25
+_SEQ = itertools.count(1)
+
+# leaf-most frame whose file matches decides where a sample's time went
+COMPONENTS = (
+    ("sqlite", re.compile(r"sqlite3|mqth_q[/\\]db\.py|mqth_q[/\\](history|archive|shards)\.py")),
+    ("llm_http", re.compile(r"[/\\](requests|urllib3|http[/\\]client|ssl|socket)")),
+    ("sklearn", re.compile(r"[/\\](sklearn|scipy)[/\\]")),
+    ("numpy", re.compile(r"[/\\](numpy|pandas|pyarrow)[/\\]")),
+    ("pydantic", re.compile(r"[/\\]pydantic")),
+    ("json", re.compile(r"[/\\](json|orjson)|mqth_q[/\\]fastjson\.py")),
+    ("framework", re.compile(r"[/\\](fastapi|starlette|anyio|uvicorn)[/\\]")),
+    ("grading", re.compile(r"mqth_q[/\\](grading|baseline|prompt|router|breaker|admission)\.py")),
+    ("app", re.compile(r"mqth_q[/\\]|[/\\]app\.py$")),
+)
+
+
+def _stack(frame) -> Tuple[Frame, ...]:
+    out: List[Frame] = []
+    while frame is not None and len(out) < MAX_DEPTH:
+        code = frame.f_code
+        out.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    out.reverse()                     # root first
+    return tuple(out)
+
+
+def _component(stack: Tuple[Frame, ...]) -> str:
+    for _, filename, _ in reversed(stack):
+        for name, pat in COMPONENTS:
+            if pat.search(filename):
+                return name
+    return "other"
+
+
+def _label(f: Frame) -> str:
+    name, filename, line = f
+    parts = Path(filename).parts
+    short = "/".join(parts[-2:]) if len(parts) > 1 else filename
+    return f"{name} ({short}:{line})"
+
+
+class Sampler:
+    """Collects stacks of selected threads (or of every thread) every `interval` seconds."""
+
+    def __init__(self, name: str, interval: float = PROFILE_INTERVAL, all_threads: bool = False):
+        self.name = name
+        self.interval = max(0.0005, float(interval))
+        self.all_threads = all_threads
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.paths: Dict[str, str] = {}
+        self._threads: Set[int] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._t0 = self._t1 = 0.0
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", name)[:60]
+        self.stem = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_SEQ)}-{slug}"    # profile id
+
+    def add_thread(self, ident: Optional[int] = None) -> None:
+        with self._lock:
+            self._threads.add(ident or threading.get_ident())
+
+    def remove_thread(self, ident: Optional[int] = None) -> None:
+        with self._lock:
+            self._threads.discard(ident or threading.get_ident())
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                idents = [t for t in frames if t != me] if self.all_threads else list(self._threads)
+            for ident in idents:
+                f = frames.get(ident)
+                if f is not None:
+                    self.stacks[_stack(f)] += 1
+                    self.samples += 1
+
+    def start(self) -> "Sampler":
+        self._t0 = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "Sampler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._t1 = time.perf_counter()
+        return self
+
+    # ---------------- output ----------------
+    def summary(self) -> Dict[str, Any]:
+        total = max(1, self.samples)
+        self_c: Counter = Counter()
+        total_c: Counter = Counter()
+        comp: Counter = Counter()
+        for stack, n in self.stacks.items():
+            if not stack:
+                continue
+            self_c[stack[-1]] += n
+            for f in set(stack):
+                total_c[f] += n
+            comp[_component(stack)] += n
+
+        def top(c: Counter) -> List[Dict[str, Any]]:
+            return [{"frame": _label(f), "samples": n, "pct": round(100.0 * n / total, 1)}
+                    for f, n in c.most_common(TOP_N)]
+
+        return {
+            "name": self.name,
+            "wall_seconds": round(self._t1 - self._t0, 4),
+            "samples": self.samples,
+            "interval": self.interval,
+            "components": {k: round(100.0 * n / total, 1) for k, n in comp.most_common()},
+            "top_self": top(self_c),
+            "top_total": top(total_c),
+        }
+
+    def speedscope(self) -> Dict[str, Any]:
+        index: Dict[Frame, int] = {}
+        frames: List[Dict[str, Any]] = []
+        samples: List[List[int]] = []
+        weights: List[float] = []
+        for stack, n in self.stacks.items():
+            ids = []
+            for f in stack:
+                if f not in index:
+                    index[f] = len(frames)
+                    frames.append({"name": f[0], "file": f[1], "line": f[2]})
+                ids.append(index[f])
+            samples.append(ids)
+            weights.append(n * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "mqth_q.profiling",
+            "shared": {"frames": frames},
+            "profiles": [{"type": "sampled", "name": self.name, "unit": "seconds",
+                          "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights}],
+        }
+
+    def folded(self) -> str:
+        return "".join(";".join(_label(f) for f in stack) + f" {n}\n"
+                       for stack, n in self.stacks.most_common() if stack)
+
+    def write(self, directory: Optional[str] = None) -> Dict[str, str]:
+        """Write the three files; returns {speedscope, folded, summary} paths."""
+        root = Path(directory or PROFILE_DIR)
+        root.mkdir(parents=True, exist_ok=True)
+        stem = self.stem
+        paths = {"speedscope": root / f"{stem}.speedscope.json", "folded": root / f"{stem}.folded",
+                 "summary": root / f"{stem}.summary.json"}
+        paths["speedscope"].write_text(json.dumps(self.speedscope()), encoding="utf-8")
+        paths["folded"].write_text(self.folded(), encoding="utf-8")
+        paths["summary"].write_text(json.dumps(self.summary(), indent=2), encoding="utf-8")
+        self.paths = {k: str(v) for k, v in paths.items()}
+        return self.paths
+
+
+@contextmanager
+def profiled(name: str, directory: Optional[str] = None, all_threads: bool = True,
+             interval: float = PROFILE_INTERVAL) -> Iterator[Sampler]:
+    """Profile the block (all threads by default, e.g. a CLI with worker threads) and write the files."""
+    s = Sampler(name, interval=interval, all_threads=all_threads)
+    if not all_threads:
+        s.add_thread()
+    s.start()
+    try:
+        yield s
+    finally:
+        s.stop()
+        s.write(directory)
+
+
+# ---------------- API hooks ----------------
+# perfil de la petición en curso (el contexto se copia al hilo del threadpool de los endpoints sync)
+CURRENT: ContextVar[Optional[Sampler]] = ContextVar("mqth_q_profile", default=None)
+
+
+def wanted(header: Optional[str], rand: float) -> bool:
+    """Whether a request asks for (or is sampled for) profiling; False fast when disabled."""
+    if PROFILE_TOKEN and header and hmac.compare_digest(header.encode("utf-8"),
+                                                        PROFILE_TOKEN.encode("utf-8")):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and rand < PROFILE_SAMPLE_RATE
+
+
+def sampled(it: Iterator[Any]) -> Iterator[Any]:
+    """
+    A StreamingResponse body whose next() calls (run on threadpool threads, after the
+    endpoint returned) are sampled with the request's profile; `it` itself when not profiling.
+    """
+    s = CURRENT.get()
+    if s is None:
+        return it
+
+    def _body():
+        while True:
+            s.add_thread()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                s.remove_thread()
+            yield item
+    return _body()
+
+
+def enabled() -> bool:
+    return bool(PROFILE_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+
+def wrap_endpoint(fn):
+    """Register the thread running `fn` with the request's sampler (no-op when not profiling)."""
+    import functools
+    import inspect
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def _async(*args, **kwargs):
+            s = CURRENT.get()
+            if s is None:
+                return await fn(*args, **kwargs)
+            s.add_thread()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                s.remove_thread()
+        return _async
+
+    @functools.wraps(fn)
+    def _sync(*args, **kwargs):
+        s = CURRENT.get()
+        if s is None:
+            return fn(*args, **kwargs)
+        s.add_thread()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            s.remove_thread()
+    return _sync
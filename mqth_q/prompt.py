@@ -0,0 +1,156 @@
+# construcción del prompt de calificación con presupuesto de tokens
+#   - estima tokens sin tokenizer (heurística chars/palabras)
+#   - compacta soluciones largas (extractivo: oraciones con más palabras clave) y las cachea por exercise_id
+#   - prefijo estático (instrucciones + pregunta + solución) primero, respuesta del alumno al final
+#     -> Ollama reutiliza el KV cache entre alumnos del mismo ejercicio
+
+from __future__ import annotations
+
+from collections import Counter, OrderedDict
+import hashlib
+import re
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .baseline import _keywords
+from .config import (
+    LLM_MAX_OUTPUT_TOKENS,
+    LLM_OPTIONS,
+    LLM_PROMPT_CACHE_SIZE,
+    LLM_STUDENT_MAX_TOKENS,
+)
+
+NUM_CTX: int = int(LLM_OPTIONS.get("num_ctx", 2048))
+
+INSTRUCTIONS = """You grade a student's short math answer. Be brief and do not reveal full solutions.
+Return ONLY valid compact JSON with EXACT keys:
+- "score": number 0..1
+- "correct": true/false
+- "explanation": one short sentence explaining the verdict
+- "hint": one short hint the student can try next (do NOT reveal the full solution)
+"""
+
+_SENT_RE = re.compile(r"(?<=[.;:!?])\s+|\n+")
+_WORDISH_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+Observer = Callable[[int, bool], None]
+_observers: List[Observer] = []
+
+
+class Prompt(NamedTuple):
+    text: str
+    tokens: int        # estimated
+    compacted: bool    # solution or answer had to be shortened
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap upper-ish estimate: ~1 token per word/symbol, and never below chars/4."""
+    if not text:
+        return 0
+    return max(len(_WORDISH_RE.findall(text)), len(text) // 4)
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    if estimate_tokens(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:                           # longest prefix within budget
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo].rstrip() + " …"
+
+
+def compact_solution(solution: str, budget: int) -> str:
+    """
+    Extractive compaction: keep the sentences richest in solution keywords (in their
+    original order) until the budget is used; fall back to plain truncation.
+    """
+    solution = solution or ""
+    if estimate_tokens(solution) <= budget:
+        return solution
+    sents = [s.strip() for s in _SENT_RE.split(solution) if s and s.strip()]
+    freq = Counter(_keywords(solution))
+    scored = sorted(
+        range(len(sents)),
+        key=lambda i: (-sum(freq[w] for w in set(_keywords(sents[i]))) / (1 + estimate_tokens(sents[i]) ** 0.5), i),
+    )
+    keep, used = set(), 0
+    for i in scored:
+        t = estimate_tokens(sents[i])
+        if used + t <= budget:
+            keep.add(i)
+            used += t
+    if not keep:
+        return truncate_to_tokens(solution, budget)
+    return " ".join(sents[i] for i in sorted(keep))
+
+
+# ---------------- per-exercise cache of compacted solutions ----------------
+_cache: "OrderedDict[Tuple[str, str, int], str]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _compacted_for(exercise_id: Optional[str], solution: str, budget: int) -> str:
+    if exercise_id is None:
+        return compact_solution(solution, budget)
+    # the hash keeps the cache honest if the catalog solution is edited
+    key = (exercise_id, hashlib.blake2b((solution or "").encode(), digest_size=8).hexdigest(), budget)
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+            return hit
+    out = compact_solution(solution, budget)
+    with _cache_lock:
+        _cache[key] = out
+        while len(_cache) > LLM_PROMPT_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return out
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+
+
+# ---------------- builder ----------------
+def add_observer(fn: Observer) -> None:
+    """Register fn(estimated_prompt_tokens, compacted), called for every built prompt."""
+    if fn not in _observers:
+        _observers.append(fn)
+
+def build_grading_prompt(question: str, solution: str, student: str,
+                         exercise_id: Optional[str] = None,
+                         num_ctx: int = NUM_CTX,
+                         max_output: int = LLM_MAX_OUTPUT_TOKENS) -> Prompt:
+    """
+    Static prefix (instructions, question, compacted solution) + student suffix, sized so
+    prompt + `max_output` fits in `num_ctx`.
+    """
+    student_txt = student or ""
+    student_fit = truncate_to_tokens(student_txt, LLM_STUDENT_MAX_TOKENS)
+    question_fit = truncate_to_tokens(question or "", max(64, (num_ctx - max_output) // 2))
+
+    head = f"{INSTRUCTIONS}\nQuestion:\n{question_fit}\n\nReference solution:\n"
+    tail_tpl = "\n\nStudent answer:\n{}\n\nJSON:"
+    # budget against the *maximum* student answer so the compacted solution (and therefore the
+    # prompt prefix) is the same for every student on this exercise
+    fixed = estimate_tokens(head) + estimate_tokens(tail_tpl.format("")) + LLM_STUDENT_MAX_TOKENS
+    sol_budget = max(32, num_ctx - max_output - fixed)
+
+    sol = _compacted_for(exercise_id, solution or "", sol_budget)
+    text = head + sol + tail_tpl.format(student_fit)
+    compacted = sol != (solution or "") or student_fit != student_txt or question_fit != (question or "")
+    tokens = estimate_tokens(text)
+
+    for fn in list(_observers):
+        try:
+            fn(tokens, compacted)
+        except Exception:
+            pass
+    return Prompt(text, tokens, compacted)
+
+def cache_info() -> Dict[str, int]:
+    with _cache_lock:
+        return {"entries": len(_cache), "max": LLM_PROMPT_CACHE_SIZE}
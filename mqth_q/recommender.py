@@ -4,76 +4,81 @@
 # Recomienda próximas preguntas a intentar
 
 from __future__ import annotations
-from typing import Dict, List, Optional, Iterable
-from collections import defaultdict
 
-from .config import RECS_K
-from .db import get_user_id, get_attempts, list_unseen, fetch_question
+from typing import Dict, Iterable, List, Optional
+
+from .config import RECS_K, RECS_STATS_MIN_USERS, RECS_TARGET_SUCCESS
+from .db import fetch_question, get_user_id, list_exercise_stats, list_unseen
+from .history import AttemptHistory, load_history
+from .tracing import traced
+
 
 # ---------------------------
-# Helpers over attempts
+# Helpers over attempts (columnar history, see history.py)
 # ---------------------------
-def _latest_per_exercise(attempts: Iterable[Dict]) -> Dict[str, Dict]:
-    """Keep only the last attempt per exercise_id (by ts)."""
-    latest: Dict[str, Dict] = {}
-    for a in attempts:
-        ex = a["exercise_id"]
-        if ex not in latest or a["ts"] > latest[ex]["ts"]:
-            latest[ex] = a
-    return latest
-
-def recent_mistakes(user_id: int, limit: int = 10) -> List[str]:
+def recent_mistakes(user_id: int, limit: int = 10, history: Optional[AttemptHistory] = None) -> List[str]:
     """Exercises whose latest attempt is incorrect, most recent first."""
-    attempts = get_attempts(user_id, limit=10_000)  # safe upper bound
-    latest = _latest_per_exercise(attempts).values()
-    mistakes = [a for a in latest if int(a.get("correct", 0)) == 0]
-    mistakes.sort(key=lambda x: x["ts"], reverse=True)
-    return [m["exercise_id"] for m in mistakes[:limit]]
+    history = history if history is not None else load_history(user_id, limit=10_000)  # safe upper bound
+    return history.recent_mistakes(limit)
 
-def topic_performance(user_id: int) -> List[Dict]:
+def topic_performance(user_id: int, history: Optional[AttemptHistory] = None) -> List[Dict]:
     """
     Returns a list of {topic, avg_score, n} sorted by avg_score ASC (weak → strong).
     """
-    attempts = get_attempts(user_id, limit=10_000)
-    by_topic: Dict[str, List[float]] = defaultdict(list)
-    for a in attempts:
-        topic = a.get("topic")
-        score = a.get("score")
-        if topic is not None and score is not None:
-            by_topic[topic].append(float(score))
-
-    perf = [
-        {"topic": t, "avg_score": (sum(xs) / len(xs)), "n": len(xs)}
-        for t, xs in by_topic.items() if xs
-    ]
+    history = history if history is not None else load_history(user_id, limit=10_000)
+    perf = [{"topic": t["topic"], "avg_score": t["avg_score"], "n": t["n"]}
+            for t in history.by_topic(missing_as_zero=False, unknown=None)]
     perf.sort(key=lambda d: d["avg_score"])  # weakest first
     return perf
 
+def by_difficulty(exercise_ids: List[str], target: float = RECS_TARGET_SUCCESS,
+                  min_users: int = RECS_STATS_MIN_USERS) -> List[str]:
+    """
+    Stable re-order by cohort difficulty: exercises with at least `min_users` first tries
+    are ranked by |first-try correct rate - target|; the rest keep their order in front
+    (they still need data). target < 0 disables it.
+    """
+    if target < 0 or not exercise_ids:
+        return list(exercise_ids)
+    stats = {s["exercise_id"]: s for s in list_exercise_stats(exercise_ids=exercise_ids)}
+
+    def key(ex_id: str) -> float:
+        s = stats.get(ex_id)
+        if not s or s["users"] < min_users or s["first_try_correct_rate"] is None:
+            return -1.0
+        return abs(s["first_try_correct_rate"] - target)
+
+    return sorted(exercise_ids, key=key)
+
 # ---------------------------
 # Main recommendation logic
 # ---------------------------
+@traced()
 def recommend_next(user_id: int, k: int = RECS_K) -> List[str]:
     """
     Blend of:
       - ~40% recent mistakes to review (latest attempt incorrect)
-      - ~60% unseen items, prioritizing weak topics
+      - ~60% unseen items, prioritizing weak topics, then exercises of the right difficulty
     Returns a list of exercise_id.
     """
+    history = load_history(user_id, limit=10_000)   # one query for both signals
+
     # 1) recent mistakes (review)
     review_take = max(1, int(0.4 * k))
-    review_ids = recent_mistakes(user_id, limit=10)[:review_take]
+    review_ids = recent_mistakes(user_id, limit=10, history=history)[:review_take]
 
     # 2) unseen pool (ordered by exam date ASC from DB)
     unseen = list_unseen(user_id, k=500)  # [{'exercise_id','topic','date',...}, ...]
     unseen_map = {row["exercise_id"]: row for row in unseen}
 
     # weak topics (bottom half)
-    perf = topic_performance(user_id)
+    perf = topic_performance(user_id, history=history)
     weak_topics = {p["topic"] for p in perf[: max(1, len(perf)//2)]} if perf else set()
 
     # prioritize unseen in weak topics, keep stable order by date
     unseen_weak = [r["exercise_id"] for r in unseen if r.get("topic") in weak_topics]
     unseen_other = [r["exercise_id"] for r in unseen if r.get("topic") not in weak_topics]
+    unseen_weak, unseen_other = by_difficulty(unseen_weak), by_difficulty(unseen_other)
 
     picks: List[str] = []
     seen: set[str] = set()
@@ -0,0 +1,187 @@
+# pool de backends Ollama con balanceo "least outstanding requests"
+#   - cada backend tiene peso, concurrencia máxima y su propio circuit breaker
+#   - se elige el backend sano con menor inflight/peso que tenga cupo
+#   - health checks activos (GET /api/tags) expulsan / readmiten backends
+#   - observers reciben (url, latencia, ok) para métricas por backend
+#   - todos ocupados -> se espera hasta `wait` y NoBackendAvailable (saturación, no es una caída);
+#     ninguno sano / con breaker cerrado -> NoHealthyBackend al momento (caída: cuenta como fallo)
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from .breaker import OPEN, CircuitBreaker
+from .config import LLM_HEALTH_INTERVAL, LLM_ROUTER_WAIT, OLLAMA_BACKENDS
+
+Observer = Callable[[str, float, bool], None]
+
+
+class NoBackendAvailable(RuntimeError):
+    """Every admitted backend stayed at max concurrency for longer than the wait (saturation)."""
+
+
+class NoHealthyBackend(RuntimeError):
+    """Every backend is ejected by the health checks or has its breaker open (an outage)."""
+
+
+class Backend:
+    def __init__(self, url: str, weight: float = 1.0, max_concurrency: int = 4):
+        self.url = url.rstrip("/")
+        self.weight = max(float(weight), 1e-6)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.breaker = CircuitBreaker(f"ollama@{self.url}")
+        self.healthy = True
+        self.inflight = 0
+        self.requests = 0
+        self.errors = 0
+        self.last_check: Optional[float] = None
+
+    @property
+    def load(self) -> float:
+        return self.inflight / self.weight
+
+    def up(self) -> bool:
+        """Healthy and not open: it may take requests once it has a free slot."""
+        return self.healthy and self.breaker.state != OPEN
+
+    def available(self) -> bool:
+        return self.up() and self.inflight < self.max_concurrency
+
+    def timeout(self) -> float:
+        return self.breaker.timeout()
+
+    def snapshot(self) -> Dict[str, Any]:
+        brk = self.breaker.snapshot()
+        return {
+            "url": self.url,
+            "weight": self.weight,
+            "max_concurrency": self.max_concurrency,
+            "healthy": self.healthy,
+            "inflight": self.inflight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "breaker": brk["state"],
+            "p50": brk["p50"],
+            "p95": brk["p95"],
+            "timeout": brk["timeout"],
+        }
+
+
+class OllamaRouter:
+    def __init__(self, backends: List[Dict[str, Any]], wait: float = LLM_ROUTER_WAIT,
+                 health_interval: float = LLM_HEALTH_INTERVAL):
+        if not backends:
+            raise ValueError("OllamaRouter needs at least one backend.")
+        self.backends = [
+            Backend(b["url"], b.get("weight", 1.0), b.get("max_concurrency", 4)) for b in backends
+        ]
+        self.wait = float(wait)
+        self.health_interval = float(health_interval)
+        self._cond = threading.Condition()
+        self._observers: List[Observer] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------------- routing ----------------
+    def _pick(self) -> Optional[Backend]:
+        # least outstanding requests (normalized by weight); ties -> declaration order
+        for b in sorted((b for b in self.backends if b.available()), key=lambda b: b.load):
+            if b.breaker.allow():
+                return b
+        return None
+
+    @contextmanager
+    def acquire(self, wait: Optional[float] = None) -> Iterator[Backend]:
+        """
+        Reserve a slot on the least-loaded healthy backend for one request.
+        Outcome and latency are recorded on that backend's breaker and observers (nothing
+        if the caller goes away mid-request). Raises NoHealthyBackend at once if no backend
+        is up, NoBackendAvailable if all the ones that are up stay busy for `wait` seconds.
+        """
+        deadline = time.monotonic() + (self.wait if wait is None else wait)
+        with self._cond:
+            while True:
+                b = self._pick()
+                if b is not None:
+                    b.inflight += 1
+                    b.requests += 1
+                    break
+                if not any(x.up() for x in self.backends):
+                    raise NoHealthyBackend("No healthy Ollama backend.")
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise NoBackendAvailable("No Ollama backend available.")
+                self._cond.wait(timeout=min(left, 0.5))
+
+        t0 = time.perf_counter()
+        ok: Optional[bool] = False
+        try:
+            yield b
+            ok = True
+        except Exception:
+            raise
+        except BaseException:
+            ok = None   # cancelled by the caller (e.g. closed stream): says nothing about b
+            raise
+        finally:
+            dt = time.perf_counter() - t0
+            if ok is None:
+                b.breaker.cancel()
+            else:
+                (b.breaker.record_success if ok else b.breaker.record_failure)(dt)
+            with self._cond:
+                b.inflight -= 1
+                if ok is False:
+                    b.errors += 1
+                self._cond.notify()
+            observers = list(self._observers) if ok is not None else []
+            for fn in observers:
+                try:
+                    fn(b.url, dt, ok)
+                except Exception:
+                    pass
+
+    def add_observer(self, fn: Observer) -> None:
+        """Register fn(url, latency_seconds, ok), called after every routed request."""
+        if fn not in self._observers:
+            self._observers.append(fn)
+
+    # ---------------- health checks ----------------
+    def check_health(self, timeout: float = 2.0) -> None:
+        """Probe every backend once; ejects failures and re-admits recovered ones."""
+        import requests
+
+        for b in self.backends:
+            try:
+                r = requests.get(f"{b.url}/api/tags", timeout=timeout)
+                healthy = r.status_code == 200
+            except Exception:
+                healthy = False
+            with self._cond:
+                b.healthy = healthy
+                b.last_check = time.time()
+                self._cond.notify_all()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.health_interval):
+            self.check_health()
+
+    def start_health_checks(self) -> None:
+        if self.health_interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="ollama-health", daemon=True)
+        self._thread.start()
+
+    def stop_health_checks(self) -> None:
+        self._stop.set()
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [b.snapshot() for b in self.backends]
+
+
+# Pool por proceso construido desde OLLAMA_BACKENDS (o OLLAMA_URL)
+LLM_ROUTER = OllamaRouter(OLLAMA_BACKENDS)
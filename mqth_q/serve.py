@@ -0,0 +1,73 @@
+# modo multi-proceso de la API
+#   - python -m mqth_q.serve: uvicorn con N workers (WEB_WORKERS; 0 = uno por CPU)
+#   - con más de un worker activa el modo multiproceso de prometheus_client
+#     (PROMETHEUS_MULTIPROC_DIR, se vacía al arrancar) para que /metrics sume todos los workers
+#   - también sirve como config de gunicorn:  gunicorn -c python:mqth_q.serve app:app
+#     (worker uvicorn y limpieza de métricas de workers muertos; cada worker precarga
+#     numpy/sklearn en segundo plano al arrancar, ver PRELOAD_HEAVY)
+# Las cachés de cada worker se mantienen coherentes con mqth_q.invalidation.
+# NOTA: el entorno del proceso padre se fija ANTES de importar app/prometheus_client.
+
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+from typing import Optional, Sequence
+
+MULTIPROC_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+
+def prepare_multiproc_dir(path: Optional[str] = None) -> str:
+    """Create (or empty) the shared metrics directory and export it for the workers."""
+    d = Path(path or os.environ.get(MULTIPROC_ENV) or Path(tempfile.gettempdir()) / "mqth_q_prometheus")
+    if d.exists():
+        shutil.rmtree(d)
+    d.mkdir(parents=True)
+    os.environ[MULTIPROC_ENV] = str(d)
+    return str(d)
+
+
+def resolve_workers(n: Optional[int]) -> int:
+    from .config import WEB_WORKERS
+    n = WEB_WORKERS if n is None else n
+    return n if n > 0 else (os.cpu_count() or 1)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m mqth_q.serve", description="Run the API with N worker processes.")
+    ap.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    ap.add_argument("--workers", type=int, default=None, help="Processes (default WEB_WORKERS; 0 = CPUs)")
+    ap.add_argument("--app", default="app:app")
+    args = ap.parse_args(argv)
+
+    from .startup import load_env
+    load_env()
+    workers = resolve_workers(args.workers)
+    if workers > 1:
+        print(f"{workers} workers, metrics dir {prepare_multiproc_dir()}")
+
+    import uvicorn
+    uvicorn.run(args.app, host=args.host, port=args.port, workers=workers)
+    return 0
+
+
+# ---------------- gunicorn config (gunicorn -c python:mqth_q.serve app:app) ----------------
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_WORKERS", "1")) or (os.cpu_count() or 1)
+
+def on_starting(server) -> None:
+    prepare_multiproc_dir()
+
+def child_exit(server, worker) -> None:
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
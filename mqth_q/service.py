@@ -4,26 +4,35 @@
 # Retorna diccionarios simples 
 
 from __future__ import annotations
-from typing import Dict, List, Optional
+
 import logging
-from statistics import mean
+from typing import Dict, Iterator, List, Optional, Tuple
 
+from .admission import ADMISSION
 from .config import RECS_K
 from .db import (
-    get_user_id, fetch_question, save_attempt, get_attempts,
+    fetch_question,
+    fetch_questions,
+    get_attempts,
+    get_exercise_stats as db_get_exercise_stats,
+    get_user_id,
+    list_exercise_stats as db_list_exercise_stats,
     list_topics as db_list_topics,
-    pick_unseen_by_topic, pick_any_by_topic
+    pick_any_by_topic,
+    pick_unseen_by_topic,
+    save_attempt,
+    save_attempts,
+    search_questions as db_search_questions,
 )
+from .grading import grade_best_batch, grade_best_streaming, grade_best_with_feedback
+from .history import load_history
 from .recommender import recommend_next
-from .grading import grade_best_with_feedback
+from .tracing import traced
 
 log = logging.getLogger(__name__)
 
 # ---------------- Read helpers ----------------
-def get_question_card(exercise_id: str) -> Dict:
-    q = fetch_question(exercise_id)
-    if not q:
-        raise ValueError(f"Unknown exercise_id: {exercise_id}")
+def _card(q: Dict) -> Dict:
     return {
         "exercise_id": q["exercise_id"],
         "question": q["question"],
@@ -32,25 +41,44 @@ def get_question_card(exercise_id: str) -> Dict:
         "exam_type": q.get("exam_type"),
     }
 
-def next_questions_for(username: str, k: int = RECS_K) -> List[Dict]:
-    uid = get_user_id(username)
-    ids = recommend_next(uid, k=k)
+@traced()
+def get_question_card(exercise_id: str) -> Dict:
+    q = fetch_question(exercise_id)
+    if not q:
+        raise ValueError(f"Unknown exercise_id: {exercise_id}")
+    return _card(q)
+
+@traced()
+def question_cards(exercise_ids: List[str]) -> List[Dict]:
+    """Cards for many ids in one DB round trip (order kept, unknown ids skipped)."""
+    found = fetch_questions(exercise_ids)
     out: List[Dict] = []
-    for ex in ids:
-        try:
-            out.append(get_question_card(ex))
-        except Exception as e:
-            log.warning("Skipping %s: %s", ex, e)
+    for ex in exercise_ids:
+        if ex in found:
+            out.append(_card(found[ex]))
+        else:
+            log.warning("Skipping %s: unknown exercise_id", ex)
     return out
 
+@traced()
+def recommend_ids(username: str, k: int = RECS_K) -> List[str]:
+    return recommend_next(get_user_id(username), k=k)
+
+@traced()
+def next_questions_for(username: str, k: int = RECS_K) -> List[Dict]:
+    return question_cards(recommend_ids(username, k=k))
+
+@traced()
 def list_topics() -> List[str]:
     return db_list_topics()
 
-def get_recent_attempts(username: str, limit: int = 20) -> List[Dict]:
+@traced()
+def get_recent_attempts(username: str, limit: int = 20, details: bool = False) -> List[Dict]:
+    """Compact history; details=True adds answer/reasons/hint (read from the archive if moved)."""
     uid = get_user_id(username)
-    atts = get_attempts(uid, limit=limit)
+    atts = get_attempts(uid, limit=limit, include_archived=details)
     # compact
-    return [
+    out = [
         {
             "ts": a["ts"],
             "exercise_id": a["exercise_id"],
@@ -60,50 +88,40 @@ def get_recent_attempts(username: str, limit: int = 20) -> List[Dict]:
         }
         for a in atts
     ]
+    if details:
+        for o, a in zip(out, atts):
+            o.update(student_answer=a.get("student_answer"), reasons=a.get("reasons"), hint=a.get("hint"))
+    return out
 
+@traced()
 def get_user_summary(username: str) -> Dict:
     uid = get_user_id(username)
-    atts = get_attempts(uid, limit=10_000)
-    if not atts:
+    hist = load_history(uid, limit=10_000)
+    if not len(hist):
         return {
             "username": username,
             "overall": {"attempts": 0, "correct_rate": 0.0, "avg_score": 0.0, "last_attempt_ts": None},
             "by_topic": []
         }
-    scores = [float(a["score"]) for a in atts if a["score"] is not None]
-    correct = [int(a["correct"]) for a in atts if a["correct"] is not None]
-    last_ts = max(a["ts"] for a in atts if a["ts"] is not None)
-
-    by_topic: Dict[str, List[float]] = {}
-    by_topic_corr: Dict[str, List[int]] = {}
-    for a in atts:
-        t = a.get("topic") or "unknown"
-        by_topic.setdefault(t, []).append(float(a["score"]) if a["score"] is not None else 0.0)
-        by_topic_corr.setdefault(t, []).append(int(a["correct"]) if a["correct"] is not None else 0)
-
-    per_topic = []
-    for t in sorted(by_topic.keys()):
-        xs = by_topic[t]
-        cs = by_topic_corr[t]
-        per_topic.append({
-            "topic": t,
-            "n": len(xs),
-            "avg_score": round(mean(xs), 3) if xs else 0.0,
-            "correct_rate": round(sum(cs)/len(cs), 3) if cs else 0.0
-        })
-
+    overall = hist.overall()
+    per_topic = [
+        {"topic": t["topic"], "n": t["n"],
+         "avg_score": round(t["avg_score"], 3), "correct_rate": round(t["correct_rate"], 3)}
+        for t in hist.by_topic()
+    ]
     return {
         "username": username,
         "overall": {
-            "attempts": len(scores),
-            "correct_rate": round(sum(correct)/len(correct), 3) if correct else 0.0,
-            "avg_score": round(mean(scores), 3) if scores else 0.0,
-            "last_attempt_ts": last_ts
+            "attempts": overall["attempts"],
+            "correct_rate": round(overall["correct_rate"], 3),
+            "avg_score": round(overall["avg_score"], 3),
+            "last_attempt_ts": overall["last_attempt_ts"]
         },
         "by_topic": per_topic
     }
 
 # --------------- Pick random by topic ---------------
+@traced()
 def pick_random_by_topic(username: str, topic: str, only_unseen: bool = True) -> Optional[Dict]:
     uid = get_user_id(username)
     row = None
@@ -113,8 +131,27 @@ def pick_random_by_topic(username: str, topic: str, only_unseen: bool = True) ->
         row = pick_any_by_topic(topic)
     return row
 
+# --------------- Full-text search ---------------
+@traced()
+def search_questions(q: str, topic: Optional[str] = None, unseen_for: Optional[str] = None,
+                     limit: int = 20, offset: int = 0) -> Dict:
+    uid = get_user_id(unseen_for) if unseen_for else None
+    res = db_search_questions(q, topic=topic, unseen_for=uid, limit=limit, offset=offset)
+    return {"query": q, "total": res["total"], "limit": limit, "offset": offset, "items": res["items"]}
+
+@traced()
+def exercise_stats(exercise_id: str) -> Dict:
+    s = db_get_exercise_stats(exercise_id)
+    if s is None:
+        raise ValueError(f"Unknown exercise_id: {exercise_id}")
+    return s
+
+@traced()
+def list_exercise_stats(topic: Optional[str] = None, min_attempts: int = 0) -> List[Dict]:
+    return db_list_exercise_stats(topic=topic, min_attempts=min_attempts)
+
 # ---------------- Write (grade + save) ----------------
-def submit_answer(username: str, exercise_id: str, student_answer: str) -> Dict:
+def _prepare_submission(username: str, exercise_id: str, student_answer: str) -> Tuple[int, Dict]:
     if not student_answer or not student_answer.strip():
         raise ValueError("Empty answer.")
 
@@ -122,16 +159,11 @@ def submit_answer(username: str, exercise_id: str, student_answer: str) -> Dict:
     q = fetch_question(exercise_id)
     if not q:
         raise ValueError(f"Unknown exercise_id: {exercise_id}")
+    return uid, q
 
-    result = grade_best_with_feedback(q["question"], q["solution"], student_answer)
-
-    try:
-        save_attempt(uid, exercise_id, result, student_answer)
-    except Exception as e:
-        log.error("Failed to save attempt for %s/%s: %s", username, exercise_id, e)
-
+def _render(q: Dict, result: Dict) -> Dict:
     return {
-        "exercise_id": exercise_id,
+        "exercise_id": q["exercise_id"],
         "topic": q.get("topic"),
         "date": q.get("date"),
         "score": float(result.get("score", 0.0)),
@@ -139,3 +171,77 @@ def submit_answer(username: str, exercise_id: str, student_answer: str) -> Dict:
         "reasons": result.get("reasons", ""),
         "hint": result.get("hint", ""),
     }
+
+def _save_and_render(username: str, uid: int, q: Dict, result: Dict, student_answer: str) -> Dict:
+    exercise_id = q["exercise_id"]
+    try:
+        save_attempt(uid, exercise_id, result, student_answer)
+    except Exception as e:
+        log.error("Failed to save attempt for %s/%s: %s", username, exercise_id, e)
+    return _render(q, result)
+
+@traced()
+def submit_answer(username: str, exercise_id: str, student_answer: str) -> Dict:
+    uid, q = _prepare_submission(username, exercise_id, student_answer)
+    # rate limit (RateLimited) + fair LLM slot around the LLM call only (not the near-dup
+    # lookup or the baseline); shed requests are graded by the baseline
+    ADMISSION.check_rate(username)
+    result = grade_best_with_feedback(q["question"], q["solution"], student_answer,
+                                      exercise_id=exercise_id, topic=q.get("topic"),
+                                      slot=lambda: ADMISSION.slot(username))
+    return _save_and_render(username, uid, q, result, student_answer)
+
+def submit_answer_stream(username: str, exercise_id: str, student_answer: str) -> Iterator[Tuple[str, object]]:
+    """
+    Like submit_answer, but returns an iterator of ("token", str) events followed by one
+    ("result", dict) once the attempt is saved. Validation and the rate limit happen eagerly
+    (ValueError / RateLimited are raised here, before any event), so the API can still answer
+    400 / 429. The LLM slot is held only while the LLM tokens are streamed.
+    """
+    uid, q = _prepare_submission(username, exercise_id, student_answer)
+    ADMISSION.check_rate(username)
+
+    def _events():
+        for kind, payload in grade_best_streaming(q["question"], q["solution"], student_answer,
+                                                  exercise_id=exercise_id, topic=q.get("topic"),
+                                                  slot=lambda: ADMISSION.slot(username)):
+            if kind == "result":
+                yield "result", _save_and_render(username, uid, q, payload, student_answer)
+            else:
+                yield kind, payload
+
+    return _events()
+
+@traced()
+def submit_answers(username: str, answers: List[Tuple[str, str]]) -> Dict:
+    """
+    Grade a whole exam sheet [(exercise_id, answer), ...] and save it in one transaction.
+    The user and the questions are resolved once; grading runs concurrently
+    (grade_best_batch) and the batch spends one rate-limit token per answer, while each LLM
+    call still takes its own fair admission slot. Returns per-item results in input order.
+    """
+    if not answers:
+        raise ValueError("Empty batch.")
+    if any(not a or not a.strip() for _, a in answers):
+        raise ValueError("Empty answer.")
+    qs = fetch_questions(ex for ex, _ in answers)
+    unknown = [ex for ex, _ in answers if ex not in qs]
+    if unknown:
+        raise ValueError(f"Unknown exercise_id: {', '.join(dict.fromkeys(unknown))}")
+    ADMISSION.check_rate(username, cost=len(answers))
+    uid = get_user_id(username)
+
+    items = [{"question": qs[ex]["question"], "solution": qs[ex]["solution"], "student": a,
+              "exercise_id": ex, "topic": qs[ex].get("topic")} for ex, a in answers]
+    results = grade_best_batch(items, slot=lambda: ADMISSION.slot(username))
+    try:
+        save_attempts(uid, [(ex, r, a) for (ex, a), r in zip(answers, results)])
+    except Exception as e:
+        log.error("Failed to save %d attempts for %s: %s", len(answers), username, e)
+
+    out = [_render(qs[ex], r) for (ex, _), r in zip(answers, results)]
+    return {
+        "items": out,
+        "n_correct": sum(o["correct"] for o in out),
+        "avg_score": sum(o["score"] for o in out) / len(out),
+    }
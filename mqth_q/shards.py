@@ -0,0 +1,252 @@
+# sharding por cohortes (DB_SHARDS > 1): estado, fijar usuarios y rebalanceo
+#   - DB_PATH queda como catálogo + tabla de ruteo user_shards (username -> user_id, shard);
+#     users/attempts/exercise_stats/attempt_archives viven en <db>.shard<i>.db
+#   - un usuario nuevo va a home_shard(username) (hash estable); `pin` lo fija en otro shard
+#     (p.ej. una cohorte entera en su propio fichero) y `rebalance` lo respeta
+#   - rebalance: barre todos los ficheros (también la DB principal de antes del sharding) y
+#     mueve las filas que no están en su shard destino: tras cambiar DB_SHARDS, tras `pin`,
+#     o filas escritas durante un movimiento por un proceso con el ruteo viejo en caché
+#   - mover un usuario: BEGIN IMMEDIATE en el origen (sus escrituras esperan), se copian
+#     intentos (con el texto archivado restaurado) y su aporte a exercise_stats al destino,
+#     se actualiza el ruteo, y solo entonces se borra del origen. Las sumas de exercise_stats
+#     son por usuario: restar en el origen y sumar en el destino da lo mismo que reconstruir.
+#     Reintentar tras un fallo no duplica (los intentos ya copiados se reconocen por ts/ejercicio/score)
+#   - publica el canal "shards": las APIs vacían su caché de ruteo (db.clear_routes)
+#
+# CLI:  python -m mqth_q.shards status | pin USER SHARD | unpin USER | rebalance [--dry-run]
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from . import db
+from .archive import fill_from
+from .exercise_stats import FIELDS, aggregate_chunk
+
+
+def _raw(shard: Optional[int]) -> sqlite3.Connection:
+    """Connection to one file only: no attached catalog, so BEGIN IMMEDIATE locks just that file."""
+    con = db._open(db.shard_path(shard) if shard is not None else db.DB_PATH, False)
+    con.row_factory = sqlite3.Row
+    return con
+
+
+def _all_dbs() -> List[Optional[int]]:
+    return [None] + list(range(db.SHARDS))
+
+
+def _contributions(rows: List[Dict[str, Any]]) -> Dict[str, List[float]]:
+    """exercise_stats sums of one user's attempts (rows in time order)."""
+    import numpy as np
+    if not rows:
+        return {}
+    codes: Dict[str, int] = {}
+    ex = np.fromiter((codes.setdefault(r["exercise_id"], len(codes)) for r in rows), np.int64, len(rows))
+    out = aggregate_chunk(np.zeros(len(rows), dtype=np.int64), ex,
+                          np.array([r["score"] for r in rows], dtype=np.float64),
+                          np.fromiter((r["correct"] or 0 for r in rows), np.float64, len(rows)), len(codes))
+    return {e: out[k].tolist() for e, k in codes.items()}
+
+
+def _apply(cur: sqlite3.Cursor, contrib: Dict[str, List[float]], sign: int) -> None:
+    now = time.time()
+    cur.executemany(f"""
+      INSERT INTO exercise_stats(exercise_id, {", ".join(FIELDS)}, updated_ts)
+      VALUES(?, {", ".join("?" * len(FIELDS))}, ?)
+      ON CONFLICT(exercise_id) DO UPDATE SET
+        {", ".join(f"{f} = {f} + excluded.{f}" for f in FIELDS)}, updated_ts = excluded.updated_ts
+    """, [(e, *[sign * v for v in sums], now) for e, sums in contrib.items()])
+
+
+def _diff(a: Dict[str, List[float]], b: Dict[str, List[float]]) -> Dict[str, List[float]]:
+    return {e: [x - y for x, y in zip(a.get(e, [0.0] * len(FIELDS)), b.get(e, [0.0] * len(FIELDS)))]
+            for e in set(a) | set(b)}
+
+
+def _set_route(cur: sqlite3.Cursor, user_id: int, username: str, shard: int, pinned: Optional[bool]) -> None:
+    cur.execute("""
+      INSERT INTO user_shards(user_id, username, shard, pinned) VALUES(?,?,?,?)
+      ON CONFLICT(username) DO UPDATE SET shard = excluded.shard,
+        pinned = CASE WHEN ? IS NULL THEN pinned ELSE excluded.pinned END
+    """, (user_id, username, shard, int(bool(pinned)), pinned))
+    db.bump_generation(cur, "shards")
+
+
+def _user_id(username: str) -> int:
+    """Id from the routing table; a pre-sharding user keeps its id; otherwise a new one."""
+    with db._con() as con:
+        row = con.execute("SELECT user_id FROM user_shards WHERE username=?", (username,)).fetchone()
+        if row is None:
+            row = con.execute("SELECT user_id FROM users WHERE username=?", (username,)).fetchone()
+        if row is None:
+            cur = con.execute("INSERT INTO user_shards(username, shard) VALUES(?,?)",
+                              (username, db.home_shard(username)))
+            return int(cur.lastrowid)
+        return int(row[0])
+
+
+def _move(username: str, user_id: int, src: Optional[int], dest: int, pinned: Optional[bool]) -> int:
+    """Move the rows `src` holds for `username` to shard `dest`; returns attempts copied."""
+    s = _raw(src)
+    s.isolation_level = None
+    d = _raw(dest)
+    try:
+        s.execute("BEGIN IMMEDIATE")                  # the user's writes to src wait for the move
+        row = s.execute("SELECT user_id FROM users WHERE username=?", (username,)).fetchone()
+        if row is None:
+            s.execute("ROLLBACK")
+            return 0
+        src_id = int(row[0])
+        moving = [dict(r) for r in s.execute(
+            "SELECT * FROM attempts WHERE user_id=? ORDER BY ts, attempt_id", (src_id,))]
+        fill_from(moving, src)                        # archived text travels with the rows
+        for r in moving:
+            r["user_id"] = user_id
+
+        # 1) destination: merged history, stats adjusted by (merged - what dest already had)
+        have = [dict(r) for r in d.execute(
+            "SELECT * FROM attempts WHERE user_id=? ORDER BY ts, attempt_id", (user_id,))]
+        seen = {(r["ts"], r["exercise_id"], r["score"]) for r in have}
+        new = [r for r in moving if (r["ts"], r["exercise_id"], r["score"]) not in seen]
+        merged = sorted(have + new, key=lambda r: r["ts"] or 0.0)
+        cur = d.cursor()
+        cur.execute("INSERT OR IGNORE INTO users(user_id, username) VALUES(?,?)", (user_id, username))
+        cols = [c for c in moving[0] if c not in ("attempt_id", "archive_segment")] if moving else []
+        if new:
+            cur.executemany(f"INSERT INTO attempts({', '.join(cols)}) VALUES({', '.join('?' * len(cols))})",
+                            [[r[c] for c in cols] for r in new])
+        _apply(cur, _diff(_contributions(merged), _contributions(have)), +1)
+        d.commit()
+
+        # 2) routing (in the catalog; when src is the main DB it is the same file/transaction)
+        if src is None:
+            _set_route(s.cursor(), user_id, username, dest, pinned)
+        else:
+            with db._con() as con:
+                _set_route(con.cursor(), user_id, username, dest, pinned)
+
+        # 3) source
+        cur = s.cursor()
+        _apply(cur, _contributions(moving), -1)
+        cur.execute("DELETE FROM attempts WHERE user_id=?", (src_id,))
+        cur.execute("DELETE FROM users WHERE user_id=?", (src_id,))
+        s.execute("COMMIT")
+        return len(new)
+    except BaseException:
+        if s.in_transaction:
+            s.execute("ROLLBACK")
+        raise
+    finally:
+        s.close()
+        d.close()
+
+
+def place(username: str, shard: int, pinned: Optional[bool] = None) -> int:
+    """Put `username` (and all its rows) on `shard`; pinned=True/False also (un)pins it."""
+    if db.SHARDS <= 1:
+        raise ValueError("Sharding is off (DB_SHARDS <= 1).")
+    if not 0 <= shard < db.SHARDS:
+        raise ValueError(f"Shard must be in [0, {db.SHARDS}).")
+    db.init_db()
+    user_id = _user_id(username)
+    moved = sum(_move(username, user_id, src, shard, pinned) for src in _all_dbs() if src != shard)
+    with db._con() as con:
+        _set_route(con.cursor(), user_id, username, shard, pinned)
+    with db._con(shard) as con:
+        con.execute("INSERT OR IGNORE INTO users(user_id, username) VALUES(?,?)", (user_id, username))
+    db.clear_routes()
+    return moved
+
+
+def plan() -> List[Tuple[str, Optional[int], int]]:
+    """(username, from, to) for every file holding rows of a user outside its target shard."""
+    with db._con() as con:
+        routes = {r["username"]: (int(r["shard"]), bool(r["pinned"]))
+                  for r in con.execute("SELECT username, shard, pinned FROM user_shards")}
+    moves = []
+    for src in _all_dbs():
+        with db._con(src) as con:
+            try:
+                names = [r[0] for r in con.execute("SELECT username FROM users")]
+            except sqlite3.OperationalError:
+                continue
+        for name in names:
+            shard, pinned = routes.get(name, (None, False))
+            target = shard if pinned else db.home_shard(name)
+            if src != target:
+                moves.append((name, src, target))
+    return moves
+
+
+def rebalance(dry_run: bool = False, log=print) -> Dict[str, int]:
+    if db.SHARDS <= 1:
+        raise ValueError("Sharding is off (DB_SHARDS <= 1).")
+    t0 = time.perf_counter()
+    db.init_db()
+    moves = plan()
+    stats = {"users": len({m[0] for m in moves}), "attempts": 0}
+    for name, src, dest in moves:
+        if dry_run:
+            log(f"{name}: {'main' if src is None else src} -> {dest}")
+            continue
+        stats["attempts"] += _move(name, _user_id(name), src, dest, None)
+    db.clear_routes()
+    log(f"{'dry run' if dry_run else 'rebalanced'} in {time.perf_counter() - t0:.2f}s: {stats}")
+    return stats
+
+
+def status() -> Dict[str, Any]:
+    out: Dict[str, Any] = {"shards": db.SHARDS, "files": []}
+    for src in _all_dbs() if db.SHARDS > 1 else [None]:
+        path = db.shard_path(src) if src is not None else db.DB_PATH
+        if not os.path.exists(path):
+            continue
+        with db._con(src) as con:
+            try:
+                users = con.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+                attempts = con.execute("SELECT COUNT(*) FROM attempts").fetchone()[0]
+            except sqlite3.OperationalError:
+                users = attempts = 0
+        out["files"].append({"shard": src, "path": path, "users": users, "attempts": attempts,
+                             "bytes": os.path.getsize(path)})
+    if db.SHARDS > 1:
+        with db._con() as con:
+            out["pinned"] = con.execute("SELECT COUNT(*) FROM user_shards WHERE pinned").fetchone()[0]
+        out["misplaced"] = len(plan())
+    return out
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m mqth_q.shards",
+                                 description="Inspect and rebalance the per-cohort SQLite shards.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status", help="Users/attempts/size per file")
+    p = sub.add_parser("pin", help="Move a user to a shard and keep it there")
+    p.add_argument("username")
+    p.add_argument("shard", type=int)
+    p = sub.add_parser("unpin", help="Let rebalance move the user back to its home shard")
+    p.add_argument("username")
+    p = sub.add_parser("rebalance", help="Move users to their target shard (after changing DB_SHARDS)")
+    p.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args(argv)
+    if args.cmd == "status":
+        print(json.dumps(status(), indent=2))
+    elif args.cmd == "pin":
+        print(f"{args.username}: {place(args.username, args.shard, pinned=True)} attempts moved")
+    elif args.cmd == "unpin":
+        with db._con() as con:
+            con.execute("UPDATE user_shards SET pinned = 0 WHERE username=?", (args.username,))
+        print(f"{args.username}: unpinned (run rebalance to move it home)")
+    else:
+        rebalance(dry_run=args.dry_run)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
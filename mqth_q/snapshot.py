@@ -0,0 +1,192 @@
+# réplica de analítica: copia de solo lectura de la DB viva
+#   - take_snapshot(): API de backup online de SQLite (Connection.backup) en pasos de
+#     SNAPSHOT_PAGES páginas con SNAPSHOT_SLEEP s entre pasos, a un fichero temporal que luego
+#     se renombra (los lectores nunca ven una copia a medias)
+#   - la conexión origen mantiene abierta UNA transacción de lectura durante la copia: con WAL
+#     la copia ve una foto fija y no se reinicia con cada save_attempt (sin ella, con escrituras
+#     continuas, el backup se reiniciaba indefinidamente)
+#   - con DB_SHARDS se copia también cada shard a <réplica>.shard<i>.db (antes que el catálogo,
+#     que se renombra el último); cada fichero es una foto coherente y un usuario vive en un solo
+#     shard, así que sus lecturas siguen siendo coherentes
+#   - reading(): las funciones de db.* dentro del bloque leen de la réplica (grade_eval,
+#     notebooks, endpoints con ?consistency=snapshot); los informes no compiten con la calificación
+#   - Snapshotter: refresco periódico en segundo plano (SNAPSHOT_INTERVAL); con varios workers
+#     solo copia quien encuentra la réplica vencida
+#
+# CLI:  python -m mqth_q.snapshot [--every SECONDS] [--pages N] [--sleep S] [--path FILE]
+
+from __future__ import annotations
+
+import argparse
+from contextlib import contextmanager
+import logging
+import os
+from pathlib import Path
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Sequence
+
+from . import db
+from .config import SNAPSHOT_INTERVAL, SNAPSHOT_PAGES, SNAPSHOT_PATH, SNAPSHOT_SLEEP
+
+log = logging.getLogger(__name__)
+
+
+class SnapshotUnavailable(RuntimeError):
+    """No analytics snapshot has been taken yet."""
+
+
+def snapshot_path() -> Path:
+    if SNAPSHOT_PATH:
+        return Path(SNAPSHOT_PATH)
+    live = Path(db.DB_PATH)
+    return live.with_name(f"{live.stem}.snapshot{live.suffix or '.db'}")
+
+
+def _copy(src_path: str, dest: Path, pages: int, sleep: float, meta: bool) -> Dict[str, Any]:
+    """Paced backup of one DB file to `dest` (tmp + rename); returns {pages, steps, taken_ts}."""
+    tmp = dest.with_name(f"{dest.name}.{os.getpid()}.tmp")
+    steps = [0, 0]
+
+    def progress(status: int, remaining: int, total: int) -> None:
+        steps[0] += 1
+        steps[1] = total
+
+    src = sqlite3.connect(src_path, timeout=2.0)
+    src.isolation_level = None
+    out = sqlite3.connect(tmp)
+    try:
+        src.execute("BEGIN")                                   # pin one read snapshot of the WAL
+        taken_ts = time.time()
+        src.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone()
+        src.backup(out, pages=max(1, pages), progress=progress, sleep=sleep)
+        src.execute("COMMIT")
+        out.execute("PRAGMA journal_mode=DELETE")              # self-contained file, no -wal
+        if meta:
+            out.execute("CREATE TABLE IF NOT EXISTS snapshot_meta(id INTEGER PRIMARY KEY CHECK (id = 1), "
+                        "taken_ts REAL, source TEXT, pages INTEGER)")
+            out.execute("INSERT OR REPLACE INTO snapshot_meta(id, taken_ts, source, pages) VALUES(1,?,?,?)",
+                        (taken_ts, src_path, steps[1]))
+        out.commit()
+    except BaseException:
+        out.close()
+        tmp.unlink(missing_ok=True)
+        raise
+    finally:
+        src.close()
+    out.close()
+    os.replace(tmp, dest)
+    return {"pages": steps[1], "steps": steps[0], "taken_ts": taken_ts}
+
+
+def take_snapshot(path: Optional[str] = None, pages: int = SNAPSHOT_PAGES,
+                  sleep: float = SNAPSHOT_SLEEP) -> Dict[str, Any]:
+    """Copy the live DB to `path` (default snapshot_path()) and return {path, pages, steps, seconds, taken_ts}."""
+    dest = Path(path) if path else snapshot_path()
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    t0 = time.perf_counter()
+    live = str(db.DB_PATH)
+    total = {"pages": 0, "steps": 0}
+    for shard in db.user_dbs():
+        if shard is not None:
+            part = _copy(db.shard_path(shard, live), Path(db.shard_path(shard, str(dest))), pages, sleep, False)
+            total["pages"] += part["pages"]
+            total["steps"] += part["steps"]
+    main = _copy(live, dest, pages, sleep, True)
+    return {"path": str(dest), "pages": total["pages"] + main["pages"], "steps": total["steps"] + main["steps"],
+            "seconds": round(time.perf_counter() - t0, 3), "taken_ts": main["taken_ts"]}
+
+
+def snapshot_info(path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """{taken_ts, age, path} of the current snapshot, or None if there is none."""
+    p = Path(path) if path else snapshot_path()
+    if not p.exists():
+        return None
+    con = sqlite3.connect(f"file:{p}?mode=ro", uri=True)
+    try:
+        row = con.execute("SELECT taken_ts FROM snapshot_meta WHERE id = 1").fetchone()
+    except sqlite3.Error:
+        row = None
+    finally:
+        con.close()
+    taken = float(row[0]) if row else p.stat().st_mtime
+    return {"path": str(p), "taken_ts": taken, "age": round(time.time() - taken, 3)}
+
+
+@contextmanager
+def reading(path: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Run db.* reads in the block against the snapshot; yields snapshot_info()."""
+    info = snapshot_info(path)
+    if info is None:
+        raise SnapshotUnavailable("No analytics snapshot yet (python -m mqth_q.snapshot).")
+    with db.reading_snapshot(info["path"]):
+        yield info
+
+
+class Snapshotter:
+    def __init__(self, interval: float = SNAPSHOT_INTERVAL):
+        self.interval = float(interval)
+        self.last: Optional[Dict[str, Any]] = None
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def due(self) -> bool:
+        info = snapshot_info()
+        return info is None or info["age"] >= self.interval
+
+    def refresh(self, force: bool = False) -> Optional[Dict[str, Any]]:
+        """Take a snapshot if forced or the current one is older than the interval."""
+        if not force and not self.due():
+            return None
+        self.last = take_snapshot()
+        log.info("analytics snapshot: %s", self.last)
+        return self.last
+
+    def _loop(self) -> None:
+        while not self._stop.wait(min(self.interval, 60.0)):
+            try:
+                self.refresh()
+            except Exception as e:
+                self.errors += 1
+                log.warning("analytics snapshot failed: %s", e)
+
+    def start(self) -> None:
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def snapshot(self) -> Dict[str, Any]:
+        info = snapshot_info()
+        return {"interval": self.interval, "age": info["age"] if info else None,
+                "last": self.last, "errors": self.errors}
+
+
+# Un refresco por proceso (la API lo arranca si SNAPSHOT_INTERVAL > 0)
+SNAPSHOTS = Snapshotter()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m mqth_q.snapshot",
+                                 description="Copy the live DB into the read-only analytics snapshot.")
+    ap.add_argument("--path", default=None, help="Destination (default SNAPSHOT_PATH or <db>.snapshot.db)")
+    ap.add_argument("--pages", type=int, default=SNAPSHOT_PAGES, help="Pages copied per step")
+    ap.add_argument("--sleep", type=float, default=SNAPSHOT_SLEEP, help="Seconds between steps")
+    ap.add_argument("--every", type=float, default=0, help="Keep refreshing every N seconds")
+    args = ap.parse_args(argv)
+    while True:
+        print(take_snapshot(args.path, pages=args.pages, sleep=args.sleep))
+        if args.every <= 0:
+            return 0
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
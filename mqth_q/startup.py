@@ -0,0 +1,134 @@
+# arranque rápido de la API / workers
+#   - load_env(): carga .env solo si existe (python-dotenv se importa únicamente en ese caso)
+#   - preload(): importa y calienta lo pesado (numpy, scikit-learn, requests) fuera del camino
+#     de la primera request; app.py lo lanza en un hilo al arrancar cada worker (PRELOAD_HEAVY)
+#   - profile_imports(): resumen de `python -X importtime -c "import app"` (benchmark de arranque)
+#
+# CLI:  python -m mqth_q.startup [--target app] [--top 15] [--json reports/import_time.json]
+#                                [--budget-ms 800] [--forbid numpy,sklearn,pandas]
+# NOTA: este módulo no importa mqth_q.config al cargarse (load_env debe correr antes).
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from pathlib import Path
+import re
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+# módulos que la API no debe importar al arrancar (se cargan en el primer uso)
+HEAVY_MODULES = ("numpy", "scipy", "sklearn", "pandas", "requests")
+
+
+def load_env(filename: str = ".env") -> Optional[str]:
+    """Same lookup as find_dotenv(usecwd=True), but only imports dotenv when a file exists."""
+    here = Path.cwd()
+    for d in (here, *here.parents):
+        f = d / filename
+        if f.is_file():
+            from dotenv import load_dotenv
+            load_dotenv(f)
+            return str(f)
+    return None
+
+
+def preload() -> float:
+    """Import and exercise the heavy grading stack once; returns seconds spent."""
+    t0 = time.perf_counter()
+    import numpy  # noqa: F401
+    import requests  # noqa: F401
+
+    from .baseline import baseline_cosine_batch, baseline_grade
+    baseline_grade("warm up the vectorizer", "warm up", topic=None)
+    baseline_cosine_batch(["a b"], ["a c"])
+    return time.perf_counter() - t0
+
+
+# ---------------- import-time profile ----------------
+_LINE_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def profile_imports(target: str = "app", python: str = sys.executable,
+                    cwd: Optional[str] = None) -> Dict[str, Any]:
+    """Run `python -X importtime -c 'import <target>'` in a fresh process and summarize."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    code = f"import {target}"
+    t0 = time.perf_counter()
+    try:
+        proc = subprocess.run([python, "-X", "importtime", "-c", code], cwd=cwd, env=env,
+                              capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"import {target} failed (exit {e.returncode}):\n"
+                           f"{e.stderr[-2000:]}") from e
+    wall = time.perf_counter() - t0
+
+    rows: List[Dict[str, Any]] = []
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            self_us, cum_us, indent, name = m.groups()
+            rows.append({"module": name, "self_ms": int(self_us) / 1000,
+                         "cumulative_ms": int(cum_us) / 1000, "depth": len(indent) // 2})
+    top_level = [r for r in rows if r["depth"] == 0]
+    target_row = next((r for r in rows if r["module"] == target), None)
+    loaded = {r["module"].split(".")[0] for r in rows}
+    return {
+        "target": target,
+        "python": sys.version.split()[0],
+        "wall_s": round(wall, 3),
+        "import_ms": target_row["cumulative_ms"] if target_row else sum(r["cumulative_ms"] for r in top_level),
+        "modules": len(rows),
+        "heavy_loaded": sorted(loaded & set(HEAVY_MODULES)),
+        "rows": rows,
+    }
+
+
+def format_profile(prof: Dict[str, Any], top: int = 15) -> str:
+    lines = [
+        f"import {prof['target']}: {prof['import_ms']:.1f} ms "
+        f"({prof['modules']} modules, process wall {prof['wall_s']:.2f}s, Python {prof['python']})",
+        f"heavy modules loaded: {', '.join(prof['heavy_loaded']) or 'none'}",
+        f"{'cumulative ms':>14} {'self ms':>9}  module",
+    ]
+    for r in sorted(prof["rows"], key=lambda r: -r["cumulative_ms"])[:top]:
+        lines.append(f"{r['cumulative_ms']:>14.1f} {r['self_ms']:>9.1f}  {'  ' * r['depth']}{r['module']}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m mqth_q.startup", description="Startup import-time profile.")
+    ap.add_argument("--target", default="app")
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--runs", type=int, default=3, help="Keep the fastest of N runs")
+    ap.add_argument("--json", type=Path, default=None, help="Write the summary (without rows) here")
+    ap.add_argument("--budget-ms", type=float, default=None, help="Fail if import time exceeds this")
+    ap.add_argument("--forbid", default=",".join(HEAVY_MODULES),
+                    help="Comma list of top-level packages that must not load ('' to skip)")
+    args = ap.parse_args(argv)
+
+    prof = min((profile_imports(args.target) for _ in range(max(1, args.runs))),
+               key=lambda p: p["import_ms"])
+    print(format_profile(prof, args.top))
+
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        summary = {k: v for k, v in prof.items() if k != "rows"}
+        summary["top"] = sorted(prof["rows"], key=lambda r: -r["cumulative_ms"])[:args.top]
+        args.json.write_text(json.dumps(summary, indent=2))
+
+    rc = 0
+    forbidden = sorted(set(filter(None, args.forbid.split(","))) & set(prof["heavy_loaded"]))
+    if forbidden:
+        print(f"FAIL: import {args.target} loaded {', '.join(forbidden)}", file=sys.stderr)
+        rc = 1
+    if args.budget_ms is not None and prof["import_ms"] > args.budget_ms:
+        print(f"FAIL: {prof['import_ms']:.1f} ms > budget {args.budget_ms:.1f} ms", file=sys.stderr)
+        rc = 1
+    return rc
+
+
+if __name__ == "__main__":
+    sys.exit(main())
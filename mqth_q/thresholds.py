@@ -0,0 +1,37 @@
+# tabla en memoria de umbrales calibrados (grade_thresholds en la DB)
+# baseline_grade la consulta al calificar; no depende de numpy para que el arranque sea liviano
+# (el ajuste de umbrales vive en calibration.py)
+
+from __future__ import annotations
+
+import threading
+from typing import Dict, Optional
+
+from .config import GRADE_THRESHOLD
+from .db import load_thresholds
+
+GLOBAL_KEY = "*"   # fila de grade_thresholds con el umbral global
+
+_table: Optional[Dict[str, float]] = None
+_lock = threading.Lock()
+
+def reload_thresholds() -> Dict[str, float]:
+    """(Re)load grade_thresholds from the DB; missing table/DB -> empty (GRADE_THRESHOLD)."""
+    global _table
+    try:
+        t = load_thresholds()
+    except Exception:
+        t = {}
+    with _lock:
+        _table = t
+    return t
+
+def threshold_for(topic: Optional[str] = None) -> float:
+    """Per-topic threshold -> calibrated global -> config GRADE_THRESHOLD."""
+    t = _table if _table is not None else reload_thresholds()
+    if topic and topic in t:
+        return t[topic]
+    return t.get(GLOBAL_KEY, GRADE_THRESHOLD)
+
+def thresholds_snapshot() -> Dict[str, float]:
+    return dict(_table or {})
@@ -0,0 +1,159 @@
+# clasificación de topic_pred en lote (reemplaza la celda de 0_data.ipynb)
+#   - mismas semillas por tema y mismos rasgos: TF-IDF de palabras (1-2) + caracteres (3-5)
+#   - TODO el catálogo se vectoriza una vez; la asignación es UNA multiplicación dispersa
+#     (preguntas x temas) + argmax
+#   - solo se reclasifican filas nuevas/cambiadas (hash del enunciado en topic_assignments)
+#     o todas si cambian las semillas; las etiquetas manuales (sin registro) no se tocan
+#   - escritura con executemany por lotes
+#
+# CLI:  python -m mqth_q.topics [--all] [--dry-run]
+# Semillas propias: TOPIC_SEEDS='{"topic": ["frase, frase"], ...}'
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import re
+import sys
+import time
+from typing import Dict, List, Optional, Sequence
+
+from .config import TOPIC_SEEDS
+from .db import connect, init_db
+
+DEFAULT_TOPIC_SEEDS: Dict[str, List[str]] = {
+    "vector_spaces": ["vector space, basis, dimension, linear independence, subspace, span"],
+    "linear_functionals_and_operators": ["linear functional, bounded operator, operator norm, riesz representation"],
+    "isomorphisms": ["linear isomorphism, invertible linear map, isomorphic vector spaces"],
+    "finance_illustration": ["present value, discount factor, asset pricing, arbitrage, consumption savings"],
+    "metric_spaces": ["metric space, open set, closed set, cauchy sequence, convergence"],
+    "normed_vector_spaces": ["normed vector space, norm equivalence, banach space, complete norm"],
+    "abstract_equations": ["abstract equation, operator equation, functional equation, fixed point equation"],
+    "banach_contraction_theorem": ["banach contraction theorem, contraction mapping, unique fixed point, complete metric space"],
+    "brouwer_fixed_point_theorem": ["brouwer fixed point theorem, continuous map on compact convex set, fixed point exists"],
+    "optimization": ["optimization problem, argmax, argmin, lagrangian, first order conditions"],
+    "convexity_and_concavity": ["convex function, concavity, jensen inequality, subgradient, convex set"],
+    "dynamic_optimization": ["bellman equation, dynamic programming, value function, optimal policy, intertemporal"],
+}
+WRITE_BATCH = 500
+
+
+def clean(s: Optional[str]) -> str:
+    if not s:
+        return ""
+    s = re.sub(r"\(cid:\d+\)", " ", s)
+    s = re.sub(r"\s+", " ", s)
+    return s.strip().lower()
+
+def content_hash(question: Optional[str]) -> str:
+    return hashlib.blake2b(clean(question).encode("utf-8"), digest_size=16).hexdigest()
+
+def seeds_hash(seeds: Dict[str, Sequence[str]]) -> str:
+    raw = json.dumps(seeds, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+
+def classify(texts: Sequence[str], seeds: Dict[str, Sequence[str]], corpus: Optional[Sequence[str]] = None):
+    """
+    (topics, scores) for each text: cosine to each topic's seed document over word+char TF-IDF.
+    `corpus` (default: texts) is what the vocabulary/IDF are fitted on.
+    """
+    import numpy as np
+    from scipy.sparse import hstack
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.preprocessing import normalize
+
+    names = list(seeds)
+    topic_docs = [clean(" ; ".join(v)) for v in seeds.values()]
+    docs = [clean(t) for t in texts]
+    fit_on = [clean(t) for t in corpus] if corpus is not None else docs
+
+    word_vec = TfidfVectorizer(ngram_range=(1, 2), min_df=1, dtype=np.float32)
+    char_vec = TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 5), min_df=1, dtype=np.float32)
+    word_vec.fit(fit_on + topic_docs)
+    char_vec.fit(fit_on + topic_docs)
+
+    def features(d):
+        return normalize(hstack([word_vec.transform(d), char_vec.transform(d)], format="csr"))
+
+    S = (features(docs) @ features(topic_docs).T).toarray()     # (n_texts, n_topics)
+    best = S.argmax(axis=1)
+    return [names[i] for i in best], S[np.arange(len(docs)), best].tolist()
+
+
+def classify_pending(reclassify_all: bool = False, seeds: Optional[Dict[str, Sequence[str]]] = None,
+                     dry_run: bool = False, batch: int = WRITE_BATCH, log=print) -> Dict[str, int]:
+    """
+    Assign topic_pred to rows that have none, whose question changed since it was classified,
+    or all previously classified rows when the seeds changed. Manual labels are kept unless
+    reclassify_all.
+    """
+    t0 = time.perf_counter()
+    seeds = seeds or TOPIC_SEEDS or DEFAULT_TOPIC_SEEDS
+    model = seeds_hash(seeds)
+    init_db()
+    con = connect()
+    try:
+        cur = con.cursor()
+        rows = cur.execute("""
+          SELECT q.exercise_id, q.question, q.topic_pred, t.content_hash, t.model
+          FROM questions q LEFT JOIN topic_assignments t ON t.exercise_id = q.exercise_id
+        """).fetchall()
+        if not rows:
+            return {"rows": 0, "classified": 0, "changed": 0}
+
+        pending, hashes = [], {}
+        for r in rows:
+            h = content_hash(r["question"])
+            if reclassify_all or not r["topic_pred"] or (
+                r["content_hash"] is not None and (r["content_hash"] != h or r["model"] != model)
+            ):
+                pending.append(r)
+                hashes[r["exercise_id"]] = h
+        log(f"{len(rows)} questions, {len(pending)} to classify")
+        if not pending:
+            return {"rows": len(rows), "classified": 0, "changed": 0}
+
+        topics, scores = classify([r["question"] for r in pending], seeds,
+                                  corpus=[r["question"] for r in rows])
+        changed = sum(1 for r, t in zip(pending, topics) if r["topic_pred"] != t)
+        if dry_run:
+            return {"rows": len(rows), "classified": len(pending), "changed": changed}
+
+        now = time.time()
+        ids = [r["exercise_id"] for r in pending]
+        for i in range(0, len(ids), batch):
+            part = range(i, min(i + batch, len(ids)))
+            # only rows whose topic actually moves are rewritten (keeps FTS triggers quiet)
+            cur.executemany("UPDATE questions SET topic_pred=? WHERE exercise_id=? AND topic_pred IS NOT ?",
+                            [(topics[j], ids[j], topics[j]) for j in part])
+            cur.executemany("""
+              INSERT INTO topic_assignments(exercise_id, content_hash, topic, score, model, updated_ts)
+              VALUES(?,?,?,?,?,?)
+              ON CONFLICT(exercise_id) DO UPDATE SET content_hash=excluded.content_hash,
+                topic=excluded.topic, score=excluded.score, model=excluded.model, updated_ts=excluded.updated_ts
+            """, [(ids[j], hashes[ids[j]], topics[j], float(scores[j]), model, now) for j in part])
+        con.commit()
+    finally:
+        con.close()
+
+    stats = {"rows": len(rows), "classified": len(pending), "changed": changed}
+    log(f"done in {time.perf_counter() - t0:.2f}s: {stats}")
+    return stats
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m mqth_q.topics", description="Batch topic classification.")
+    ap.add_argument("--all", action="store_true", help="Reclassify every row, manual labels included")
+    ap.add_argument("--dry-run", action="store_true", help="Classify but do not write")
+    ap.add_argument("--batch", type=int, default=WRITE_BATCH)
+    args = ap.parse_args(argv)
+    stats = classify_pending(reclassify_all=args.all, dry_run=args.dry_run, batch=args.batch)
+    if args.dry_run:
+        print(f"dry run: {stats}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
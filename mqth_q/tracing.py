@@ -0,0 +1,269 @@
+# trazas por petición: spans anidados con contextvars (sin dependencias de OpenTelemetry)
+#   - trace(name): abre la traza raíz (middleware de app.py); span(name) / @traced() abren hijos
+#     del span actual. Fuera de una traza no se registra nada: cada función instrumentada solo
+#     paga un ContextVar.get() (~0.2 µs), y sin TRACE_EXPORT ni TRACE_SLOW_MS la API no abre trazas
+#   - instrumentado: service.*, las consultas de mqth_q.db, load_history y la calificación
+#     (baseline, LLM, lotes); los hilos del pool de lotes heredan el contexto
+#   - TRACE_EXPORT: una línea JSON por traza con el formato OTLP/JSON (resourceSpans ->
+#     scopeSpans -> spans), el mismo que escribe/lee el file exporter del OpenTelemetry Collector
+#   - TRACE_SLOW_MS: las peticiones más lentas dejan su árbol de spans completo (ms por span)
+#     en TRACE_SLOW_LOG y un warning en el log
+#
+#   - la traza de una petición se cierra cuando termina de enviarse el cuerpo (trace.detach() +
+#     finish()): en /attempts/stream la calificación corre dentro del cuerpo en streaming
+#   - finish() no escribe: serializar y escribir los ficheros lo hace un hilo escritor en segundo
+#     plano (finish corre en el event loop); flush() espera a que se vacíe la cola (tests, CLIs)
+#   - los spans aún abiertos cuando termina la raíz se cierran a esa hora con unfinished=True
+#
+# Uso:  with trace("GET /x"): ... with span("db.algo", rows=3): ...     @traced("service.f")
+
+from __future__ import annotations
+
+import atexit
+from contextvars import ContextVar
+import functools
+import json
+import logging
+import os
+from pathlib import Path
+import queue
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .config import TRACE_EXPORT, TRACE_SAMPLE_RATE, TRACE_SLOW_LOG, TRACE_SLOW_MS
+
+log = logging.getLogger(__name__)
+
+# la API solo abre trazas si alguna salida está activa
+ENABLED = bool(TRACE_EXPORT) or TRACE_SLOW_MS > 0
+
+_CURRENT: ContextVar[Optional["Span"]] = ContextVar("mqth_q_span", default=None)
+
+# trazas terminadas pendientes de escribir: (raíz, exportar OTLP, registrar como lenta)
+_PENDING: "queue.Queue[Tuple[Span, bool, bool]]" = queue.Queue()
+_WRITER: Optional[threading.Thread] = None
+_WRITER_LOCK = threading.Lock()
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attrs", "children",
+                 "start_ns", "end_ns", "_t0", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attrs: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.children: List[Span] = []
+        self.start_ns = time.time_ns()
+        self._t0 = time.perf_counter_ns()
+        self.end_ns = 0
+        self.error: Optional[str] = None
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def _finish(self) -> None:
+        if not self.end_ns:      # already closed by its root (unfinished): keep that end
+            self.end_ns = self.start_ns + (time.perf_counter_ns() - self._t0)
+
+    @property
+    def ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6 if self.end_ns else 0.0
+
+    def walk(self):
+        yield self
+        for c in list(self.children):
+            yield from c.walk()
+
+    def tree(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"name": self.name, "ms": round(self.ms, 3)}
+        if self.attrs:
+            out["attrs"] = self.attrs
+        if self.error:
+            out["error"] = self.error
+        if self.children:
+            out["children"] = [c.tree() for c in list(self.children)]
+        return out
+
+
+class span:
+    """Child of the current span; does nothing (yields None) outside a trace."""
+    __slots__ = ("name", "attrs", "_span", "_token")
+
+    def __init__(self, name: str, **attrs: Any):
+        self.name = name
+        self.attrs = attrs
+        self._span: Optional[Span] = None
+        self._token = None
+
+    def __enter__(self) -> Optional[Span]:
+        parent = _CURRENT.get()
+        if parent is None:
+            return None
+        s = self._span = Span(self.name, parent.trace_id, parent.span_id, self.attrs)
+        parent.children.append(s)
+        self._token = _CURRENT.set(s)
+        return s
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        s = self._span
+        if s is None:
+            return
+        s._finish()
+        if exc is not None:
+            s.error = f"{exc_type.__name__}: {exc}"
+        _CURRENT.reset(self._token)
+
+
+class trace(span):
+    """Root span of a request/command; exported / slow-logged when it ends."""
+    __slots__ = ("export",)
+
+    def __enter__(self) -> Span:
+        s = self._span = Span(self.name, os.urandom(16).hex(), None, self.attrs)
+        self.export = bool(TRACE_EXPORT) and (TRACE_SAMPLE_RATE >= 1 or random.random() < TRACE_SAMPLE_RATE)
+        self._token = _CURRENT.set(s)
+        return s
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.detach()
+        self.finish(exc_type, exc)
+
+    def detach(self) -> None:
+        """Stop being the current span here; the trace stays open until finish() (e.g. a stream body)."""
+        if self._token is not None:
+            _CURRENT.reset(self._token)
+            self._token = None
+
+    def finish(self, exc_type=None, exc=None) -> None:
+        """
+        End the root span and queue the trace for export / slow log (only the first call
+        counts). Never touches the disk, so it is safe on the event loop; spans still open
+        end here too, marked unfinished=True.
+        """
+        s = self._span
+        if s is None or s.end_ns:
+            return
+        s._finish()
+        if exc is not None:
+            s.error = f"{exc_type.__name__}: {exc}"
+        for c in s.walk():
+            if not c.end_ns:
+                c.end_ns = s.end_ns
+                c.attrs["unfinished"] = True
+        slow = TRACE_SLOW_MS > 0 and s.ms >= TRACE_SLOW_MS
+        if self.export or slow:
+            _start_writer()
+            _PENDING.put((s, self.export, slow))
+
+
+def current() -> Optional[Span]:
+    return _CURRENT.get()
+
+
+def annotate(**attrs: Any) -> None:
+    """Add attributes to the current span (no-op outside a trace)."""
+    s = _CURRENT.get()
+    if s is not None:
+        s.attrs.update(attrs)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator: run the function in a span named `name` (default <module>.<function>)."""
+    def deco(fn: Callable) -> Callable:
+        label = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _CURRENT.get() is None:           # not tracing: one ContextVar lookup
+                return fn(*args, **kwargs)
+            with span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+# ---------------- export ----------------
+def _value(v: Any) -> Dict[str, Any]:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+
+def to_otlp(root: Span) -> Dict[str, Any]:
+    """OTLP/JSON ExportTraceServiceRequest with every span of the trace."""
+    spans = []
+    for s in root.walk():
+        d: Dict[str, Any] = {
+            "traceId": s.trace_id, "spanId": s.span_id, "name": s.name,
+            "kind": 2 if s.parent_id is None else 1,             # SERVER / INTERNAL
+            "startTimeUnixNano": str(s.start_ns), "endTimeUnixNano": str(s.end_ns),
+            "attributes": [{"key": k, "value": _value(v)} for k, v in s.attrs.items()],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+        }
+        if s.parent_id:
+            d["parentSpanId"] = s.parent_id
+        spans.append(d)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "mqth_q"}},
+                                    {"key": "process.pid", "value": {"intValue": str(os.getpid())}}]},
+        "scopeSpans": [{"scope": {"name": "mqth_q.tracing"}, "spans": spans}],
+    }]}
+
+
+def _append(path: str, record: Dict[str, Any]) -> None:
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    with p.open("a", encoding="utf-8") as f:
+        f.write(line)
+
+
+def _write(s: Span, export: bool, slow: bool) -> None:
+    if export:
+        _append(TRACE_EXPORT, to_otlp(s))
+    if slow:
+        _append(TRACE_SLOW_LOG, {"trace_id": s.trace_id, "ts": s.start_ns / 1e9, **s.tree()})
+        log.warning("slow request %s: %.1f ms (trace %s)", s.name, s.ms, s.trace_id)
+
+
+def _writer_loop() -> None:
+    while True:
+        s, export, slow = _PENDING.get()
+        try:
+            _write(s, export, slow)
+        except Exception as e:
+            log.warning("could not write trace %s: %s", s.trace_id, e)
+        finally:
+            _PENDING.task_done()
+
+
+def _start_writer() -> None:
+    global _WRITER
+    if _WRITER is not None:
+        return
+    with _WRITER_LOCK:
+        if _WRITER is None:
+            _WRITER = threading.Thread(target=_writer_loop, name="trace-writer", daemon=True)
+            _WRITER.start()
+            atexit.register(flush)
+
+
+def flush(timeout: float = 5.0) -> bool:
+    """Wait until every finished trace is written; False if `timeout` seconds pass first."""
+    deadline = time.monotonic() + timeout
+    with _PENDING.all_tasks_done:
+        while _PENDING.unfinished_tasks:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return False
+            _PENDING.all_tasks_done.wait(left)
+    return True
@@ -0,0 +1,117 @@
+# warm-up del modelo y keep-alive
+#   - al arrancar: una generación mínima por backend para cargar OLLAMA_MODEL en memoria
+#   - luego, cada LLM_KEEP_WARM_INTERVAL (solo en LLM_KEEP_WARM_HOURS) otra mini-generación
+#     con keep_alive para que Ollama no descargue el modelo
+#   - readiness: listo cuando algún backend está caliente (o venció LLM_READY_TIMEOUT)
+
+from __future__ import annotations
+
+from datetime import datetime
+import threading
+import time
+from typing import Any, Dict, Optional, Set
+
+from .config import (
+    LLM_KEEP_ALIVE,
+    LLM_KEEP_WARM_HOURS,
+    LLM_KEEP_WARM_INTERVAL,
+    LLM_READY_TIMEOUT,
+    LLM_WARMUP,
+    OLLAMA_MODEL,
+)
+from .router import LLM_ROUTER, Backend, OllamaRouter
+
+
+def parse_hours(spec: str) -> Set[int]:
+    """'7-23' -> {7..22}; '22-6' wraps midnight; '' -> every hour."""
+    spec = (spec or "").strip()
+    if not spec:
+        return set(range(24))
+    hours: Set[int] = set()
+    for part in spec.split(","):
+        a, _, b = part.partition("-")
+        start, end = int(a), int(b or int(a) + 1)
+        h = start % 24
+        while True:
+            hours.add(h)
+            h = (h + 1) % 24
+            if h == end % 24:
+                break
+    return hours
+
+
+def warm_backend(backend: Backend, timeout: float = 300.0) -> bool:
+    """Tiny generation (1 token) that loads the model and refreshes keep_alive."""
+    import requests
+
+    payload = {
+        "model": OLLAMA_MODEL, "prompt": "ok", "stream": False,
+        "keep_alive": LLM_KEEP_ALIVE, "options": {"num_predict": 1},
+    }
+    try:
+        r = requests.post(f"{backend.url}/api/generate", json=payload, timeout=timeout)
+        return r.status_code == 200
+    except Exception:
+        return False
+
+
+class ModelWarmer:
+    def __init__(self, router: OllamaRouter, enabled: bool = LLM_WARMUP,
+                 interval: float = LLM_KEEP_WARM_INTERVAL, hours: str = LLM_KEEP_WARM_HOURS,
+                 ready_timeout: float = LLM_READY_TIMEOUT):
+        self.router = router
+        self.enabled = enabled
+        self.interval = float(interval)
+        self.hours = parse_hours(hours)
+        self.ready_timeout = float(ready_timeout)
+        self._warm: Dict[str, float] = {}     # url -> last successful warm (epoch)
+        self._started_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def warm_all(self) -> int:
+        n = 0
+        for b in self.router.backends:
+            if warm_backend(b):
+                self._warm[b.url] = time.time()
+                n += 1
+            else:
+                self._warm.pop(b.url, None)
+        return n
+
+    def _loop(self) -> None:
+        self.warm_all()
+        while not self._stop.wait(self.interval):
+            if datetime.now().hour in self.hours:
+                self.warm_all()
+
+    def start(self) -> None:
+        """Warm up in the background; never blocks startup."""
+        self._started_at = time.time()
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="ollama-warmup", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def is_ready(self) -> bool:
+        if not self.enabled:
+            return True
+        if self._warm:
+            return True
+        # model never came up: stop holding traffic back, grading degrades to baseline
+        return self._started_at is not None and time.time() - self._started_at >= self.ready_timeout
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "ready": self.is_ready(),
+            "warm_backends": sorted(self._warm),
+            "last_warm": max(self._warm.values()) if self._warm else None,
+        }
+
+
+MODEL_WARMER = ModelWarmer(LLM_ROUTER)
@@ -7,6 +7,9 @@
 # ------------------------------------------------------------
 
 import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import pandas as pd
 import streamlit as st
@@ -15,30 +18,130 @@ API_URL = os.getenv("API_URL", "http://127.0.0.1:8000")
 TIMEOUT = 30
 
 # -------------------- Helpers HTTP --------------------
+# Streamlit re-ejecuta el script en cada interacción, así que el estado HTTP vive en caches:
+#  - una Session con pool de conexiones (keep-alive) compartida por todos los reruns
+#  - ETags por URL: un 304 reutiliza el JSON ya recibido
+#  - st.cache_data con TTL para el catálogo (temas, enunciados); el resumen no se cachea aquí,
+#    se revalida siempre con ETag (304 barato) y así ve los envíos de otras sesiones
+#  - st.cache_data es compartido por todas las sesiones: los intentos llevan en la clave un
+#    contador de la sesión (st.session_state) que se incrementa tras enviar; nunca .clear()
+#  - endpoints independientes se piden en paralelo (fetch_parallel)
+CACHE_TTL_CATALOG = int(os.getenv("UI_CACHE_TTL_CATALOG", "600"))   # temas, enunciados
+CACHE_TTL_USER = int(os.getenv("UI_CACHE_TTL_USER", "60"))          # intentos
+
+@st.cache_resource
+def _http():
+    s = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+@st.cache_resource
+def _etags():
+    return {"lock": threading.Lock(), "by_url": {}}
+
+def _get(path: str, params=None):
+    r = _http().get(f"{API_URL}{path}", params=params, timeout=TIMEOUT); r.raise_for_status(); return r.json()
+
+def _get_cached(path: str):
+    url = f"{API_URL}{path}"
+    store = _etags()
+    with store["lock"]:
+        etag, data = store["by_url"].get(url, (None, None))
+    headers = {"If-None-Match": etag} if etag else {}
+    r = _http().get(url, headers=headers, timeout=TIMEOUT)
+    if r.status_code == 304:
+        return data
+    r.raise_for_status()
+    data = r.json()
+    if r.headers.get("ETag"):
+        with store["lock"]:
+            store["by_url"][url] = (r.headers["ETag"], data)
+    return data
+
+def fetch_parallel(**calls):
+    """{name: zero-arg callable} -> {name: result}, run concurrently (exceptions re-raised)."""
+    try:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+        ctx = get_script_run_ctx()
+    except Exception:
+        ctx = None
+
+    def _run(fn):
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return fn()
+
+    with ThreadPoolExecutor(max_workers=max(1, len(calls))) as pool:
+        futures = {name: pool.submit(_run, fn) for name, fn in calls.items()}
+        return {name: f.result() for name, f in futures.items()}
+
 def api_health():
-    return requests.get(f"{API_URL}/health", timeout=TIMEOUT).json()
+    return _http().get(f"{API_URL}/health", timeout=TIMEOUT).json()
 
 def api_summary(username: str):
-    r = requests.get(f"{API_URL}/users/{username}/summary", timeout=TIMEOUT); r.raise_for_status(); return r.json()
+    return _get_cached(f"/users/{username}/summary")
+
+@st.cache_data(ttl=CACHE_TTL_USER, show_spinner=False)
+def _attempts(username: str, limit: int, nonce: int):
+    return _get(f"/users/{username}/attempts", params={"limit": limit})
+
+def _user_nonce(username: str) -> int:
+    return st.session_state.setdefault("user_nonce", {}).get(username, 0)
 
 def api_attempts(username: str, limit: int = 20):
-    r = requests.get(f"{API_URL}/users/{username}/attempts", params={"limit": limit}, timeout=TIMEOUT); r.raise_for_status(); return r.json()
+    return _attempts(username, limit, _user_nonce(username))
 
+@st.cache_data(ttl=CACHE_TTL_CATALOG, show_spinner=False)
 def api_topics():
-    r = requests.get(f"{API_URL}/topics", timeout=TIMEOUT); r.raise_for_status(); return r.json()
+    return _get_cached("/topics")
 
 def api_get_next(username: str, k: int = 3):
-    r = requests.get(f"{API_URL}/questions/next", params={"username": username, "k": k}, timeout=TIMEOUT); r.raise_for_status(); return r.json()
+    return _get("/questions/next", params={"username": username, "k": k})
 
 def api_random_by_topic(username: str, topic: str, only_unseen: bool = True):
-    r = requests.get(f"{API_URL}/questions/random", params={"username": username, "topic": topic, "only_unseen": str(only_unseen).lower()}, timeout=TIMEOUT); r.raise_for_status(); return r.json()
+    return _get("/questions/random", params={"username": username, "topic": topic, "only_unseen": str(only_unseen).lower()})
 
+@st.cache_data(ttl=CACHE_TTL_CATALOG, show_spinner=False)
 def api_get_question(exercise_id: str):
-    r = requests.get(f"{API_URL}/questions/{exercise_id}", timeout=TIMEOUT); r.raise_for_status(); return r.json()
+    return _get_cached(f"/questions/{exercise_id}")
+
+def load_user_data(username: str, limit: int = 50):
+    """Resumen + intentos + temas en paralelo."""
+    nonce = _user_nonce(username)
+    return fetch_parallel(summary=lambda: api_summary(username),
+                          attempts=lambda: _attempts(username, limit, nonce),
+                          topics=api_topics)
+
+def invalidate_user_data(username: str):
+    """Tras un envío: los intentos de `username` se vuelven a pedir (solo en esta sesión)."""
+    nonces = st.session_state.setdefault("user_nonce", {})
+    nonces[username] = nonces.get(username, 0) + 1
 
 def api_submit(username: str, exercise_id: str, answer: str):
     payload = {"username": username, "exercise_id": exercise_id, "answer": answer}
-    r = requests.post(f"{API_URL}/attempts", json=payload, timeout=TIMEOUT); r.raise_for_status(); return r.json()
+    r = _http().post(f"{API_URL}/attempts", json=payload, timeout=TIMEOUT); r.raise_for_status()
+    invalidate_user_data(username)
+    return r.json()
+
+def api_submit_stream(username: str, exercise_id: str, answer: str):
+    """Itera los eventos SSE de /attempts/stream como tuplas (event, data)."""
+    payload = {"username": username, "exercise_id": exercise_id, "answer": answer}
+    with _http().post(f"{API_URL}/attempts/stream", json=payload, stream=True, timeout=TIMEOUT) as r:
+        r.raise_for_status()
+        event, data = "message", []
+        for line in r.iter_lines(decode_unicode=True):
+            if line is None:
+                continue
+            if line == "":
+                if data:
+                    yield event, json.loads("\n".join(data))
+                event, data = "message", []
+            elif line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data.append(line[len("data:"):].strip())
 
 # -------------------- Estado global --------------------
 if "username" not in st.session_state:
@@ -59,6 +162,8 @@ if "last_feedback" not in st.session_state:
     st.session_state.last_feedback = None
 if "suggestions" not in st.session_state:
     st.session_state.suggestions = []
+if "cards" not in st.session_state:
+    st.session_state.cards = {}   # exercise_id -> tarjeta completa (vienen con /questions/next)
 
 # -------------------- Sidebar (Estudiante) --------------------
 st.sidebar.title("👤 Estudiante")
@@ -70,9 +175,10 @@ colA, colB = st.sidebar.columns([1,1])
 with colA:
     if st.button("Cargar datos"):
         try:
-            st.session_state.summary = api_summary(st.session_state.username)
-            st.session_state.attempts = api_attempts(st.session_state.username, limit=50)
-            st.session_state.topics = api_topics()
+            data = load_user_data(st.session_state.username, limit=50)
+            st.session_state.summary = data["summary"]
+            st.session_state.attempts = data["attempts"]
+            st.session_state.topics = data["topics"]
             st.success("Datos del estudiante cargados.")
         except requests.HTTPError as e:
             st.error(f"Error servidor: {e.response.text}")
@@ -139,6 +245,8 @@ with tab_practice:
             if st.button("🔄 Recomendar"):
                 try:
                     st.session_state.suggestions = api_get_next(st.session_state.username, k=k)
+                    # las sugerencias ya traen el enunciado: mostrar uno no requiere otra request
+                    st.session_state.cards.update({c["exercise_id"]: c for c in st.session_state.suggestions})
                     st.session_state.current_q = None
                     st.session_state.last_feedback = None
                     st.success(f"Sugerencias: {len(st.session_state.suggestions)}")
@@ -157,7 +265,7 @@ with tab_practice:
             if st.button("📖 Mostrar ejercicio", key="show_suggest"):
                 try:
                     ex_id = values[picked]
-                    st.session_state.current_q = api_get_question(ex_id)
+                    st.session_state.current_q = st.session_state.cards.get(ex_id) or api_get_question(ex_id)
                     st.session_state.last_feedback = None
                 except Exception as e:
                     st.error(f"No se pudo traer el ejercicio: {e}")
@@ -202,12 +310,30 @@ with tab_practice:
                     st.warning("Escribe una respuesta antes de enviar.")
                 else:
                     try:
-                        fb = api_submit(st.session_state.username, q["exercise_id"], answer.strip())
+                        # tokens del LLM en vivo; el evento final trae el feedback ya guardado
+                        live = st.empty()
+                        partial, fb = "", None
+                        for event, data in api_submit_stream(st.session_state.username, q["exercise_id"], answer.strip()):
+                            if event == "token":
+                                partial += data
+                                live.code(partial, language="json")
+                            elif event == "result":
+                                fb = data
+                            elif event == "error":
+                                raise RuntimeError(data.get("detail"))
+                        live.empty()
+                        if fb is None:
+                            raise RuntimeError("sin resultado")
                         st.session_state.last_feedback = fb
-                        # refrescar dashboard (resumen + intentos) tras enviar
+                        # refrescar dashboard (resumen + intentos) tras enviar, en paralelo
+                        user = st.session_state.username
+                        invalidate_user_data(user)
                         try:
-                            st.session_state.summary = api_summary(st.session_state.username)
-                            st.session_state.attempts = api_attempts(st.session_state.username, limit=50)
+                            nonce = _user_nonce(user)
+                            data = fetch_parallel(summary=lambda: api_summary(user),
+                                                  attempts=lambda: _attempts(user, 50, nonce))
+                            st.session_state.summary = data["summary"]
+                            st.session_state.attempts = data["attempts"]
                         except Exception:
                             pass
                         st.success("Respuesta evaluada.")
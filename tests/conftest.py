@@ -28,6 +28,10 @@ def tmp_db(tmp_path_factory):
     os.environ["DB_PATH"] = str(db)       # app reads this
     os.environ["USE_LLM"] = "false"       # keep tests fast/deterministic
 
+    # other test modules may have imported mqth_q (and frozen DB_PATH) before this fixture ran
+    import mqth_q.db
+    mqth_q.db.DB_PATH = str(db)
+
     con = sqlite3.connect(db)
     cur = con.cursor()
     cur.executescript(SCHEMA_SQL)
@@ -55,6 +59,7 @@ def disable_llm(monkeypatch):
     try:
         import mqth_q.grading as grading
         monkeypatch.setattr(grading, "llm_grade_and_feedback", lambda *a, **k: None, raising=False)
+        monkeypatch.setattr(grading, "llm_stream_tokens", lambda *a, **k: iter(()), raising=False)
     except Exception:
         try:
             import grading
@@ -62,6 +67,30 @@ def disable_llm(monkeypatch):
         except Exception:
             pass
 
+@pytest.fixture()
+def fresh_db(tmp_path, monkeypatch):
+    """
+    Factory: fresh_db(questions=[(exercise_id, question, topic_pred), ...]) points mqth_q.db at a
+    new, fully migrated DB (init_db) under tmp_path, inserts the questions and returns its path.
+    Pass `columns` for other question columns, `name` for the file name.
+    """
+    import mqth_q.db as db
+
+    def make(questions=(), columns=("exercise_id", "question", "topic_pred"), name="test.db"):
+        monkeypatch.setattr(db, "DB_PATH", str(tmp_path / name))
+        db.init_db()
+        if questions:
+            with db._con() as con:
+                con.executemany(f"INSERT INTO questions({', '.join(columns)}) "
+                                f"VALUES({', '.join('?' * len(columns))})", questions)
+        return db.DB_PATH
+    return make
+
+@pytest.fixture()
+def quiet():
+    """log= callback for CLIs that print progress."""
+    return lambda *a: None
+
 @pytest.fixture()
 def client(tmp_db):
     from fastapi.testclient import TestClient
@@ -0,0 +1,98 @@
+# Admission control: per-user token bucket, round-robin wait queue, load shedding, HTTP 429
+
+import threading, time
+
+import pytest
+
+from mqth_q.admission import AdmissionController, RateLimited
+
+
+def test_token_bucket_per_user():
+    now = [0.0]
+    adm = AdmissionController(rate=0.5, burst=2, clock=lambda: now[0])
+    adm.check_rate("ana"); adm.check_rate("ana")
+    with pytest.raises(RateLimited) as e:
+        adm.check_rate("ana")
+    assert e.value.retry_after == pytest.approx(2.0)
+    adm.check_rate("ben")                      # other users are unaffected
+    now[0] = 2.0
+    adm.check_rate("ana")
+
+
+def test_fair_queue_round_robin_and_shedding():
+    adm = AdmissionController(max_concurrency=1, max_queue=4, max_wait=5, rate=0)
+    assert adm.acquire("hog")                  # holds the only slot
+    order, threads = [], []
+
+    def wait_for(user):
+        if adm.acquire(user):
+            order.append(user)
+            adm.release()
+
+    for user in ["hog", "hog", "hog", "ana"]:
+        t = threading.Thread(target=wait_for, args=(user,))
+        t.start(); threads.append(t)
+        while adm.snapshot()["queued"] < len(threads):
+            time.sleep(0.001)
+
+    assert adm.acquire("late") is False        # queue full -> shed to baseline
+    adm.release()
+    for t in threads:
+        t.join(2)
+    assert order == ["hog", "ana", "hog", "hog"]
+    ev = adm.snapshot()["events"]
+    assert ev["shed_queue_full"] == 1 and ev["admitted"] == 5
+
+    quick = AdmissionController(max_concurrency=1, max_wait=0.01, rate=0)
+    with quick.slot("a") as ok_a:
+        with quick.slot("b") as ok_b:
+            assert ok_a and not ok_b           # wait expired -> shed
+    assert quick.snapshot()["inflight"] == 0
+
+
+def test_submit_rate_limited_returns_429(client, monkeypatch):
+    import mqth_q.service as service
+    monkeypatch.setattr(service, "ADMISSION", AdmissionController(rate=0.01, burst=1))
+    ex_id = client.get("/questions/next", params={"username": "spam", "k": 1}).json()[0]["exercise_id"]
+    body = {"username": "spam", "exercise_id": ex_id, "answer": "Banach fixed point."}
+    assert client.post("/attempts", json=body).status_code == 200
+    r = client.post("/attempts", json=body)
+    assert r.status_code == 429 and int(r.headers["retry-after"]) >= 1
+    assert client.post("/attempts/stream", json=body).status_code == 429
+
+
+def test_only_the_llm_call_holds_the_slot(monkeypatch):
+    from contextlib import contextmanager
+    import mqth_q.grading as grading
+
+    held, seen = [False], []
+
+    @contextmanager
+    def slot():
+        held[0] = True
+        try:
+            yield True
+        finally:
+            held[0] = False
+
+    def stream(*a, **k):
+        seen.append(("llm", held[0]))
+        yield "not json"
+
+    monkeypatch.setattr(grading.NEAR_DUPS, "lookup", lambda *a: seen.append(("near_dup", held[0])))
+    monkeypatch.setattr(grading, "llm_grade_and_feedback", lambda *a, **k: seen.append(("llm", held[0])))
+    monkeypatch.setattr(grading, "llm_stream_tokens", stream)
+    monkeypatch.setattr(grading, "baseline_grade",
+                        lambda *a, **k: seen.append(("baseline", held[0])) or {"score": 0.0})
+    grading.grade_best_with_feedback("q", "s", "a", exercise_id="E1", slot=slot)
+    assert seen == [("near_dup", False), ("llm", True), ("baseline", False)]
+
+    seen.clear()
+    list(grading.grade_best_streaming("q", "s", "a", exercise_id="E1", slot=slot))
+    assert seen == [("near_dup", False), ("llm", True), ("baseline", False)]
+
+    seen.clear()
+    shed = AdmissionController(max_concurrency=1, max_queue=0, rate=0)
+    assert shed.acquire("hog")
+    grading.grade_best_with_feedback("q", "s", "a", slot=lambda: shed.slot("u"))
+    assert seen == [("near_dup", False), ("baseline", False)]   # shed: no LLM call
@@ -1,5 +1,7 @@
 # Minimal smoke tests for class
 
+from types import SimpleNamespace
+
 from fastapi.testclient import TestClient
 
 def test_health(client: TestClient):
@@ -31,3 +33,49 @@ def test_submit_attempt(client: TestClient):
     assert r.status_code == 200
     body = r.json()
     assert "score" in body and "correct" in body
+
+def test_submit_attempt_stream(client: TestClient):
+    ex_id = client.get("/questions/next", params={"username": "carol", "k": 1}).json()[0]["exercise_id"]
+
+    r = client.post("/attempts/stream", json={
+        "username": "carol",
+        "exercise_id": ex_id,
+        "answer": "Every bounded functional is an inner product with some y."
+    })
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+    # LLM disabled in tests -> no tokens, one final result event
+    assert "event: result" in r.text
+    assert r.text.rstrip().endswith("}")
+
+    bad = client.post("/attempts/stream", json={"username": "carol", "exercise_id": "nope", "answer": "x"})
+    assert bad.status_code == 400
+
+def test_readiness_separate_from_liveness(client: TestClient, monkeypatch):
+    import app
+    from mqth_q import warmup
+    backend = SimpleNamespace(url="http://ollama:11434")
+    warmer = warmup.ModelWarmer(SimpleNamespace(backends=[backend]), enabled=True, ready_timeout=3600)
+    loaded = []
+    monkeypatch.setattr(warmup, "warm_backend", lambda b, timeout=300.0: bool(loaded))
+    monkeypatch.setattr(warmer, "_loop", warmer.warm_all)     # one background pass, no keep-warm
+    monkeypatch.setattr(app, "MODEL_WARMER", warmer)
+
+    with client:                                    # runs startup: DB ready, warm-up in background
+        warmer._thread.join(5)
+        assert client.get("/health/live").status_code == 200
+        r = client.get("/health/ready")
+        assert r.status_code == 503
+        assert r.json()["ready"] is False and r.json()["db"] is True and r.json()["model"]["ready"] is False
+
+        loaded.append(True)                         # the model finished loading
+        assert warmer.warm_all() == 1
+        r = client.get("/health/ready")
+        assert r.status_code == 200 and r.json()["ready"] is True
+        assert r.json()["model"]["warm_backends"] == [backend.url]
+
+def test_metrics_survive_app_reload(client: TestClient):
+    import importlib, app
+    reqs = app.REQS
+    importlib.reload(app)
+    assert app.REQS is reqs and app._metric(type(reqs), "http_requests_total", "HTTP requests") is reqs
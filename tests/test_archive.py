@@ -0,0 +1,65 @@
+# Cold storage: old attempts move to Parquet, hot rows keep scores, history reads them back
+
+import json, time
+
+import mqth_q.archive as archive
+import mqth_q.db as db
+from mqth_q import service
+
+DAY = 86400
+QUESTIONS = [("E1", "q", "metric_spaces")]
+
+
+def _attempt(uid, ex, ts, score, reasons):
+    result = {"score": score, "correct": score > 0.5, "reasons": reasons, "hint": "h", "source": "baseline",
+              "missing_keywords": ["norm"]}
+    db.save_attempt(uid, ex, result, f"answer {reasons}")
+    with db._con() as con:
+        con.execute("UPDATE attempts SET ts=? WHERE attempt_id=(SELECT MAX(attempt_id) FROM attempts)", (ts,))
+
+
+def test_archive_moves_text_and_reads_it_back(tmp_path, monkeypatch, fresh_db, quiet):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "cold"))
+    fresh_db(QUESTIONS)
+    uid = db.get_user_id("ana")
+    now = time.time()
+    _attempt(uid, "E1", now - 400 * DAY, 0.9, "old-a")
+    _attempt(uid, "E1", now - 300 * DAY, 0.2, "old-b")
+    _attempt(uid, "E1", now - 1 * DAY, 0.7, "recent")
+    summary = service.get_user_summary("ana")
+
+    assert archive.archive_attempts(older_than_days=180, dry_run=True, log=quiet)["rows"] == 2
+    stats = archive.archive_attempts(older_than_days=180, log=quiet)
+    assert stats == {"rows": 2, "segments": 2}                    # one partition per month
+    assert len(list((tmp_path / "cold").rglob("*.parquet"))) == 2
+    assert archive.archive_attempts(older_than_days=180, log=quiet)["rows"] == 0
+
+    with db._con() as con:
+        hot = con.execute("SELECT score, reasons, student_answer, feedback_json, archive_segment "
+                          "FROM attempts ORDER BY ts").fetchall()
+    assert [tuple(r)[:4] for r in hot[:2]] == [(0.9, None, None, None), (0.2, None, None, None)]
+    assert hot[2]["reasons"] == "recent" and hot[2]["archive_segment"] is None
+
+    assert service.get_user_summary("ana") == summary              # aggregates need no archive
+    history = service.get_recent_attempts("ana", limit=10, details=True)
+    assert [h["reasons"] for h in history] == ["recent", "old-b", "old-a"]
+    assert history[2]["student_answer"] == "answer old-a"
+
+    full = archive.read_archived(user_id=uid)
+    assert [r["reasons"] for r in full] == ["old-a", "old-b"]
+    fb = json.loads(full[0]["feedback_json"])
+    assert fb["source"] == "baseline" and fb["correct"] is True and fb["reasons"] == "old-a"
+    assert json.loads(full[0]["missing_keywords"]) == ["norm"]
+
+
+def test_dry_run_counts_every_segment(tmp_path, monkeypatch, fresh_db, quiet):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "cold"))
+    fresh_db(QUESTIONS)
+    uid = db.get_user_id("ana")
+    old = time.mktime((2024, 3, 10, 12, 0, 0, 0, 0, -1))
+    for i in range(10):
+        _attempt(uid, "E1", old + i * 60, 0.5, f"a{i}")
+    dry = archive.archive_attempts(older_than_days=180, dry_run=True, segment_rows=3, log=quiet)
+    assert not (tmp_path / "cold").exists()
+    assert dry == archive.archive_attempts(older_than_days=180, segment_rows=3, log=quiet) == \
+        {"rows": 10, "segments": 4}
@@ -0,0 +1,67 @@
+# POST /attempts/batch: one user lookup, bulk fetch, concurrent grading, one transaction
+
+import threading, time
+
+import pytest
+
+import mqth_q.db as db
+import mqth_q.grading as grading
+from mqth_q import service
+
+EX = "General_2025-08-29_Exercise_1"
+
+
+def test_batch_endpoint(client):
+    r = client.post("/attempts/batch", json={"username": "dora", "items": [
+        {"exercise_id": EX, "answer": "Every bounded linear functional is <x, y> for a unique y."},
+        {"exercise_id": EX, "answer": "no idea"},
+    ]})
+    assert r.status_code == 200
+    body = r.json()
+    assert [i["exercise_id"] for i in body["items"]] == [EX, EX]
+    assert body["items"][0]["score"] > body["items"][1]["score"]
+    assert body["n_correct"] == sum(i["correct"] for i in body["items"])
+
+    bad = client.post("/attempts/batch", json={"username": "dora2", "items": [
+        {"exercise_id": EX, "answer": "x"}, {"exercise_id": "nope", "answer": "x"}]})
+    assert bad.status_code == 400 and "nope" in bad.json()["detail"]
+    assert client.post("/attempts/batch", json={"username": "dora3", "items": []}).status_code == 422
+
+
+def test_llm_calls_overlap_and_attempts_commit_together(monkeypatch, fresh_db):
+    fresh_db([(f"E{i}", f"q{i}", f"solution {i}", "optimization") for i in range(4)],
+             columns=("exercise_id", "question", "solution", "topic_pred"))
+    peak, active, lock = [0], [0], threading.Lock()
+
+    def slow_llm(question, solution, student, timeout=None, exercise_id=None):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.2)
+        with lock:
+            active[0] -= 1
+        return {"score": 0.9, "correct": True, "cosine": None, "jaccard": None,
+                "missing_keywords": [], "reasons": f"llm {exercise_id}", "hint": ""}
+
+    monkeypatch.setattr(grading, "llm_grade_and_feedback", slow_llm)
+    t0 = time.perf_counter()
+    out = service.submit_answers("eve", [(f"E{i}", f"answer {i}") for i in range(4)])
+    elapsed = time.perf_counter() - t0
+    assert [i["reasons"] for i in out["items"]] == [f"llm E{i}" for i in range(4)]
+    assert peak[0] > 1 and elapsed < 0.6          # sequential would take >= 0.8 s
+    assert len(db.get_attempts(db.get_user_id("eve"))) == 4
+    assert db.get_exercise_stats("E0")["attempts"] == 1
+
+
+def test_batch_spends_one_rate_token_per_answer(client, monkeypatch):
+    from mqth_q.admission import AdmissionController, TokenBucket
+    monkeypatch.setattr(service, "ADMISSION", AdmissionController(rate=0.2, burst=3))
+    sheet = {"username": "flood", "items": [{"exercise_id": EX, "answer": f"answer {i}"} for i in range(5)]}
+    assert client.post("/attempts/batch", json=sheet).status_code == 200     # bigger than the burst: debt
+    r = client.post("/attempts/batch", json=sheet)
+    assert r.status_code == 429 and int(r.headers["retry-after"]) >= 10       # 3 - 5 = -2 tokens -> 15 s
+    assert client.post("/attempts", json={"username": "flood", "exercise_id": EX,
+                                          "answer": "x"}).status_code == 429
+
+    b = TokenBucket(rate=0.2, burst=3, now=0.0)
+    assert b.take(0.0, cost=5) == 0.0 and b.take(0.0) == pytest.approx(15.0)
@@ -0,0 +1,127 @@
+# Circuit breaker state machine + adaptive timeout
+
+from mqth_q.breaker import CircuitBreaker, BreakerOpen, CLOSED, OPEN, HALF_OPEN
+from mqth_q.grading import llm_grade_and_feedback as _REAL_LLM    # conftest stubs the module attribute
+
+
+class FakeClock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def _breaker(clock):
+    return CircuitBreaker("test", window=10, min_calls=4, error_rate=0.5, slow_p95=5.0,
+                          cooldown=10.0, probes=1, timeout_min=1.0, timeout_max=60.0,
+                          timeout_factor=2.0, clock=clock)
+
+
+def test_opens_on_errors_then_half_opens_and_recovers():
+    clock = FakeClock()
+    b = _breaker(clock)
+    for _ in range(4):
+        assert b.allow()
+        b.record_failure(0.1)
+    assert b.state == OPEN
+    assert not b.allow()
+
+    clock.t += 10.0
+    assert b.state == HALF_OPEN
+    assert b.allow()          # one probe
+    assert not b.allow()      # second probe rejected
+    b.record_success(0.2)
+    assert b.state == CLOSED
+    assert set(b.snapshot()["transitions"]) == {"closed->open", "open->half_open", "half_open->closed"}
+
+
+def test_failed_probe_reopens():
+    clock = FakeClock()
+    b = _breaker(clock)
+    for _ in range(4):
+        b.allow(); b.record_failure(0.1)
+    clock.t += 10.0
+    assert b.allow()
+    b.record_failure(0.1)
+    assert b.state == OPEN
+
+
+def test_opens_on_slow_p95_and_guard_raises():
+    b = _breaker(FakeClock())
+    for _ in range(4):
+        b.allow(); b.record_success(9.0)
+    assert b.state == OPEN
+    try:
+        with b.guard():
+            raise AssertionError("should not run")
+    except BreakerOpen:
+        pass
+
+
+def test_adaptive_timeout_tracks_p95():
+    b = _breaker(FakeClock())
+    assert b.timeout() == 60.0          # no data yet -> max
+    for lat in (1.0, 1.0, 1.5, 2.0):
+        b.allow(); b.record_success(lat)
+    assert b.timeout() == 4.0           # p95 (2.0) * factor (2.0)
+
+
+def test_saturated_backends_do_not_open_the_aggregate_breaker(monkeypatch):
+    import mqth_q.grading as grading
+    from mqth_q.router import OllamaRouter
+
+    router = OllamaRouter([{"url": "http://a:1", "max_concurrency": 1}], wait=0.01, health_interval=0)
+    brk = _breaker(FakeClock())
+    monkeypatch.setattr(grading, "LLM_ROUTER", router)
+    monkeypatch.setattr(grading, "LLM_BREAKER", brk)
+    with router.acquire():                         # the only backend is busy
+        for _ in range(6):
+            assert _REAL_LLM("q", "s", "a") is None    # shed to the baseline
+    assert brk.state == CLOSED and brk.snapshot()["transitions"] == {}
+
+    clock = FakeClock()
+    half = _breaker(clock)
+    for _ in range(4):
+        half.allow(); half.record_failure(0.1)
+    clock.t += 10.0
+    with router.acquire():
+        monkeypatch.setattr(grading, "LLM_BREAKER", half)
+        assert _REAL_LLM("q", "s", "a") is None
+    assert half.state == HALF_OPEN and half.allow()   # the probe permit was given back
+
+
+def test_ejected_backends_open_the_aggregate_breaker_without_waiting(monkeypatch):
+    import time
+    import mqth_q.grading as grading
+    from mqth_q.router import OllamaRouter
+
+    router = OllamaRouter([{"url": "http://a:1"}], wait=2.0, health_interval=0)
+    router.backends[0].healthy = False             # ejected by check_health
+    brk = _breaker(FakeClock())
+    monkeypatch.setattr(grading, "LLM_ROUTER", router)
+    monkeypatch.setattr(grading, "LLM_BREAKER", brk)
+    t0 = time.perf_counter()
+    for _ in range(6):
+        assert _REAL_LLM("q", "s", "a") is None
+    assert time.perf_counter() - t0 < 1.0          # no router wait during an outage
+    assert brk.state == OPEN and brk.snapshot()["rejected"] == 2
+
+
+def test_closing_a_guarded_generator_records_nothing():
+    clock = FakeClock()
+    b = _breaker(clock)
+    for _ in range(4):
+        b.allow(); b.record_failure(0.1)
+    clock.t += 10.0
+
+    def stream():
+        with b.guard():
+            yield "tok"
+            yield "more"
+
+    gen = stream()
+    assert next(gen) == "tok"
+    gen.close()                                     # client disconnected mid-stream
+    assert b.state == HALF_OPEN and b.snapshot()["transitions"] == {"closed->open": 1, "open->half_open": 1}
+    assert b.allow()                                # the probe permit was given back
@@ -0,0 +1,33 @@
+# Sort-based calibration matches sklearn; per-topic fitting falls back to global
+
+import numpy as np
+from sklearn.metrics import f1_score, roc_auc_score
+
+from mqth_q.calibration import GLOBAL_KEY, curves, best_threshold, fit_thresholds, roc_auc
+
+
+def _data(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    y = rng.integers(0, 2, n)
+    s = np.round(np.clip(0.35 * y + rng.normal(0.4, 0.2, n), 0, 1), 2)   # ties on purpose
+    return y, s
+
+
+def test_curves_match_sklearn_at_every_threshold():
+    y, s = _data()
+    c = curves(y, s)
+    assert np.all(np.diff(c["threshold"]) < 0)
+    for thr, f1 in zip(c["threshold"][::7], c["f1"][::7]):
+        assert abs(f1 - f1_score(y, (s >= thr).astype(int), zero_division=0)) < 1e-12
+    assert abs(roc_auc(c) - roc_auc_score(y, s)) < 1e-12
+
+
+def test_best_threshold_and_topic_fallback():
+    y, s = _data()
+    b = best_threshold(y, s)
+    assert abs(b["f1"] - max(f1_score(y, (s >= t).astype(int), zero_division=0) for t in np.unique(s))) < 1e-12
+
+    topics = ["big"] * 380 + ["small"] * 20
+    fitted = fit_thresholds(y, s, topics, min_rows=50)
+    assert set(fitted) == {GLOBAL_KEY, "big"}
+    assert fitted["big"]["n"] == 380
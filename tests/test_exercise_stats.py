@@ -0,0 +1,71 @@
+# exercise_stats: incremental updates agree with the chunked rebuild; API + recommender use it
+
+import random
+import sqlite3
+
+import pytest
+
+import mqth_q.db as db
+from mqth_q.exercise_stats import rebuild
+from mqth_q.recommender import by_difficulty
+
+
+def _seed(fresh_db):
+    fresh_db([(f"E{i}", "q", "metric_spaces" if i < 3 else "optimization") for i in range(6)])
+    rng = random.Random(3)
+    skill = {f"u{j}": rng.random() for j in range(12)}
+    for _ in range(150):
+        user = rng.choice(list(skill))
+        ex = f"E{rng.randrange(6)}"
+        p = skill[user] * (1.0 if ex < "E3" else 0.5)
+        ok = rng.random() < p
+        db.save_attempt(db.get_user_id(user), ex, {"score": p if ok else p / 3, "correct": ok}, "a")
+
+
+def _table():
+    with db._con() as con:
+        return {r["exercise_id"]: dict(r) for r in con.execute("SELECT * FROM exercise_stats")}
+
+
+def test_incremental_matches_rebuild(fresh_db, quiet):
+    _seed(fresh_db)
+    incremental = _table()
+    assert rebuild(chunk_users=5, log=quiet)["attempts"] == 150
+    rebuilt = _table()
+    assert incremental.keys() == rebuilt.keys()
+    for ex, row in incremental.items():
+        for k, v in row.items():
+            if k not in ("exercise_id", "updated_ts"):
+                assert abs(v - rebuilt[ex][k]) < 1e-9, (ex, k)
+
+    s = db.get_exercise_stats("E0")
+    assert s["users"] <= 12 and s["attempts"] >= s["users"]
+    assert 0 <= s["first_try_correct_rate"] <= 1 and s["discrimination"] is not None
+    assert db.get_exercise_stats("nope") is None
+
+
+def test_endpoints_and_difficulty_order(fresh_db, client):
+    _seed(fresh_db)
+    rows = client.get("/exercises/stats", params={"topic": "optimization"}).json()
+    assert [r["exercise_id"] for r in rows] == ["E3", "E4", "E5"]
+    assert client.get("/exercises/E1/stats").json()["attempts"] == db.get_exercise_stats("E1")["attempts"]
+    assert client.get("/exercises/nope/stats").status_code == 404
+
+    rate = {r["exercise_id"]: r["first_try_correct_rate"] for r in client.get("/exercises/stats").json()}
+    ordered = by_difficulty(["E0", "E1", "E2", "E3", "E4", "E5"], target=0.7, min_users=1)
+    gaps = [abs(rate[e] - 0.7) for e in ordered]
+    assert gaps == sorted(gaps)
+    assert by_difficulty(["E5", "E0"], target=0.7, min_users=99) == ["E5", "E0"]   # not enough data
+
+
+def test_list_stats_hides_only_a_missing_table(monkeypatch):
+    def fail(msg):
+        def _merged(where, args):
+            raise sqlite3.OperationalError(msg)
+        return _merged
+
+    monkeypatch.setattr(db, "_merged_stats", fail("no such table: exercise_stats"))
+    assert db.list_exercise_stats() == []
+    monkeypatch.setattr(db, "_merged_stats", fail("database is locked"))
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        db.list_exercise_stats()
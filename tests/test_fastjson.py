@@ -0,0 +1,34 @@
+# FAST_JSON mode returns the same payloads; card bytes are reused per catalog version
+
+import json
+
+from mqth_q import config
+from mqth_q.fastjson import CardCache, benchmark
+
+
+def test_card_cache_reuses_bytes_per_version():
+    calls = []
+    def load(ids):
+        calls.append(list(ids))
+        return [{"exercise_id": x, "question": x.lower()} for x in ids if x != "GONE"]
+
+    cache = CardCache()
+    assert json.loads(cache.get_many(["A", "GONE", "B"], 1, load)) == [
+        {"exercise_id": "A", "question": "a"}, {"exercise_id": "B", "question": "b"}]
+    cache.get_many(["B", "A"], 1, load)
+    cache.get_many(["A"], 2, load)
+    assert calls == [["A", "GONE", "B"], ["A"]]
+
+
+def test_fast_mode_matches_default(client, monkeypatch):
+    paths = [("/questions/next", {"username": "erin", "k": 2}), ("/users/erin/attempts", {"limit": 5})]
+    default = [client.get(p, params=q).json() for p, q in paths]
+    monkeypatch.setattr(config, "FAST_JSON", True)
+    fast = [client.get(p, params=q) for p, q in paths]
+    assert [r.json() for r in fast] == default
+    assert all(r.headers["content-type"].startswith("application/json") for r in fast)
+
+
+def test_benchmark_shapes_agree():
+    rows = benchmark(n=5)      # asserts standard and fast bodies decode to the same JSON
+    assert {r["endpoint"] for r in rows} >= {"GET /questions/next (k=5)"}
@@ -0,0 +1,99 @@
+# Golden-set evaluation: loading, Parquet checkpoint/resume, bounded LLM pool, report
+
+import pandas as pd
+import pytest
+
+from mqth_q import grade_eval
+from mqth_q.calibration import GLOBAL_KEY
+
+SOLUTIONS = ["Every Cauchy sequence converges because the space is complete.",
+             "The Lagrangian first order conditions give the optimum."]
+
+
+def _golden(tmp_path, fresh_db, rows=None):
+    fresh_db([(f"E{i}", f"q{i}", sol, "metric_spaces" if i == 0 else "optimization")
+              for i, sol in enumerate(SOLUTIONS)], columns=("exercise_id", "question", "solution", "topic_pred"))
+    if rows is None:
+        rows = [(f"E{i % 2}", SOLUTIONS[i % 2] if i % 3 else f"no idea {i}", "correct" if i % 3 else "incorrect")
+                for i in range(8)]
+    path = tmp_path / "golden.csv"
+    pd.DataFrame(rows, columns=["exercise_id", "student_answer", "label"]).to_csv(path, index=False)
+    return path
+
+
+def _llm(calls, interrupt_at=None):
+    def llm(question, solution, student, timeout=None, exercise_id=None):
+        if len(calls) == interrupt_at:
+            raise KeyboardInterrupt
+        calls.append(student)
+        return {"score": 0.9, "correct": student == solution}
+    return llm
+
+
+def test_load_golden_joins_solutions_and_keys_duplicates(tmp_path, fresh_db):
+    path = _golden(tmp_path, fresh_db, rows=[("E0", "same", "correct"), ("E0", "same", "correct"),
+                                             ("E1", "other", "partial"), ("missing", "x", "incorrect")])
+    with pytest.warns(UserWarning, match="1 exercise_id not found"):
+        df = grade_eval.load_golden(path)
+    assert df["exercise_id"].tolist() == ["E0", "E0", "E1"]
+    assert df["y_true"].tolist() == [1, 1, 0] and df["solution"].tolist()[2] == SOLUTIONS[1]
+    assert df["row_key"].nunique() == 3 and df["row_key"][0].endswith("-0") and df["row_key"][1].endswith("-1")
+
+    pd.DataFrame({"exercise_id": ["E0"], "student_answer": ["a"], "label": ["maybe"]}).to_csv(path, index=False)
+    with pytest.raises(ValueError, match="Unexpected labels"):
+        grade_eval.load_golden(path)
+    with pytest.raises(FileNotFoundError):
+        grade_eval.load_golden(tmp_path / "nope.csv")
+
+
+def test_interrupted_run_resumes_from_the_parquet_checkpoint(tmp_path, fresh_db, monkeypatch):
+    path = _golden(tmp_path, fresh_db)
+    ck = tmp_path / "ck.parquet"
+    calls = []
+    monkeypatch.setattr(grade_eval, "llm_grade_and_feedback", _llm(calls, interrupt_at=5))
+    args = ["--golden", str(path), "--checkpoint", str(ck), "--llm", "--workers", "1"]
+    assert grade_eval.main(args) == 130
+
+    partial = grade_eval.load_checkpoint(ck)
+    assert len(partial) == 8 and partial["baseline_score"].notna().all()
+    assert (partial["llm_ok"] == True).sum() == 5                       # noqa: E712
+
+    monkeypatch.setattr(grade_eval, "llm_grade_and_feedback", _llm(calls))
+    assert grade_eval.main(args) == 0
+    assert len(calls) == 8                                              # only the 3 remaining rows
+    assert (grade_eval.load_checkpoint(ck)["llm_ok"] == True).sum() == 8  # noqa: E712
+    assert grade_eval.main(args) == 0 and len(calls) == 8               # nothing left to do
+
+
+def test_main_without_checkpoint_limits_llm_rows(tmp_path, fresh_db, monkeypatch, capsys):
+    path = _golden(tmp_path, fresh_db)
+    monkeypatch.chdir(tmp_path)
+    calls = []
+    monkeypatch.setattr(grade_eval, "llm_grade_and_feedback", _llm(calls))
+    assert grade_eval.main(["--golden", str(path), "--no-checkpoint", "--llm", "--limit", "3"]) == 0
+    assert len(calls) == 3
+    assert not (tmp_path / grade_eval.CHECKPOINT_PATH).exists()
+    out = capsys.readouterr().out
+    assert "Golden rows ready: 8" in out and "LLM n=3" in out and "Suggested GRADE_THRESHOLD" in out
+
+
+def test_run_llm_records_failures_for_retry(tmp_path, fresh_db, monkeypatch):
+    df = grade_eval.load_golden(_golden(tmp_path, fresh_db))
+    monkeypatch.setattr(grade_eval, "llm_grade_and_feedback",
+                        lambda question, solution, student, timeout=None, exercise_id=None:
+                        None if student.startswith("no idea") else {"score": 1.0, "correct": True})
+    results = grade_eval.load_checkpoint(None)
+    results = grade_eval.run_llm(df, results, workers=3)
+    assert results["llm_ok"].sum() == 5 and results["llm_score"].isna().sum() == 3
+    assert results.loc[results["llm_ok"] == False, "llm_sec"].notna().all()   # noqa: E712
+
+
+def test_report_picks_the_separating_threshold(capsys):
+    df = pd.DataFrame({"y_true": [0, 0, 0, 1, 1, 1] * 2, "baseline_score": [0.1, 0.2, 0.3, 0.7, 0.8, 0.9] * 2,
+                       "baseline_sec": 0.001, "topic": ["a"] * 6 + ["b"] * 6})
+    best = grade_eval.report(df, min_rows=6)
+    assert best["accuracy"] == 1.0 and 0.3 < best["threshold"] <= 0.7
+    assert set(best["fitted"]) == {GLOBAL_KEY, "a", "b"}
+    out = capsys.readouterr().out
+    assert "ROC-AUC (baseline score): 1.000" in out
+    assert "Baseline latency (vectorized batches, n=12): total=0.0120s" in out and "p95" not in out
@@ -0,0 +1,56 @@
+# Columnar attempt history gives the same aggregates as the old per-dict loops
+
+import random
+from statistics import mean
+
+import mqth_q.db as db
+from mqth_q import service
+from mqth_q.history import load_history
+from mqth_q.recommender import recent_mistakes, topic_performance
+
+
+def _seed(fresh_db):
+    topics = ["metric_spaces", "optimization", "unknown", None]
+    fresh_db([(f"E{i}", "q", topics[i % 4]) for i in range(12)])
+    with db._con() as con:
+        uid = int(con.execute("INSERT INTO users(username) VALUES('hana')").lastrowid)
+        rng = random.Random(7)
+        con.executemany("INSERT INTO attempts(ts, user_id, exercise_id, score, correct) VALUES(?,?,?,?,?)", [
+            (1000.0 + i, uid, f"E{rng.randrange(12)}",
+             None if i % 9 == 0 else round(rng.random(), 2), None if i % 11 == 0 else rng.randrange(2))
+            for i in range(200)])
+    return uid
+
+
+def test_summary_matches_dict_reference(fresh_db):
+    uid = _seed(fresh_db)
+    atts = db.get_attempts(uid, limit=10_000)
+    by_topic = {}
+    for a in atts:
+        by_topic.setdefault(a["topic"] or "unknown", []).append(a)
+    expected = [{"topic": t, "n": len(xs),
+                 "avg_score": round(mean(a["score"] or 0.0 for a in xs), 3),
+                 "correct_rate": round(mean(a["correct"] or 0 for a in xs), 3)} for t, xs in sorted(by_topic.items())]
+    summary = service.get_user_summary("hana")
+    assert summary["by_topic"] == expected
+    scores = [a["score"] for a in atts if a["score"] is not None]
+    assert summary["overall"]["attempts"] == len(scores)
+    assert summary["overall"]["avg_score"] == round(mean(scores), 3)
+    assert summary["overall"]["last_attempt_ts"] == 1199.0
+
+
+def test_recommender_helpers_match_dict_reference(fresh_db):
+    uid = _seed(fresh_db)
+    atts = db.get_attempts(uid, limit=10_000)
+    latest = {}
+    for a in atts:
+        if a["exercise_id"] not in latest or a["ts"] > latest[a["exercise_id"]]["ts"]:
+            latest[a["exercise_id"]] = a
+    wrong = sorted((a for a in latest.values() if not a["correct"]), key=lambda a: -a["ts"])
+    assert recent_mistakes(uid, limit=10) == [a["exercise_id"] for a in wrong][:10]
+
+    perf = {p["topic"]: p for p in topic_performance(uid)}
+    scored = [a for a in atts if a["topic"] == "optimization" and a["score"] is not None]
+    assert perf["optimization"]["n"] == len(scored)
+    assert abs(perf["optimization"]["avg_score"] - mean(a["score"] for a in scored)) < 1e-12
+    assert None not in perf and len(load_history(uid).exercises) <= 12
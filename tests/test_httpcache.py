@@ -0,0 +1,45 @@
+# ETag / 304 on catalog endpoints and user summary; versions bump on catalog changes
+
+import mqth_q.db as db
+from mqth_q.httpcache import etag_matches, is_any_etag, make_etag
+
+
+def test_etag_matching():
+    tag = make_etag("topics", 3)
+    assert tag != make_etag("topics", 4)
+    assert etag_matches(f'"other", W/{tag}', tag)
+    assert not etag_matches("*", tag) and is_any_etag(" * ") and not is_any_etag(tag)
+    assert not etag_matches(None, tag)
+
+
+def test_conditional_requests(client, fresh_db):
+    import app
+    fresh_db([("Q1", "State it.", "sets")])
+    app.CATALOG_VERSION.invalidate()
+
+    r = client.get("/topics")
+    assert r.json() == ["sets"] and "max-age" in r.headers["cache-control"]
+    etag = r.headers["etag"]
+    r304 = client.get("/topics", headers={"If-None-Match": etag})
+    assert r304.status_code == 304 and r304.content == b""
+
+    q = client.get("/questions/Q1")
+    assert q.json()["question"] == "State it."
+    assert client.get("/questions/Q1", headers={"If-None-Match": q.headers["etag"]}).status_code == 304
+    assert client.get("/questions/nope").status_code == 404
+    assert client.get("/questions/Q1", headers={"If-None-Match": "*"}).status_code == 304
+    assert client.get("/questions/nope", headers={"If-None-Match": "*"}).status_code == 404
+
+    s = client.get("/users/dora/summary")
+    assert client.get("/users/dora/summary", headers={"If-None-Match": s.headers["etag"]}).status_code == 304
+    uid = db.get_user_id("dora")
+    with db._con() as con:
+        con.execute("INSERT INTO attempts(user_id, exercise_id, score, correct) VALUES(?, 'Q1', 1, 1)", (uid,))
+    s2 = client.get("/users/dora/summary", headers={"If-None-Match": s.headers["etag"]})
+    assert s2.status_code == 200 and s2.json()["overall"]["attempts"] == 1
+
+    with db._con() as con:
+        con.execute("UPDATE questions SET topic_pred='topology' WHERE exercise_id='Q1'")
+    app.CATALOG_VERSION.invalidate()
+    r2 = client.get("/topics", headers={"If-None-Match": etag})
+    assert r2.status_code == 200 and r2.json() == ["topology"]
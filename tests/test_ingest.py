@@ -0,0 +1,63 @@
+# PDF ingestion: exam/exercise parsing and idempotent upserts (page text in, no PDF needed)
+
+import mqth_q.db as db
+from mqth_q.ingest import split_exams, parse_exercises, load_exams
+
+PAGES = [
+    "Cover page",
+    "General Exam in Analysis\nJanuary 23, 2013\nExercise 1 Let f be continuous. Solution f is bounded. (cid:12)",
+    "EXTRA PAGE Exercise 2 Compute the norm. Solution It is 1.",
+    "Midterm Exam\nMarch 3, 2014 Exercise 1 Prove it. Solution Trivial.",
+]
+
+
+def test_split_and_parse():
+    exams = split_exams(PAGES)
+    assert list(exams) == ["General_2013-01-23", "Midterm_2014-03-03"]
+    assert len(exams["General_2013-01-23"]["pages"]) == 2      # header-less page continues the exam
+
+    exs = parse_exercises(exams["General_2013-01-23"])
+    assert [e["exercise_id"] for e in exs] == ["General_2013-01-23_Exercise_1", "General_2013-01-23_Exercise_2"]
+    assert exs[0]["solution"] == "f is bounded."
+    assert exs[1]["question"] == "Compute the norm."
+
+
+def test_load_is_idempotent_and_keeps_topics(fresh_db, quiet):
+    fresh_db()
+
+    con = db.connect()
+    stats = load_exams(con.cursor(), PAGES, log=quiet)
+    con.execute("UPDATE questions SET topic_pred='continuity' WHERE exercise_id LIKE 'General%'")
+    con.commit()
+    assert stats["exams_written"] == 2 and stats["exercises_written"] == 3
+
+    again = load_exams(con.cursor(), PAGES, log=quiet)
+    assert again["exams_written"] == 0 and again["exams_unchanged"] == 2
+
+    edited = PAGES[:3] + [PAGES[3].replace("Trivial.", "By induction.")]
+    third = load_exams(con.cursor(), edited, log=quiet)
+    con.commit()
+    assert third["exams_written"] == 1
+
+    rows = {r["exercise_id"]: r for r in con.execute("SELECT * FROM questions")}
+    assert rows["Midterm_2014-03-03_Exercise_1"]["solution"] == "By induction."
+    assert rows["General_2013-01-23_Exercise_1"]["topic_pred"] == "continuity"
+    assert con.execute("SELECT COUNT(*) FROM sqlite_master WHERE name='idx_questions_topic'").fetchone()[0] == 1
+    con.close()
+
+
+def test_reingest_deletes_exercises_the_exam_no_longer_has(fresh_db, quiet):
+    fresh_db()
+    con = db.connect()
+    load_exams(con.cursor(), PAGES, log=quiet)
+    con.commit()
+    shorter = PAGES[:2] + PAGES[3:]                  # the General exam lost its Exercise 2
+    stats = load_exams(con.cursor(), shorter, log=quiet)
+    con.commit()
+    assert stats["exams_written"] == 1 and stats["exercises_deleted"] == 1
+
+    ids = {r[0] for r in con.execute("SELECT exercise_id FROM questions")}
+    assert ids == {"General_2013-01-23_Exercise_1", "Midterm_2014-03-03_Exercise_1"}
+    fts = con.execute("SELECT COUNT(*) FROM questions_fts WHERE questions_fts MATCH 'norm'").fetchone()[0]
+    assert fts == 0
+    con.close()
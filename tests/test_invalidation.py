@@ -0,0 +1,49 @@
+# Cross-process invalidation via SQLite data_version + multiprocess /metrics
+
+import os, subprocess, sys, textwrap
+from pathlib import Path
+
+import mqth_q.db as db
+from mqth_q.invalidation import InvalidationBus
+from mqth_q.serve import prepare_multiproc_dir
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_bus_sees_commits_from_other_connections(fresh_db):
+    fresh_db()
+    bus = InvalidationBus(interval=0)
+    seen = []
+    bus.subscribe("thresholds", lambda g: seen.append(("thresholds", g)))
+    bus.subscribe("catalog", lambda g: seen.append(("catalog", g)))
+
+    assert bus.poll_once() == []                   # baseline snapshot
+    assert bus.poll_once() == []                   # nothing committed since
+
+    db.save_thresholds({"*": {"threshold": 0.5}})  # e.g. grade_eval --save-thresholds
+    with db._con() as con:
+        con.execute("INSERT INTO questions(exercise_id, question) VALUES('X', 'q')")
+    assert sorted(bus.poll_once()) == ["catalog", "thresholds"]
+    assert ("thresholds", 1) in seen
+
+    seen.clear()
+    gen = bus.publish("thresholds")
+    assert seen == [("thresholds", gen)] and bus.poll_once() == []   # not delivered twice
+
+
+def test_multiprocess_metrics_aggregate(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", "")          # restored after the test
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=prepare_multiproc_dir(str(tmp_path / "prom")),
+               DB_PATH=str(tmp_path / "mp.db"))
+    code = textwrap.dedent("""
+        from fastapi.testclient import TestClient
+        import app
+        c = TestClient(app.app)
+        c.get("/health/live")
+        print(c.get("/metrics").text)
+    """)
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    assert 'http_requests_total{method="GET",path="/health/live",status="200"} 1.0' in out
+    assert "llm_breaker_state" in out
+    assert any(p.suffix == ".db" for p in (tmp_path / "prom").iterdir())
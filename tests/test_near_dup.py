@@ -0,0 +1,129 @@
+# Near-duplicate answers: MinHash/LSH reuse of LLM verdicts, anchors, batch path, replay
+
+import json
+
+import mqth_q.db as db
+import mqth_q.grading as grading
+from mqth_q import near_dup, service
+from mqth_q.near_dup import NEAR_DUPS, normalize, signature
+
+ANSWER = ("By the Banach fixed point theorem the contraction T has a unique fixed point, "
+          "since the space is complete and T is Lipschitz with constant 1/2.")
+REWORDED = ("by the Banach fixed-point theorem, the contraction T has a unique fixed point "
+            "because the space is complete and T is Lipschitz with constant 1/2")
+
+
+def _sim(a, b):
+    return float((signature(normalize(a)[0]) == signature(normalize(b)[0])).mean())
+
+
+def test_signatures_track_similarity_and_anchors_guard_meaning():
+    assert _sim(ANSWER, ANSWER.upper() + "!!") == 1.0
+    assert _sim(ANSWER, REWORDED) > 0.85 > _sim(ANSWER, "Completeness fails, so no fixed point exists.")
+    assert normalize(REWORDED)[1] == normalize(ANSWER)[1] == ("1", "/", "2")
+    assert normalize("x-1 is not 3")[1] == ("-", "1", "not", "3")
+
+
+def _setup(fresh_db, monkeypatch, calls):
+    fresh_db([(f"E{i}", f"q{i}", "Banach fixed point theorem on a complete space", "metric_spaces")
+              for i in range(2)], columns=("exercise_id", "question", "solution", "topic_pred"))
+
+    def llm(question, solution, student, timeout=None, exercise_id=None):
+        calls.append(student)
+        return {"score": 0.8, "correct": True, "cosine": None, "jaccard": None,
+                "missing_keywords": [], "reasons": f"llm #{len(calls)}", "hint": "check the constant"}
+
+    monkeypatch.setattr(grading, "llm_grade_and_feedback", llm)
+    monkeypatch.setattr(NEAR_DUPS, "threshold", 0.85)     # off by default (NEAR_DUP_THRESHOLD=0)
+    NEAR_DUPS.clear()
+
+
+def test_near_duplicates_reuse_the_stored_llm_verdict(fresh_db, monkeypatch):
+    calls = []
+    _setup(fresh_db, monkeypatch, calls)
+    outcomes = []
+    NEAR_DUPS.add_observer(outcomes.append)
+
+    first = service.submit_answer("ana", "E0", ANSWER)
+    assert first["reasons"] == "llm #1"
+    again = service.submit_answer("ben", "E0", REWORDED)
+    assert len(calls) == 1 and again["reasons"] == "llm #1" and again["hint"] == "check the constant"
+    assert service.submit_answer("cai", "E0", ANSWER.replace("1/2", "2"))["reasons"] == "llm #2"
+    assert service.submit_answer("dan", "E1", ANSWER)["reasons"] == "llm #3"      # per exercise
+    assert service.submit_answer("eli", "E0", "yes")["reasons"] == "llm #4"        # short: exact only
+    assert service.submit_answer("fay", "E0", "Yes.")["reasons"] == "llm #4"
+    assert outcomes == ["miss", "near", "miss", "miss", "miss", "exact"]
+    NEAR_DUPS._observers.remove(outcomes.append)
+
+    with db._con() as con:
+        fb = [json.loads(r[0]) for r in con.execute("SELECT feedback_json FROM attempts ORDER BY attempt_id")]
+    assert "reused" not in fb[0]
+    assert fb[1]["reused"]["attempt_id"] == 1 and fb[1]["reused"]["similarity"] >= 0.85
+    # batch: reused items skip the LLM, the rest are graded concurrently
+    out = service.submit_answers("gus", [("E0", REWORDED + "."), ("E1", "A different approach entirely.")])
+    assert [i["reasons"] for i in out["items"]] == ["llm #1", "llm #5"] and len(calls) == 5
+    # only LLM verdicts are indexed (3 for E0, 1 for E1 so far), never the reused rows
+    assert NEAR_DUPS.snapshot() == {"exercises": 2, "answers": 4}
+
+
+def test_index_sees_other_processes_and_replay_reports_savings(fresh_db, monkeypatch, quiet):
+    calls = []
+    _setup(fresh_db, monkeypatch, calls)
+    uid = db.get_user_id("zoe")
+    # written by another worker: the index catches up on the next lookup
+    db.save_attempt(uid, "E0", {"score": 0.3, "correct": False, "cosine": None, "reasons": "other", "hint": "h"},
+                    ANSWER)
+    db.save_attempt(uid, "E0", {"score": 0.9, "correct": True, "cosine": 0.9, "reasons": "baseline"}, REWORDED)
+    assert NEAR_DUPS.lookup("E0", REWORDED)["reasons"] == "other"
+    db.save_attempt(uid, "E0", {"score": 0.4, "correct": False, "cosine": None, "reasons": "again"}, REWORDED)
+    summary = near_dup.replay(["E0"], threshold=0.85, log=quiet)
+    assert summary["llm_graded"] == 2 and summary["reused"] == 1 and summary["agreement"] == 1.0
+    assert summary["mean_abs_score_diff"] == 0.1
+
+
+def test_edited_solution_rebuilds_only_that_exercise(fresh_db, monkeypatch):
+    calls = []
+    _setup(fresh_db, monkeypatch, calls)
+    service.submit_answer("ana", "E0", ANSWER)
+    service.submit_answer("ben", "E1", ANSWER)
+    with db._con() as con:
+        fp = json.loads(con.execute("SELECT feedback_json FROM attempts WHERE attempt_id = 1").fetchone()[0])
+        assert fp["solution_fp"] == near_dup.solution_fp("Banach fixed point theorem on a complete space")
+        con.execute("UPDATE questions SET solution = 'Use Cauchy sequences' WHERE exercise_id = 'E0'")
+    e1 = NEAR_DUPS._exercises[(db.DB_PATH, "E1")]
+    # the verdict given against the old solution is not reused; E1 keeps its index
+    assert service.submit_answer("cai", "E0", REWORDED)["reasons"] == "llm #3"
+    assert service.submit_answer("dan", "E1", REWORDED)["reasons"] == "llm #2"
+    assert NEAR_DUPS._exercises[(db.DB_PATH, "E1")] is e1
+    assert service.submit_answer("eli", "E0", REWORDED + "!")["reasons"] == "llm #3"
+
+
+def test_full_index_reads_the_newest_answers_and_evicts_the_oldest(fresh_db, monkeypatch):
+    _setup(fresh_db, monkeypatch, [])
+    uid = db.get_user_id("zoe")
+    for i in range(6):
+        db.save_attempt(uid, "E0", {"score": 0.5, "correct": False, "cosine": None,
+                                    "reasons": f"v{i}", "hint": ""}, f"{ANSWER} Step {'abcdef'[i]}.")
+    idx = near_dup.NearDupIndex(threshold=0.85, max_per_exercise=2)
+    reads = []
+
+    def llm_answers(exercise_id, after, limit=None):
+        rows, marks = real(exercise_id, after, limit)
+        reads.append((limit, [r["reasons"] for r in rows]))
+        return rows, marks
+
+    real = db.llm_answers
+    monkeypatch.setattr(db, "llm_answers", llm_answers)
+    assert idx.lookup("E0", f"{ANSWER} Step f.")["reasons"] == "v5"
+    assert reads == [(2, ["v5", "v4"])]
+    assert idx.snapshot() == {"exercises": 1, "answers": 2}
+
+    db.save_attempt(uid, "E0", {"score": 0.9, "correct": True, "cosine": None,
+                                "reasons": "v6", "hint": ""}, f"{ANSWER} Step g.")
+    assert idx.lookup("E0", f"{ANSWER} Step g.")["reasons"] == "v6"   # full, still sees new verdicts
+    assert reads[-1] == (2, ["v6"])
+    ex = idx._exercises[(db.DB_PATH, "E0")]
+    assert sorted(v["reasons"] for v in ex.verdicts) == ["v5", "v6"]  # v4 (the oldest) was evicted
+    assert idx.snapshot() == {"exercises": 1, "answers": 2}
+    assert sum(len(slots) for band in ex.bands for slots in band.values()) == 2 * len(ex.bands)
+    assert len(ex.exact) == 2
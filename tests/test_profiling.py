@@ -0,0 +1,92 @@
+# On-demand sampling profiler: output files, component breakdown, API header hook
+
+import importlib, json, sqlite3, time
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from mqth_q import profiling
+
+
+def _sqlite_work(seconds: float):
+    con = sqlite3.connect(":memory:")
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < seconds:
+        con.execute("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x+1 FROM c WHERE x < 20000) "
+                    "SELECT SUM(x) FROM c").fetchone()
+    con.close()
+
+
+def test_profiled_block_writes_speedscope_folded_and_summary(tmp_path):
+    with profiled_block(tmp_path) as p:
+        _sqlite_work(0.3)
+    assert set(p.paths) == {"speedscope", "folded", "summary"}
+    doc = json.loads(Path(p.paths["speedscope"]).read_text())
+    prof = doc["profiles"][0]
+    assert prof["type"] == "sampled" and len(prof["samples"]) == len(prof["weights"])
+    assert all(i < len(doc["shared"]["frames"]) for s in prof["samples"] for i in s)
+    assert "_sqlite_work" in Path(p.paths["folded"]).read_text()
+
+    summary = json.loads(Path(p.paths["summary"]).read_text())
+    assert summary["samples"] >= 10
+    assert any("_sqlite_work" in t["frame"] for t in summary["top_total"])
+    assert sum(summary["components"].values()) > 99
+
+
+def test_component_is_decided_by_the_leaf_most_known_frame():
+    app_frame = ("api_submit_attempt", "/srv/app.py", 1)
+    db_frame = ("save_attempt", "/srv/mqth_q/db.py", 600)
+    sk_frame = ("fit_transform", "/venv/site-packages/sklearn/feature_extraction/text.py", 10)
+    assert profiling._component((app_frame, db_frame)) == "sqlite"
+    assert profiling._component((app_frame, db_frame, sk_frame)) == "sklearn"
+    assert profiling._component((app_frame,)) == "app"
+    assert profiling._component((("run", "/venv/site-packages/starlette/routing.py", 1),)) == "framework"
+
+
+def profiled_block(tmp_path):
+    return profiling.profiled("unit", directory=str(tmp_path), all_threads=False, interval=0.002)
+
+
+def test_request_profiled_only_with_token(tmp_path, monkeypatch, tmp_db):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "s3cret")
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    import app
+    importlib.reload(app)                   # routes/middleware are installed at import when enabled
+    client = TestClient(app.app)
+
+    assert "x-profile" not in client.get("/health").headers
+    assert "x-profile" not in client.get("/health", headers={"X-Profile": "wrong"}).headers
+    r = client.get("/questions/next", params={"username": "pia", "k": 1}, headers={"X-Profile": "s3cret"})
+    assert r.status_code == 200 and r.json()
+    stem = r.headers["x-profile"]
+    summary = json.loads((tmp_path / f"{stem}.summary.json").read_text())
+    assert summary["name"] == "GET /questions/next" and summary["samples"] >= 0
+    assert (tmp_path / f"{stem}.speedscope.json").exists()
+    assert "x-profile" not in client.get("/health", params={"profile": "s3cret"}).headers   # header only
+    assert profiling.wanted("s3cret", 1.0) and not profiling.wanted("s3cre", 1.0) and not profiling.wanted(None, 1.0)
+
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "")
+    importlib.reload(app)
+    assert app.app.router.route_class is not app.ProfiledRoute
+
+
+def test_streamed_body_is_part_of_the_profile(tmp_path, monkeypatch, tmp_db):
+    import mqth_q.grading as grading
+
+    def slow_tokens(*a, **k):
+        for tok in ['{"score": 0.9, ', '"correct": true}']:
+            _sqlite_work(0.1)
+            yield tok
+
+    monkeypatch.setattr(grading, "llm_stream_tokens", slow_tokens)
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "s3cret")
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    import app
+    importlib.reload(app)
+    client = TestClient(app.app)
+    r = client.post("/attempts/stream", headers={"X-Profile": "s3cret"}, json={
+        "username": "sia", "exercise_id": "General_2025-08-29_Exercise_1", "answer": "y is unique"})
+    assert r.status_code == 200 and "event: result" in r.text
+    summary = json.loads((tmp_path / f"{r.headers['x-profile']}.summary.json").read_text())
+    assert summary["wall_seconds"] >= 0.2                   # closed after the body, not before it
+    assert any("slow_tokens" in t["frame"] for t in summary["top_total"])
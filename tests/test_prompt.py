@@ -0,0 +1,27 @@
+# Prompt budgeting: fits num_ctx, stable prefix per exercise
+
+from mqth_q.prompt import build_grading_prompt, estimate_tokens, compact_solution
+
+LONG_SOL = " ".join(
+    f"Step {i}: apply the contraction mapping theorem on the Banach space with constant {i}."
+    for i in range(300)
+)
+
+
+def test_long_solution_is_compacted_to_budget():
+    p = build_grading_prompt("Prove it.", LONG_SOL, "short answer", exercise_id="ex-1",
+                             num_ctx=1024, max_output=160)
+    assert p.compacted
+    assert p.tokens <= 1024 - 160
+    assert p.text.rstrip().endswith("JSON:")
+
+
+def test_prefix_is_shared_across_students():
+    a = build_grading_prompt("Q", LONG_SOL, "first student", exercise_id="ex-2").text
+    b = build_grading_prompt("Q", LONG_SOL, "a much longer second student answer", exercise_id="ex-2").text
+    assert a.split("Student answer:")[0] == b.split("Student answer:")[0]
+
+
+def test_short_solution_untouched():
+    assert compact_solution("x = 2.", 50) == "x = 2."
+    assert estimate_tokens("") == 0
@@ -0,0 +1,90 @@
+# Ollama pool: least-loaded routing, max concurrency, ejection
+
+import pytest
+
+from mqth_q.grading import llm_stream_tokens as _REAL_STREAM    # conftest stubs the module attribute
+from mqth_q.router import NoBackendAvailable, NoHealthyBackend, OllamaRouter
+
+
+def _router():
+    return OllamaRouter([
+        {"url": "http://a:1", "weight": 2, "max_concurrency": 2},
+        {"url": "http://b:1", "weight": 1, "max_concurrency": 1},
+    ], wait=0.0, health_interval=0)
+
+
+def test_least_outstanding_by_weight():
+    r = _router()
+    with r.acquire() as b1:
+        assert b1.url == "http://a:1"          # tie -> first declared
+        with r.acquire() as b2:
+            assert b2.url == "http://b:1"      # a: 1/2 load vs b: 0
+            with r.acquire() as b3:
+                assert b3.url == "http://a:1"  # b is at max concurrency
+                with pytest.raises(NoBackendAvailable):
+                    with r.acquire():
+                        pass
+    assert all(b["inflight"] == 0 for b in r.snapshot())
+
+
+def test_ejected_backend_is_skipped_and_errors_counted():
+    r = _router()
+    r.backends[0].healthy = False
+    seen = []
+    r.add_observer(lambda url, dt, ok: seen.append((url, ok)))
+    with pytest.raises(RuntimeError):
+        with r.acquire() as b:
+            assert b.url == "http://b:1"
+            raise RuntimeError("boom")
+    assert seen == [("http://b:1", False)]
+    assert r.snapshot()[1]["errors"] == 1
+
+
+def test_outage_fails_fast_but_saturation_waits():
+    r = _router()
+    r.wait = 5.0
+    for b in r.backends:
+        b.healthy = False
+    with pytest.raises(NoHealthyBackend):
+        with r.acquire():
+            pass
+    r.backends[1].healthy = True
+    r.backends[0].breaker._set_state("open")     # still not up: only b is
+    with r.acquire(wait=0.0):
+        with pytest.raises(NoBackendAvailable):    # b is up but busy: saturation
+            with r.acquire(wait=0.05):
+                pass
+
+
+def test_closed_stream_records_nothing_on_either_breaker(monkeypatch):
+    import requests
+    import mqth_q.grading as grading
+    from mqth_q.breaker import CircuitBreaker
+
+    class FakeStream:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def raise_for_status(self):
+            pass
+
+        def iter_lines(self):
+            yield b'{"response": "{\\"score\\": "}'
+            yield b'{"response": "0.9}", "done": true}'
+
+    r = OllamaRouter([{"url": "http://a:1"}], wait=0.0, health_interval=0)
+    agg = CircuitBreaker("agg", min_calls=1)
+    seen = []
+    r.add_observer(lambda url, dt, ok: seen.append(ok))
+    monkeypatch.setattr(grading, "LLM_ROUTER", r)
+    monkeypatch.setattr(grading, "LLM_BREAKER", agg)
+    monkeypatch.setattr(requests, "post", lambda *a, **k: FakeStream())
+
+    gen = _REAL_STREAM("q", "s", "a")
+    assert next(gen) == '{"score": '
+    gen.close()                                     # the client went away
+    assert agg.snapshot()["calls"] == 0 and r.backends[0].breaker.snapshot()["calls"] == 0
+    assert seen == [] and r.snapshot()[0]["inflight"] == 0 and r.snapshot()[0]["errors"] == 0
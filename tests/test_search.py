@@ -0,0 +1,45 @@
+# FTS5 search: BM25 ranking, filters, trigger sync and the /questions/search endpoint
+
+import pytest
+
+import mqth_q.db as db
+
+ROWS = [
+    ("G_1", "Hilbert spaces", "Prove the Riesz representation theorem for Hilbert spaces.", "Use orthogonal projection."),
+    ("G_2", "measure theory", "State the dominated convergence theorem.", "Apply Fatou's lemma in a Hilbert setting."),
+    ("G_3", "measure theory", "Compute the Lebesgue measure of the Cantor set.", "It is zero."),
+]
+
+
+@pytest.fixture()
+def search_db(fresh_db):
+    fresh_db(ROWS, columns=("exercise_id", "topic_pred", "question", "solution"))
+    return db
+
+
+def test_ranking_filters_and_sync(search_db):
+    res = db.search_questions("hilbert")
+    assert res["total"] == 2
+    assert [r["exercise_id"] for r in res["items"]] == ["G_1", "G_2"]     # question hit outranks solution hit
+    assert "[Hilbert]" in res["items"][0]["snippet"]
+
+    assert db.search_questions("theor", topic="measure theory")["items"][0]["exercise_id"] == "G_2"
+    assert db.search_questions('hilbert" ) -(')["total"] == 2          # user input cannot break MATCH syntax
+    assert db.search_questions("hilbert", limit=1, offset=1)["items"][0]["exercise_id"] == "G_2"
+
+    uid = db.get_user_id("ana")
+    with db._con() as con:
+        con.execute("INSERT INTO attempts(user_id, exercise_id, score, correct) VALUES(?, 'G_1', 1, 1)", (uid,))
+        con.execute("UPDATE questions SET question='Banach spaces only.' WHERE exercise_id='G_2'")
+        con.execute("DELETE FROM questions WHERE exercise_id='G_3'")
+    assert [r["exercise_id"] for r in db.search_questions("hilbert", unseen_for=uid)["items"]] == ["G_2"]
+    assert db.search_questions("banach")["total"] == 1
+    assert db.search_questions("cantor")["total"] == 0
+
+
+def test_search_endpoint(client, search_db):
+    r = client.get("/questions/search", params={"q": "riesz"})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["total"] == 1 and body["items"][0]["exercise_id"] == "G_1"
+    assert client.get("/questions/search", params={"q": "riesz", "limit": 0}).status_code == 422
@@ -0,0 +1,107 @@
+# Sharded storage: routing, catalog joins through ATTACH, merged stats, moving users
+
+import os
+
+import pytest
+
+import mqth_q.db as db
+from mqth_q import service, shards
+from mqth_q.exercise_stats import rebuild
+
+CATALOG = [("E1", "Banach contraction fixed point", "metric_spaces"),
+           ("E2", "Lagrangian first order conditions", "optimization"),
+           ("E3", "Cauchy sequence convergence", "metric_spaces")]
+
+
+@pytest.fixture
+def sharded(tmp_path, monkeypatch, fresh_db):
+    monkeypatch.setattr(db, "SHARDS", 3)
+    db.clear_routes()
+    fresh_db(CATALOG, name="main.db")
+    yield tmp_path
+    db.clear_routes()
+
+
+def _stats():
+    return {s["exercise_id"]: (s["attempts"], s["users"], s["first_try_correct_rate"])
+            for s in db.list_exercise_stats()}
+
+
+def test_users_live_on_their_home_shard(sharded, quiet):
+    users = [f"u{i}" for i in range(12)]
+    for i, u in enumerate(users):
+        uid = db.get_user_id(u)
+        db.save_attempt(uid, "E1", {"score": 0.5 + i / 30, "correct": i % 2 == 0}, "a")
+        db.save_attempt(uid, "E2", {"score": 0.2, "correct": False}, "b")
+    ids = [db.get_user_id(u) for u in users]
+    assert len(set(ids)) == len(ids)                        # ids are unique across shards
+    for u, uid in zip(users, ids):
+        assert db.shard_of(uid) == db.home_shard(u)
+        with db._con(db.home_shard(u)) as con:
+            assert con.execute("SELECT COUNT(*) FROM attempts WHERE user_id=?", (uid,)).fetchone()[0] == 2
+    assert {db.home_shard(u) for u in users} == {0, 1, 2}
+    assert all(os.path.exists(db.shard_path(i)) for i in range(3))
+
+    # attempts joined with the attached catalog; FTS search filtered by the user's shard
+    assert [a["topic"] for a in db.get_attempts(ids[0])] == ["optimization", "metric_spaces"]
+    assert {q["exercise_id"] for q in db.list_unseen(ids[0])} == {"E3"}
+    assert {h["exercise_id"] for h in db.search_questions("metric")["items"]} == {"E1", "E3"}
+    hits = db.search_questions("metric", unseen_for=ids[0])
+    assert [h["exercise_id"] for h in hits["items"]] == ["E3"]
+    assert service.get_user_summary("u0")["overall"]["attempts"] == 2
+    assert db.user_version("nobody") == "0-0"
+
+    # stats merge across shards and match a per-shard rebuild
+    merged = _stats()
+    assert merged["E1"][:2] == (12, 12) and merged["E2"][:2] == (12, 12)
+    assert rebuild(log=quiet) == {"attempts": 24, "users": 12, "exercises": 2}
+    assert _stats() == merged
+
+
+def test_pin_and_rebalance_move_rows_and_stats(sharded, monkeypatch, quiet):
+    for i in range(9):
+        uid = db.get_user_id(f"s{i}")
+        for j, ex in enumerate(["E1", "E2", "E1", "E3"]):
+            db.save_attempt(uid, ex, {"score": (i + j) / 12, "correct": (i + j) % 3 == 0}, f"ans{i}{j}")
+    before = _stats()
+
+    uid = db.get_user_id("s0")
+    dest = (db.home_shard("s0") + 1) % 3
+    assert shards.place("s0", dest, pinned=True) == 4
+    assert db.shard_of(uid) == dest and db.get_user_id("s0") == uid
+    answers = [a["student_answer"] for a in db.get_attempts(uid, include_archived=True)]
+    assert answers == ["ans03", "ans02", "ans01", "ans00"]
+    assert _stats() == pytest.approx(before)
+    assert shards.plan() == []                               # pinned users stay put
+
+    # growing to 4 shards: rebalance sends unpinned users to their new home, stats unchanged
+    monkeypatch.setattr(db, "SHARDS", 4)
+    db.init_db()
+    moves = shards.plan()
+    assert all(name != "s0" for name, _, _ in moves)
+    shards.rebalance(log=quiet)
+    assert shards.plan() == []
+    db.clear_routes()
+    for i in range(1, 9):
+        assert db.shard_of(db.get_user_id(f"s{i}")) == db.home_shard(f"s{i}", 4)
+        assert len(db.get_attempts(db.get_user_id(f"s{i}"))) == 4
+    assert _stats() == pytest.approx(before)
+    st = shards.status()
+    assert sum(f["attempts"] for f in st["files"]) == 36 and st["pinned"] == 1
+
+
+def test_legacy_users_keep_their_ids(monkeypatch, fresh_db, quiet):
+    db.clear_routes()
+    fresh_db(CATALOG, name="legacy.db")
+    old = db.get_user_id("ana")
+    db.save_attempt(old, "E1", {"score": 0.9, "correct": True}, "x")
+
+    monkeypatch.setattr(db, "SHARDS", 2)
+    db.init_db()
+    assert db.get_user_id("ana") == old and db.get_user_id("new") > old
+    shards.rebalance(log=quiet)
+    assert [a["student_answer"] for a in db.get_attempts(old, include_archived=True)] == ["x"]
+    assert _stats()["E1"][:2] == (1, 1)
+    with db._con() as con:
+        assert con.execute("SELECT COUNT(*) FROM attempts").fetchone()[0] == 0
+    db.clear_routes()
@@ -0,0 +1,59 @@
+# Analytics snapshot: paced online backup, read-only routing, ?consistency=snapshot
+
+import sqlite3, threading
+
+import pytest
+
+import mqth_q.db as db
+import mqth_q.snapshot as snapshot
+from mqth_q import service
+
+
+def _setup(fresh_db, monkeypatch):
+    monkeypatch.setattr(snapshot, "SNAPSHOT_PATH", "")
+    fresh_db([("E1", "q", "optimization")], name="live.db")
+    db.save_attempt(db.get_user_id("ivy"), "E1", {"score": 0.8, "correct": True}, "a")
+
+
+def test_snapshot_is_consistent_and_read_only(fresh_db, monkeypatch):
+    _setup(fresh_db, monkeypatch)
+    stop = threading.Event()
+
+    def writer():              # keeps committing while the backup runs
+        uid = db.get_user_id("ivy")
+        while not stop.is_set():
+            db.save_attempt(uid, "E1", {"score": 0.1, "correct": False}, "b")
+
+    t = threading.Thread(target=writer)
+    t.start()
+    try:
+        info = snapshot.take_snapshot(pages=1, sleep=0)
+    finally:
+        stop.set()
+        t.join()
+    assert info["path"].endswith("live.snapshot.db") and info["steps"] >= 1
+
+    with snapshot.reading() as meta:
+        assert meta["taken_ts"] == info["taken_ts"]
+        s = service.get_user_summary("ivy")
+        assert s["overall"]["attempts"] >= 1
+        assert service.get_user_summary("nobody")["overall"]["attempts"] == 0   # no write attempted
+        with pytest.raises(sqlite3.OperationalError):
+            with db._con() as con:
+                con.execute("DELETE FROM attempts")
+    assert service.get_user_summary("ivy")["overall"]["attempts"] >= s["overall"]["attempts"]
+
+
+def test_consistency_snapshot_endpoints(fresh_db, monkeypatch, client):
+    _setup(fresh_db, monkeypatch)
+    assert client.get("/users/ivy/summary", params={"consistency": "snapshot"}).status_code == 503
+    snapshot.take_snapshot()
+    db.save_attempt(db.get_user_id("ivy"), "E1", {"score": 0.2, "correct": False}, "late")
+
+    live = client.get("/users/ivy/summary").json()
+    snap = client.get("/users/ivy/summary", params={"consistency": "snapshot"})
+    assert live["overall"]["attempts"] == 2 and snap.json()["overall"]["attempts"] == 1
+    assert client.get("/users/ivy/summary", params={"consistency": "snapshot"},
+                      headers={"If-None-Match": snap.headers["etag"]}).status_code == 304
+    assert len(client.get("/users/ivy/attempts", params={"consistency": "snapshot"}).json()) == 1
+    assert client.get("/exercises/E1/stats", params={"consistency": "snapshot"}).json()["attempts"] == 1
@@ -0,0 +1,25 @@
+# Cold start: importing the API must not pull in the heavy grading stack
+
+import json
+
+import pytest
+
+from mqth_q.startup import main, profile_imports
+
+
+def test_import_app_is_lazy():
+    prof = profile_imports("app")
+    assert prof["heavy_loaded"] == [], prof["heavy_loaded"]
+
+
+def test_budget_fails_the_cli(tmp_path):
+    out = tmp_path / "import_time.json"
+    assert main(["--runs", "1", "--top", "3", "--json", str(out), "--budget-ms", "10000"]) == 0
+    summary = json.loads(out.read_text())
+    assert summary["heavy_loaded"] == [] and 0 < summary["import_ms"] < 10000 and len(summary["top"]) == 3
+    assert main(["--runs", "1", "--top", "0", "--budget-ms", "0.001"]) == 1
+
+
+def test_failed_import_reports_stderr():
+    with pytest.raises(RuntimeError, match="ModuleNotFoundError"):
+        profile_imports("no_such_module_xyz")
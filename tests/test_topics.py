@@ -0,0 +1,35 @@
+# Batch topic classifier: seed similarity, incremental reclassification, manual labels kept
+
+import mqth_q.db as db
+from mqth_q.topics import classify, classify_pending
+
+SEEDS = {
+    "metric_spaces": ["metric space, cauchy sequence, convergence"],
+    "dynamic_optimization": ["bellman equation, dynamic programming, value function"],
+}
+
+
+def test_classify_by_seed_similarity():
+    topics, scores = classify(["Show every Cauchy sequence converges in this metric space.",
+                               "Write the Bellman equation for the value function."], SEEDS)
+    assert topics == ["metric_spaces", "dynamic_optimization"]
+    assert all(0 < s <= 1 for s in scores)
+
+
+def test_only_new_or_changed_rows_are_reclassified(fresh_db, quiet):
+    fresh_db([
+        ("A", "Is this metric space complete? Take a Cauchy sequence.", None),
+        ("B", "Solve the dynamic programming problem.", None),
+        ("C", "Bellman equation again.", "hand_label"),
+    ])
+
+    assert classify_pending(seeds=SEEDS, log=quiet)["classified"] == 2
+    assert classify_pending(seeds=SEEDS, log=quiet)["classified"] == 0
+
+    with db._con() as con:
+        con.execute("UPDATE questions SET question='Write the value function recursion (Bellman).' WHERE exercise_id='A'")
+    assert classify_pending(seeds=SEEDS, log=quiet) == {"rows": 3, "classified": 1, "changed": 1}
+
+    with db._con() as con:
+        got = dict(con.execute("SELECT exercise_id, topic_pred FROM questions").fetchall())
+    assert got == {"A": "dynamic_optimization", "B": "dynamic_optimization", "C": "hand_label"}
@@ -0,0 +1,131 @@
+# Span tracing: nested spans across service/db/grading, OTLP JSON lines, slow-request log
+
+import importlib, json, threading
+
+from fastapi.testclient import TestClient
+
+import mqth_q.grading as grading
+from mqth_q import service, tracing
+
+
+def _spans(path):
+    lines = [json.loads(l) for l in open(path, encoding="utf-8")]
+    return [s for rec in lines for s in rec["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+
+
+def _setup(tmp_path, monkeypatch, fresh_db, slow_ms=0.0):
+    monkeypatch.setattr(tracing, "TRACE_EXPORT", str(tmp_path / "traces.jsonl"))
+    monkeypatch.setattr(tracing, "TRACE_SLOW_MS", slow_ms)
+    monkeypatch.setattr(tracing, "TRACE_SLOW_LOG", str(tmp_path / "slow.jsonl"))
+    fresh_db([(f"E{i}", f"q{i}", f"solution number {i}", "optimization") for i in range(3)],
+             columns=("exercise_id", "question", "solution", "topic_pred"))
+
+
+def test_spans_nest_across_layers_and_export_as_otlp(tmp_path, monkeypatch, fresh_db):
+    _setup(tmp_path, monkeypatch, fresh_db)
+    seen_trace = []
+
+    def llm(question, solution, student, timeout=None, exercise_id=None):
+        seen_trace.append(tracing.current() is not None)       # pool thread inherited the context
+        return None
+
+    monkeypatch.setattr(grading, "llm_grade_and_feedback", llm)
+    assert tracing.current() is None
+    with tracing.trace("unit") as root:
+        service.submit_answers("tess", [("E0", "solution number 0"), ("E1", "nope")])
+        service.get_user_summary("tess")
+    assert seen_trace == [True, True]
+
+    assert tracing.flush()
+    spans = _spans(tmp_path / "traces.jsonl")
+    by_id = {s["spanId"]: s for s in spans}
+    names = {s["name"] for s in spans}
+    assert {"service.submit_answers", "db.fetch_questions", "grading.grade_best_batch",
+            "baseline.baseline_grade_batch", "db.save_attempts", "service.get_user_summary",
+            "history.load_history"} <= names
+    assert all(s["traceId"] == root.trace_id for s in spans)
+    parent = {s["name"]: by_id[s["parentSpanId"]]["name"] for s in spans if "parentSpanId" in s}
+    assert parent["service.submit_answers"] == "unit"
+    assert parent["grading.grade_best_batch"] == "service.submit_answers"
+    assert parent["baseline.baseline_grade_batch"] == "grading.grade_best_batch"
+    assert all(int(s["endTimeUnixNano"]) >= int(s["startTimeUnixNano"]) for s in spans)
+    assert not (tmp_path / "slow.jsonl").exists()                 # slow log is off
+
+
+def test_errors_are_recorded_and_no_spans_outside_a_trace(tmp_path, monkeypatch, fresh_db):
+    _setup(tmp_path, monkeypatch, fresh_db)
+    service.get_user_summary("outside")                             # not traced: nothing written
+    assert not (tmp_path / "traces.jsonl").exists()
+    try:
+        with tracing.trace("bad"):
+            service.exercise_stats("missing")
+    except ValueError:
+        pass
+    assert tracing.flush()
+    spans = _spans(tmp_path / "traces.jsonl")
+    status = {s["name"]: s["status"]["code"] for s in spans}
+    assert status["service.exercise_stats"] == 2 and status["db.get_exercise_stats"] == 1
+
+
+def test_slow_requests_log_their_span_tree(tmp_path, monkeypatch, fresh_db, tmp_db):
+    _setup(tmp_path, monkeypatch, fresh_db, slow_ms=0.001)
+    monkeypatch.setattr(tracing, "ENABLED", True)
+    import app
+    importlib.reload(app)                           # the middleware is installed at import when enabled
+    client = TestClient(app.app)
+    r = client.get("/questions/next", params={"username": "uma", "k": 2})
+    assert r.status_code == 200
+    assert tracing.flush()
+    slow = [json.loads(l) for l in open(tmp_path / "slow.jsonl", encoding="utf-8")]
+    entry = next(e for e in slow if e["trace_id"] == r.headers["x-trace-id"])
+    assert entry["name"] == "GET /questions/next" and entry["attrs"]["http.status_code"] == 200
+    child = entry["children"][0]
+    assert child["name"] == "service.next_questions_for" and child["ms"] <= entry["ms"]
+    names = {c["name"] for c in child["children"]}
+    assert {"service.recommend_ids", "service.question_cards"} <= names
+
+    def walk(t):
+        yield t["name"]
+        for c in t.get("children", []):
+            yield from walk(c)
+    assert "recommender.recommend_next" in set(walk(child))
+
+
+def test_streaming_trace_ends_after_the_body(tmp_path, monkeypatch, fresh_db, tmp_db):
+    _setup(tmp_path, monkeypatch, fresh_db, slow_ms=0.001)
+    monkeypatch.setattr(tracing, "ENABLED", True)
+    import app
+    importlib.reload(app)
+    client = TestClient(app.app)
+    r = client.post("/attempts/stream", json={"username": "ula", "exercise_id": "E0", "answer": "solution number 0"})
+    assert r.status_code == 200 and "event: result" in r.text
+    assert tracing.flush()
+    slow = [json.loads(l) for l in open(tmp_path / "slow.jsonl", encoding="utf-8")]
+    entry = next(e for e in slow if e["trace_id"] == r.headers["x-trace-id"])
+    names = [c["name"] for c in entry.get("children", [])]
+    assert "baseline.baseline_grade" in names and "db.save_attempt" in names   # graded inside the body
+    spans = _spans(tmp_path / "traces.jsonl")
+    assert {"baseline.baseline_grade", "db.save_attempt"} <= {s["name"] for s in spans
+                                                               if s["traceId"] == r.headers["x-trace-id"]}
+
+
+def test_finish_queues_the_write_and_closes_open_spans(tmp_path, monkeypatch, fresh_db):
+    _setup(tmp_path, monkeypatch, fresh_db)
+    gate = threading.Event()
+    write = tracing._write
+    monkeypatch.setattr(tracing, "_write", lambda *a: (gate.wait(5), write(*a)))
+
+    t = tracing.trace("root")
+    root = t.__enter__()
+    late = tracing.span("late")
+    late.__enter__()                               # e.g. a stream cut off mid-grade
+    t.finish()                                     # returns at once: the writer is blocked
+    assert not (tmp_path / "traces.jsonl").exists() and not tracing.flush(timeout=0.05)
+    late.__exit__(None, None, None)
+    t.detach()
+    gate.set()
+    assert tracing.flush()
+
+    spans = {s["name"]: s for s in _spans(tmp_path / "traces.jsonl")}
+    assert spans["late"]["endTimeUnixNano"] == spans["root"]["endTimeUnixNano"] == str(root.end_ns)
+    assert {"key": "unfinished", "value": {"boolValue": True}} in spans["late"]["attributes"]